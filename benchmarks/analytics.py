@@ -0,0 +1,92 @@
+"""
+Worked-hours analytics: the report behind /api/tasks/reports/analytics/.
+
+    python -m benchmarks.analytics [--tasks 1000000] [--runs 5]
+
+Loads ``--tasks`` completed tasks with random worked hours, spread over
+200 users, 5 admins and two years, into a scratch database, then times
+``worked_hours_report`` for a superadmin with each grouping, read from
+the live and archived tables as the endpoint does.
+"""
+import argparse
+import random
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from benchmarks.common import fresh_database, setup, summary, timings
+
+setup()
+
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from tasks.analytics import GROUPINGS, worked_hours_report  # noqa: E402
+from tasks.archive import with_archive  # noqa: E402
+from tasks.bulk import bulk_create_tasks  # noqa: E402
+from tasks.models import Task, User  # noqa: E402
+
+ADMINS = 5
+USERS = 200
+DAYS = 730
+BATCH_SIZE = 20000
+
+
+def create_users():
+    superadmin = User.objects.create_user('superadmin', 'pw', role='superadmin')
+    admins = [User.objects.create_user(f'admin{n}', 'pw', role='admin') for n in range(ADMINS)]
+    users = [
+        User.objects.create_user(f'user{n}', 'pw', assigned_admin=admins[n % ADMINS])
+        for n in range(USERS)
+    ]
+    return superadmin, users
+
+
+def load(count, users):
+    rng = random.Random(1)
+    for start in range(0, count, BATCH_SIZE):
+        tasks = []
+        for n in range(start, min(count, start + BATCH_SIZE)):
+            user = rng.choice(users)
+            tasks.append(Task(
+                title=f'Task {n}', description='Description', assigned_to=user,
+                created_by_id=user.assigned_admin_id, due_date=date(2030, 1, 1), status='completed',
+                completion_report='Done', worked_hours=Decimal(rng.randint(25, 1600)) / 100,
+            ))
+        bulk_create_tasks(tasks)
+    # Creation dates spread over the last two years, for the week grouping
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'UPDATE tasks_task SET created_at = %s, updated_at = %s',
+            [now - timedelta(days=DAYS), now],
+        )
+        cursor.execute(
+            "UPDATE tasks_task SET created_at = datetime(created_at, '+' || (id % %s) || ' days')",
+            [DAYS],
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=1_000_000)
+    parser.add_argument('--runs', type=int, default=5)
+    options = parser.parse_args()
+
+    fresh_database()
+    superadmin, users = create_users()
+    start = time.perf_counter()
+    load(options.tasks, users)
+    print(f'loaded {options.tasks} tasks in {time.perf_counter() - start:.1f}s')
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+
+    tasks = with_archive(lambda tasks: tasks.visible_to(superadmin), superadmin)
+    for group_by in GROUPINGS:
+        report = worked_hours_report(tasks, group_by)
+        seconds = timings(lambda: worked_hours_report(tasks, group_by), options.runs)
+        print(f'{group_by:8} {len(report["groups"]):5} groups  {summary(seconds)}')
+
+
+if __name__ == '__main__':
+    main()
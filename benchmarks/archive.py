@@ -0,0 +1,106 @@
+"""
+Live-table query latency before and after archiving old completed tasks.
+
+    python -m benchmarks.archive [--tasks 200000] [--live-share 0.1] [--runs 30]
+
+Loads ``--tasks`` tasks, all but ``--live-share`` of them completed more
+than 90 days ago, times the task list queries, archives the old ones
+with ``archive_tasks`` and times the same queries again.
+"""
+import argparse
+import time
+from datetime import date, timedelta
+
+from benchmarks.common import create_users, fresh_database, setup, summary, timings
+
+setup()
+
+from django.core.paginator import Paginator  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.utils import timezone  # noqa: E402
+
+from tasks.archive import archive_tasks  # noqa: E402
+from tasks.bulk import bulk_create_tasks  # noqa: E402
+from tasks.models import ArchivedTask, Task  # noqa: E402
+from tasks.search import get_search_backend  # noqa: E402
+
+USERS = 50
+BATCH_SIZE = 20000
+STATUSES = ('pending', 'in_progress', 'completed')
+
+
+def load(count, live, admin, users):
+    old = count - live
+    for start in range(0, count, BATCH_SIZE):
+        bulk_create_tasks([
+            Task(
+                title=f'Task {n} word{n % 997}', description='d' * 200, assigned_to=users[n % USERS],
+                created_by=admin, due_date=date(2030, 1, 1),
+                status='completed' if n < old else STATUSES[n % 3],
+                completion_report='Done' if n < old or STATUSES[n % 3] == 'completed' else None,
+                worked_hours=1,
+            )
+            for n in range(start, min(count, start + BATCH_SIZE))
+        ])
+    changed = timezone.now() - timedelta(days=200)
+    Task.objects.filter(id__lte=old).update(created_at=changed, updated_at=changed)
+
+
+def queries(superadmin, admin, users):
+    def page(tasks, number):
+        paginator = Paginator(tasks, 10)
+        return paginator.count, list(paginator.get_page(number))
+
+    admin_tasks = Task.objects.visible_to(admin).for_task_list()
+    return [
+        # Overdue by 2031: no index narrows it, so the whole table is scanned
+        ('open-task count', lambda: Task.objects.filter(
+            due_date__lt=date(2031, 1, 1)
+        ).exclude(status='completed').count()),
+        ('admin panel search, first page', lambda: list(
+            get_search_backend().search_tasks(admin_tasks, 'word17')[:10]
+        )),
+        ('superadmin task list, page 50', lambda: page(Task.objects.visible_to(superadmin).for_task_list(), 50)),
+        ('admin task list by status, page 3', lambda: page(admin_tasks.filter(status='pending'), 3)),
+        ("a user's pending tasks", lambda: list(Task.objects.assigned_list(users[7]).filter(status='pending')[:50])),
+    ]
+
+
+def measure(label, cases, runs):
+    connection.close()
+    for name, function in cases:
+        print(f'{label:7} {name:36} {summary(timings(function, runs))}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=200_000)
+    parser.add_argument('--live-share', type=float, default=0.1)
+    parser.add_argument('--runs', type=int, default=30)
+    options = parser.parse_args()
+
+    fresh_database()
+    superadmin, admin, users = create_users(USERS)
+    start = time.perf_counter()
+    load(options.tasks, int(options.tasks * options.live_share), admin, users)
+    print(f'loaded {options.tasks} tasks in {time.perf_counter() - start:.1f}s')
+    cases = queries(superadmin, admin, users)
+
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+    measure('before', cases, options.runs)
+
+    start = time.perf_counter()
+    archived = archive_tasks()
+    print(
+        f'archived {archived} tasks in {time.perf_counter() - start:.1f}s; '
+        f'{Task.objects.count()} live, {ArchivedTask.objects.count()} archived'
+    )
+    with connection.cursor() as cursor:
+        cursor.execute('ANALYZE')
+        cursor.execute('VACUUM')
+    measure('after', cases, options.runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Helpers shared by the benchmarks"""
+import os
+import statistics
+import time
+
+
+def setup():
+    """Configure Django with ``benchmarks.settings`` unless settings were given"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+    import django
+    django.setup()
+
+
+def fresh_database():
+    """Delete the scratch database and migrate a new one"""
+    from django.core.management import call_command
+    from django.db import connection
+
+    connection.close()
+    path = str(connection.settings_dict['NAME'])
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+    call_command('migrate', verbosity=0)
+
+
+def create_users(count):
+    """A superadmin, an admin and ``count`` users of that admin, all with password 'pw'"""
+    from tasks.models import User
+
+    superadmin = User.objects.create_user('superadmin', 'pw', role='superadmin')
+    admin = User.objects.create_user('admin', 'pw', role='admin')
+    users = [
+        User.objects.create_user(f'user{n}', 'pw', assigned_admin=admin, email=f'user{n}@example.com')
+        for n in range(count)
+    ]
+    return superadmin, admin, users
+
+
+def timings(function, runs):
+    """Seconds taken by each of ``runs`` calls of ``function``, after one warm-up call"""
+    function()
+    seconds = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def percentile(seconds, share):
+    ordered = sorted(seconds)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+def summary(seconds):
+    """Median and 95th percentile of ``seconds``, in milliseconds"""
+    return f'median {statistics.median(seconds) * 1e3:8.2f} ms  p95 {percentile(seconds, 0.95) * 1e3:8.2f} ms'
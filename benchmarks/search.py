@@ -0,0 +1,64 @@
+"""
+Admin panel search: FTS5 against the ``icontains`` scans it replaced.
+
+    python -m benchmarks.search [--tasks 1000000] [--runs 20]
+
+Loads ``--tasks`` tasks with four random words in their titles into a
+scratch database, then times the admin's task search, count and first
+page, with both backends.
+"""
+import argparse
+import random
+import time
+from datetime import date
+
+from benchmarks.common import create_users, fresh_database, setup, summary, timings
+
+setup()
+
+from tasks.bulk import bulk_create_tasks  # noqa: E402
+from tasks.models import Task  # noqa: E402
+from tasks.search import SearchBackend, get_search_backend  # noqa: E402
+
+WORDS = (
+    'alpha bravo charlie delta echo foxtrot golf hotel india juliet '
+    'kilo lima mike november oscar papa quebec romeo sierra tango'
+).split()
+QUERIES = ('tango', 'kilo rom', 'user4')
+BATCH_SIZE = 20000
+
+
+def load(count, admin, users):
+    rng = random.Random(1)
+    for start in range(0, count, BATCH_SIZE):
+        bulk_create_tasks([
+            Task(
+                title=f"{' '.join(rng.choices(WORDS, k=4))} {n}", description='Description',
+                assigned_to=rng.choice(users), created_by=admin, due_date=date(2030, 1, 1),
+            )
+            for n in range(start, min(count, start + BATCH_SIZE))
+        ])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=1_000_000)
+    parser.add_argument('--runs', type=int, default=20)
+    options = parser.parse_args()
+
+    fresh_database()
+    _, admin, users = create_users(50)
+    start = time.perf_counter()
+    load(options.tasks, admin, users)
+    print(f'loaded {options.tasks} tasks in {time.perf_counter() - start:.1f}s')
+
+    tasks = Task.objects.visible_to(admin).for_task_list()
+    for name, backend in (('icontains', SearchBackend()), ('fts5', get_search_backend())):
+        for query in QUERIES:
+            results = backend.search_tasks(tasks, query)
+            seconds = timings(lambda: (results.count(), list(results[:10])), options.runs)
+            print(f'{name:9} {query!r:12} {results.count():8} matches  {summary(seconds)}')
+
+
+if __name__ == '__main__':
+    main()
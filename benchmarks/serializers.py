@@ -0,0 +1,59 @@
+"""
+Task list serialization: ``TaskRowSerializer`` against ``TaskSerializer``.
+
+    python -m benchmarks.serializers [--tasks 10000] [--runs 5]
+
+Serializes one user's ``--tasks`` tasks to JSON bytes, query included,
+and reports the best of ``--runs`` runs in rows per second.
+"""
+import argparse
+from datetime import date
+from decimal import Decimal
+
+from benchmarks.common import create_users, fresh_database, setup, timings
+
+setup()
+
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from tasks.bulk import bulk_create_tasks  # noqa: E402
+from tasks.models import Task  # noqa: E402
+from tasks.renderers import FastJSONRenderer  # noqa: E402
+from tasks.serializers import TaskRowSerializer, TaskSerializer  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tasks', type=int, default=10000)
+    parser.add_argument('--runs', type=int, default=5)
+    options = parser.parse_args()
+
+    fresh_database()
+    _, admin, (user,) = create_users(1)
+    bulk_create_tasks([
+        Task(
+            title=f'Task {n}', description='d' * 200, assigned_to=user, created_by=admin,
+            due_date=date(2030, 1, 1), status='completed', completion_report='r' * 100,
+            worked_hours=Decimal('3.25'),
+        )
+        for n in range(options.tasks)
+    ])
+    tasks = Task.objects.filter(assigned_to=user).order_by('-created_at', '-id')
+
+    cases = [
+        ('TaskSerializer + JSONRenderer', lambda: JSONRenderer().render(
+            TaskSerializer(list(tasks.select_related('assigned_to', 'created_by')), many=True).data
+        )),
+        ('TaskRowSerializer + FastJSONRenderer', lambda: FastJSONRenderer().render(
+            TaskRowSerializer(list(TaskRowSerializer.queryset(tasks))).data
+        )),
+        ('  query only, model instances', lambda: list(tasks.select_related('assigned_to', 'created_by'))),
+        ('  query only, values()', lambda: list(TaskRowSerializer.queryset(tasks))),
+    ]
+    for label, function in cases:
+        seconds = min(timings(function, options.runs))
+        print(f'{label:38} {options.tasks / seconds:10,.0f} rows/s  ({seconds * 1e3:.0f} ms)')
+
+
+if __name__ == '__main__':
+    main()
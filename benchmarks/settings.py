@@ -0,0 +1,25 @@
+"""
+Settings for the benchmarks: the project's settings on a scratch database.
+
+``BENCH_DATABASE`` names the SQLite file, which the benchmarks delete and
+migrate again. ``BENCH_SQLITE_BACKEND=stock`` swaps ``tasks.backends.sqlite3``
+for Django's own backend.
+"""
+import os
+import tempfile
+
+from task_management.settings import *  # noqa: F401,F403
+from task_management.settings import DATABASES, MIDDLEWARE
+
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+# The profiler would time itself
+MIDDLEWARE = [name for name in MIDDLEWARE if name != 'tasks.profiling.ProfilingMiddleware']
+# Logins are part of the setup, not of what is measured
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+DATABASES['default']['NAME'] = os.environ.get(
+    'BENCH_DATABASE', os.path.join(tempfile.gettempdir(), 'task_benchmark.sqlite3')
+)
+if os.environ.get('BENCH_SQLITE_BACKEND') == 'stock':
+    DATABASES['default'] = {'ENGINE': 'django.db.backends.sqlite3', 'NAME': DATABASES['default']['NAME']}
@@ -0,0 +1,145 @@
+"""
+Mixed readers and writers on one SQLite file, stock backend against tuned.
+
+    python -m benchmarks.sqlite_concurrency [--backend both|stock|tuned]
+        [--readers 4] [--writers 4] [--seconds 10]
+
+Reader processes read a page of a random user's tasks; writer processes
+load a random task and save it in a transaction, as ``UpdateTaskView``
+does. Reports operations per second, errors and latency of each kind,
+with Django's sqlite3 backend ("stock") and ``tasks.backends.sqlite3``
+("tuned").
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import Counter
+from datetime import date
+
+from benchmarks.common import create_users, fresh_database, percentile, setup
+
+USERS = 20
+TASKS = 20000
+
+
+def load():
+    from django.db import connection
+
+    from tasks.bulk import bulk_create_tasks
+    from tasks.models import Task
+
+    _, admin, users = create_users(USERS)
+    bulk_create_tasks([
+        Task(
+            title=f'Task {n}', description='d' * 200, assigned_to=users[n % USERS],
+            created_by=admin, due_date=date(2030, 1, 1),
+        )
+        for n in range(TASKS)
+    ])
+    connection.close()
+    return [user.pk for user in users]
+
+
+def reader(seed, seconds, user_ids, results):
+    from tasks.models import Task
+
+    rng = random.Random(seed)
+    latencies, errors = [], Counter()
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            list(
+                Task.objects.filter(assigned_to_id=rng.choice(user_ids))
+                .order_by('-created_at', '-id').values('id', 'title', 'status')[:50]
+            )
+        except Exception as error:
+            errors[str(error)] += 1
+        latencies.append(time.perf_counter() - start)
+    results.put(('reads', latencies, errors))
+
+
+def writer(seed, seconds, task_ids, results):
+    from django.db import transaction
+
+    from tasks.models import Task
+
+    rng = random.Random(seed)
+    latencies, errors = [], Counter()
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        start = time.perf_counter()
+        try:
+            with transaction.atomic():
+                task = Task.objects.get(pk=rng.choice(task_ids))
+                task.status = rng.choice(['pending', 'in_progress'])
+                task.save()
+        except Exception as error:
+            errors[str(error)] += 1
+        latencies.append(time.perf_counter() - start)
+    results.put(('writes', latencies, errors))
+
+
+def run(backend, readers, writers, seconds):
+    os.environ['BENCH_SQLITE_BACKEND'] = backend
+    setup()
+    from tasks.models import Task
+
+    fresh_database()
+    user_ids = load()
+    task_ids = list(Task.objects.values_list('id', flat=True))
+
+    # Forked workers inherit the setup but open their own connections
+    context = multiprocessing.get_context('fork')
+    results = context.Queue()
+    workers = [
+        context.Process(target=reader, args=(n, seconds, user_ids, results)) for n in range(readers)
+    ] + [
+        context.Process(target=writer, args=(100 + n, seconds, task_ids, results)) for n in range(writers)
+    ]
+    for worker in workers:
+        worker.start()
+    outcomes = [results.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    for kind in ('reads', 'writes'):
+        latencies = [latency for name, times, _ in outcomes if name == kind for latency in times]
+        errors = sum((errors for name, _, errors in outcomes if name == kind), Counter())
+        if not latencies:
+            continue
+        done = len(latencies) - sum(errors.values())
+        print(
+            f'{backend:5} {kind:6} {done / seconds:8.0f} ops/s  errors {sum(errors.values()):6}  '
+            f'p50 {percentile(latencies, 0.5) * 1e3:7.1f} ms  p99 {percentile(latencies, 0.99) * 1e3:7.1f} ms'
+        )
+        for message, count in errors.most_common():
+            print(f'      {count:6} x {message}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--backend', choices=('both', 'stock', 'tuned'), default='both')
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=4)
+    parser.add_argument('--seconds', type=float, default=10)
+    options = parser.parse_args()
+
+    if options.backend != 'both':
+        run(options.backend, options.readers, options.writers, options.seconds)
+        return
+    # Settings are fixed once Django is set up, so each backend gets a process
+    for backend in ('stock', 'tuned'):
+        subprocess.run([
+            sys.executable, '-m', 'benchmarks.sqlite_concurrency', '--backend', backend,
+            '--readers', str(options.readers), '--writers', str(options.writers),
+            '--seconds', str(options.seconds),
+        ], check=True)
+
+
+if __name__ == '__main__':
+    main()
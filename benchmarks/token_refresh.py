@@ -0,0 +1,80 @@
+"""
+Refresh token throughput with and without the revocation store.
+
+    python -m benchmarks.token_refresh [--tokens 5000] [--rounds 2]
+
+Refreshes ``--tokens`` distinct refresh tokens through the refresh
+serializer, once checking and revoking them in a ``RevocationStore`` and
+once with a store that does nothing, and counts the queries of each run.
+Also times a revocation check of a token that was never revoked.
+"""
+import argparse
+import time
+from unittest import mock
+
+from benchmarks.common import create_users, fresh_database, setup
+
+setup()
+
+from django.core.cache import cache  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import CaptureQueriesContext  # noqa: E402
+
+from tasks.authentication import ClaimsRefreshToken  # noqa: E402
+from tasks.revocation import RevocationStore  # noqa: E402
+from tasks.serializers import ClaimsTokenRefreshSerializer  # noqa: E402
+
+CHECKS = 100_000
+
+
+class NoRevocationStore:
+    """Refresh as it was before rotated tokens were revoked"""
+
+    def is_revoked(self, jti):
+        return False
+
+    def revoke(self, jti, expires_at):
+        pass
+
+
+def refresh_all(tokens):
+    for token in tokens:
+        serializer = ClaimsTokenRefreshSerializer(data={'refresh': token})
+        serializer.is_valid(raise_exception=True)
+
+
+def measure(label, store, user, count):
+    tokens = [str(ClaimsRefreshToken.for_user(user)) for _ in range(count)]
+    cache.clear()
+    with mock.patch('tasks.authentication.get_revocation_store', lambda: store):
+        # Loads the bloom filter
+        refresh_all([str(ClaimsRefreshToken.for_user(user))])
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            refresh_all(tokens)
+            seconds = time.perf_counter() - start
+    print(f'{label:18} {count / seconds:8,.0f} refreshes/s  {len(queries):5} queries')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--tokens', type=int, default=5000)
+    parser.add_argument('--rounds', type=int, default=2)
+    options = parser.parse_args()
+
+    fresh_database()
+    _, _, (user,) = create_users(1)
+    for _ in range(options.rounds):
+        measure('without revocation', NoRevocationStore(), user, options.tokens)
+        measure('with revocation', RevocationStore(), user, options.tokens)
+
+    store = RevocationStore()
+    store.flush()
+    start = time.perf_counter()
+    for n in range(CHECKS):
+        store.is_revoked(f'never-revoked-{n}')
+    print(f'is_revoked of an unknown token: {(time.perf_counter() - start) / CHECKS * 1e6:.2f} us')
+
+
+if __name__ == '__main__':
+    main()
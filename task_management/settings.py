@@ -43,7 +43,11 @@ INSTALLED_APPS = [
 AUTH_USER_MODEL = 'tasks.User'
 
 MIDDLEWARE = [
+    'tasks.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'tasks.middleware.CompressionMiddleware',
+    'tasks.routers.ReplicaRoutingMiddleware',
+    'tasks.sharding.ShardRoutingMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,7 +60,8 @@ ROOT_URLCONF = 'task_management.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that reports rendering time to the profiler
+        'BACKEND': 'tasks.profiling.ProfiledDjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -74,11 +79,57 @@ WSGI_APPLICATION = 'task_management.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
+        # Django's sqlite3 backend in WAL mode with tuned pragmas, immediate
+        # transactions and retried writes; see tasks/backends/sqlite3/base.py
+        'ENGINE': 'tasks.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Each worker thread keeps its connection between requests
+        'CONN_MAX_AGE': 600,
     }
 }
 
+# Read replicas: comma separated database files kept in sync with the
+# primary, e.g. TASK_DB_REPLICAS=/srv/replica1.sqlite3,/srv/replica2.sqlite3.
+# Reads of GET requests go to one of them; tests read them from the primary
+READ_REPLICAS = []
+for index, name in enumerate(filter(None, os.environ.get('TASK_DB_REPLICAS', '').split(',')), 1):
+    alias = f'replica{index}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'NAME': name,
+        # Nothing is written to a replica, so its transactions needn't lock
+        'OPTIONS': {'transaction_mode': 'DEFERRED'},
+        'TEST': {'MIRROR': 'default'},
+    }
+    READ_REPLICAS.append(alias)
+
+# Task shards: comma separated database files tasks are spread over by
+# admin, e.g. TASK_DB_SHARDS=/srv/shard1.sqlite3,/srv/shard2.sqlite3. Users
+# and everything else stay in the default database; see tasks/sharding.py
+TASK_SHARDS = []
+for index, name in enumerate(filter(None, os.environ.get('TASK_DB_SHARDS', '').split(',')), 1):
+    alias = f'shard{index}'
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': name}
+    TASK_SHARDS.append(alias)
+
+# Aliases for the replica and shard tests in tasks/tests.py, which turn
+# them on with override_settings. Always defined, so any test runner
+# finds them, but only those tests use them, on test databases the runner
+# creates: the replica mirrors the default one, the shards are new. The
+# shards are in memory otherwise, so commands that open every database,
+# like makemigrations, leave no files behind
+DATABASES['test_replica'] = {
+    **DATABASES['default'],
+    'OPTIONS': {'transaction_mode': 'DEFERRED'},
+    'TEST': {'MIRROR': 'default'},
+}
+for alias in ('test_shard1', 'test_shard2'):
+    DATABASES[alias] = {**DATABASES['default'], 'NAME': ':memory:'}
+
+DATABASE_ROUTERS = ['tasks.sharding.ShardRouter', 'tasks.routers.ReplicaRouter']
+# Seconds a user or session keeps reading from the primary after writing
+READ_REPLICA_STICKY_SECONDS = 10
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -104,10 +155,35 @@ STATICFILES_DIRS = [BASE_DIR / 'static']
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache Configuration
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Reports of completed tasks; least recently read entries are evicted
+    # once MAX_ENTRIES is reached. Use a shared backend when several
+    # processes serve the API, so admin edits invalidate every copy
+    'task_reports': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'task-reports',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    # Token revocation markers, one per user whose claims changed, kept for
+    # the access token lifetime. They must never be evicted early, so they
+    # are kept apart from the other caches and MAX_ENTRIES is far above the
+    # number of users. Use a shared backend that does not evict when several
+    # processes serve the API
+    'auth_revocations': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'auth-revocations',
+        'OPTIONS': {'MAX_ENTRIES': 1_000_000},
+    },
+}
+
 # REST Framework Configuration
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'tasks.authentication.ClaimsJWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -119,6 +195,7 @@ SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
+    'TOKEN_REFRESH_SERIALIZER': 'tasks.serializers.ClaimsTokenRefreshSerializer',
 }
 
 LOGIN_URL = '/admin-panel/login/'
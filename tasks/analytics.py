@@ -0,0 +1,177 @@
+from datetime import date
+from operator import itemgetter
+
+import numpy as np
+from django.db import connections
+from django.db.models import CharField, Count, F, FloatField, Func, Q, Sum
+from django.db.models.functions import Cast
+
+PERCENTILES = (50, 90, 95, 99)
+HISTOGRAM_BINS = 10
+
+
+class WeekStart(Func):
+    """
+    Monday of the (UTC) week a datetime falls in, as a YYYY-MM-DD string.
+
+    Unlike TruncWeek this stays a built-in SQL function on SQLite instead
+    of a Python callback run once per row.
+    """
+    template = "TO_CHAR(DATE_TRUNC('week', %(expressions)s), 'YYYY-MM-DD')"
+    output_field = CharField()
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template="DATE(%(expressions)s, 'weekday 0', '-6 days')",
+            **extra_context,
+        )
+
+
+# group_by value -> (key expression, label lookup or None)
+GROUPINGS = {
+    'assignee': (F('assigned_to_id'), 'assigned_to__username'),
+    'admin': (F('created_by_id'), 'created_by__username'),
+    'week': (WeekStart('created_at'), None),
+    'status': (F('status'), None),
+}
+
+
+def _metrics(today):
+    completed = Q(status='completed')
+    return {
+        'total_tasks': Count('id'),
+        'completed_tasks': Count('id', filter=completed),
+        'overdue_tasks': Count('id', filter=Q(due_date__lt=today) & ~completed),
+        'reported_tasks': Count('worked_hours', filter=completed),
+        'total_hours': Sum(Cast('worked_hours', FloatField()), filter=completed),
+    }
+
+
+def _rates(row):
+    """Fill in the ratios derived from a row of counts and sums"""
+    total_hours = row['total_hours'] or 0.0
+    row['total_hours'] = round(total_hours, 2)
+    row['completion_rate'] = (
+        round(row['completed_tasks'] / row['total_tasks'], 4) if row['total_tasks'] else None
+    )
+    row['mean_hours'] = (
+        round(total_hours / row['reported_tasks'], 2) if row['reported_tasks'] else None
+    )
+    return row
+
+
+def _percentiles(sorted_hours, starts, counts):
+    """Linear-interpolated percentiles for every group of a grouped, sorted array"""
+    result = {}
+    for p in PERCENTILES:
+        position = starts + (counts - 1) * (p / 100)
+        low = np.floor(position).astype(np.int64)
+        high = np.ceil(position).astype(np.int64)
+        values = sorted_hours[low] + (sorted_hours[high] - sorted_hours[low]) * (position - low)
+        result[f'p{p}'] = np.round(values, 2)
+    return result
+
+
+def _querysets(tasks):
+    # Tasks read from every shard come as a FanOutList, and live and
+    # archived tasks as an ArchiveUnion, each holding querysets
+    if not hasattr(tasks, 'querysets'):
+        return [tasks]
+    return [queryset for part in tasks.querysets for queryset in _querysets(part)]
+
+
+def _grouped_metrics(tasks, key, fields):
+    """Metric rows per group key, added up over the shards ``tasks`` are read from"""
+    metrics = _metrics(date.today())
+    groups = {}
+    for queryset in _querysets(tasks):
+        rows = queryset.order_by().annotate(key=key).values(*fields).annotate(**metrics)
+        for row in rows:
+            group = groups.get(row['key'])
+            if group is None:
+                groups[row['key']] = row
+                continue
+            for name in metrics:
+                group[name] = (group[name] or 0) + (row[name] or 0)
+    return sorted(groups.values(), key=itemgetter('key'))
+
+
+def hours_distribution(tasks, key):
+    """
+    Worked-hours percentiles per group and a histogram over all groups.
+
+    Only (group key, hours) pairs are fetched, straight from the cursor as
+    every key is a plain column or string; the grouping, sorting and
+    interpolation all happen on NumPy arrays.
+    """
+    pairs = []
+    for queryset in _querysets(tasks):
+        rows = (
+            queryset.filter(status='completed', worked_hours__isnull=False)
+            .order_by()
+            .values_list(key, Cast('worked_hours', FloatField()))
+        )
+        sql, params = rows.query.sql_with_params()
+        with connections[rows.db].cursor() as cursor:
+            cursor.execute(sql, params)
+            pairs.extend(cursor.fetchall())
+    if not pairs:
+        return {}, None
+
+    # Number the groups in first-seen order; cheaper than np.unique on
+    # string keys and avoids transposing the rows with zip(*pairs)
+    index = {}
+    codes = np.fromiter(
+        (index.setdefault(value, len(index)) for value in map(itemgetter(0), pairs)),
+        dtype=np.int64, count=len(pairs),
+    )
+    hours = np.fromiter(map(itemgetter(1), pairs), dtype=np.float64, count=len(pairs))
+    group_keys = list(index)
+
+    order = np.lexsort((hours, codes))
+    sorted_hours = hours[order]
+    counts = np.bincount(codes, minlength=len(group_keys))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+
+    percentiles = _percentiles(sorted_hours, starts, counts)
+    by_group = {
+        group_key: {name: float(values[i]) for name, values in percentiles.items()}
+        for i, group_key in enumerate(group_keys)
+    }
+
+    overall = _percentiles(np.sort(hours), np.array([0]), np.array([len(hours)]))
+    histogram_counts, edges = np.histogram(hours, bins=HISTOGRAM_BINS)
+    summary = {
+        'percentiles': {name: float(values[0]) for name, values in overall.items()},
+        'histogram': {
+            'edges': np.round(edges, 2).tolist(),
+            'counts': histogram_counts.tolist(),
+        },
+    }
+    return by_group, summary
+
+
+def worked_hours_report(tasks, group_by):
+    """Totals, rates and worked-hours distribution of ``tasks`` grouped by ``group_by``"""
+    key, label = GROUPINGS[group_by]
+    fields = ['key', label] if label else ['key']
+
+    groups = _grouped_metrics(tasks, key, fields)
+    by_group, distribution = hours_distribution(tasks, key)
+
+    summary = {name: 0 for name in ('total_tasks', 'completed_tasks', 'overdue_tasks', 'reported_tasks')}
+    summary['total_hours'] = 0.0
+    for group in groups:
+        for name in summary:
+            summary[name] += group[name] or 0
+        if label:
+            group['label'] = group.pop(label)
+        _rates(group)
+        group.update(by_group.get(group['key']) or dict.fromkeys(f'p{p}' for p in PERCENTILES))
+
+    summary = _rates(summary)
+    if distribution:
+        summary.update(distribution)
+
+    return {'group_by': group_by, 'summary': summary, 'groups': groups}
@@ -9,7 +9,14 @@ urlpatterns = [
     
     # Tasks - Using APIView
     path('tasks/', api_views.UserTasksView.as_view(), name='get_user_tasks'),
+    path('tasks/bulk/', api_views.BulkTasksView.as_view(), name='bulk_tasks'),
+    path('tasks/changes/', api_views.TaskChangesView.as_view(), name='task_changes'),
+    path('tasks/events/', api_views.TaskEventsView.as_view(), name='task_events'),
     path('tasks/<int:task_id>/', api_views.UpdateTaskView.as_view(), name='update_task'),
     path('tasks/<int:task_id>/report/', api_views.TaskReportView.as_view(), name='task_report'),
+    path('tasks/reports/analytics/', api_views.TaskAnalyticsView.as_view(), name='task_analytics'),
+    path('tasks/reports/export/<str:export_format>/', api_views.ExportTaskReportsView.as_view(), name='api_export_task_reports'),
+    path('profiling/', api_views.ProfilingReportView.as_view(), name='profiling_report'),
+    path('profiling/metrics/', api_views.ProfilingMetricsView.as_view(), name='profiling_metrics'),
     
 ]
\ No newline at end of file
@@ -1,13 +1,35 @@
-from rest_framework import status, generics, permissions
+from rest_framework import exceptions, status, generics, permissions
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404, HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from django.utils.dateparse import parse_date
+from .analytics import GROUPINGS, worked_hours_report
+from .archive import get_report_row, get_report_task, with_archive
+from .authentication import ClaimsJWTAuthentication, ClaimsRefreshToken
+from .bulk import bulk_create_tasks, bulk_update_tasks
+from .changes import WatermarkExpired, task_changes
+from .conditional import make_etag, not_modified, queryset_validators, set_validators
+from .events import event_stream, get_event_broker
+from .exports import EXPORT_FORMATS, export_queryset, streaming_export
 from .models import User, Task
+from .pagination import TaskCursorPagination
+from .profiling import profile_report, prometheus_metrics, timed
+from .renderers import FastJSONRenderer
+from .routers import use_primary
+from .reports import REPORT_FIELDS, cache_report, cached_report
 from .serializers import (
-    UserSerializer, LoginSerializer, TaskSerializer, 
-    TaskUpdateSerializer, TaskReportSerializer
+    UserSerializer, LoginSerializer, TaskSerializer, TaskRowSerializer, TaskBulkCreateSerializer,
+    TaskUpdateSerializer, TaskBulkUpdateSerializer, TaskReportSerializer
 )
+from .sharding import task_shard
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework_simplejwt.views import TokenRefreshView
 
@@ -20,6 +42,65 @@ class IsAdminOrSuperAdmin(permissions.BasePermission):
         return request.user.is_authenticated and (request.user.is_admin() or request.user.is_superadmin())
 
 
+class IsSuperAdmin(permissions.BasePermission):
+    """
+    Custom permission to only allow superadmins.
+    """
+    def has_permission(self, request, view):
+        return request.user.is_authenticated and request.user.is_superadmin()
+
+
+class AsyncAPIView(View):
+    """
+    Base for async API views: JWT authentication, permission classes and JSON
+    rendering like APIView, without tying up a thread while a request waits.
+    Handlers receive a DRF Request, so request.data and query_params work as usual
+    """
+    authentication_class = ClaimsJWTAuthentication
+    permission_classes = [IsAuthenticated]
+    renderer = JSONRenderer()
+    
+    @classmethod
+    def as_view(cls, **initkwargs):
+        # Token authentication needs no CSRF protection, as with APIView
+        return csrf_exempt(super().as_view(**initkwargs))
+    
+    async def dispatch(self, request, *args, **kwargs):
+        request = Request(request, parsers=[parser() for parser in api_settings.DEFAULT_PARSER_CLASSES])
+        self.request = request
+        try:
+            request.user = await self.authenticate(request) or AnonymousUser()
+            self.check_permissions(request)
+            # Handlers raise ParseError or UnsupportedMediaType from request.data
+            return await super().dispatch(request, *args, **kwargs)
+        except APIException as e:
+            return self.error_response(e)
+    
+    async def authenticate(self, request):
+        authenticated = await self.authentication_class().aauthenticate(request)
+        return authenticated[0] if authenticated else None
+    
+    def check_permissions(self, request):
+        # The permissions used here only look at the user built from the token
+        for permission_class in self.permission_classes:
+            if not permission_class().has_permission(request, self):
+                if not request.user.is_authenticated:
+                    raise exceptions.NotAuthenticated()
+                raise exceptions.PermissionDenied()
+    
+    def respond(self, data, status=status.HTTP_200_OK):
+        with timed('serialize'):
+            content = self.renderer.render(data)
+        return HttpResponse(content, status=status, content_type=self.renderer.media_type)
+    
+    def error_response(self, exc):
+        detail = exc.detail if isinstance(exc.detail, dict) else {'detail': exc.detail}
+        response = self.respond(detail, status=exc.status_code)
+        if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+            response['WWW-Authenticate'] = self.authentication_class().authenticate_header(self.request)
+        return response
+
+
 class LoginView(APIView):
     """
     POST /api/login/ - JWT Authentication endpoint
@@ -31,7 +112,7 @@ class LoginView(APIView):
         serializer = LoginSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.validated_data['user']
-            refresh = RefreshToken.for_user(user)
+            refresh = ClaimsRefreshToken.for_user(user)
             
             return Response({
                 'refresh': str(refresh),
@@ -43,14 +124,97 @@ class LoginView(APIView):
 
 class UserTasksView(APIView):
     """
-    GET /api/tasks - Fetch all tasks assigned to the logged-in user
+    GET /api/tasks - Fetch tasks assigned to the logged-in user, newest first
+    Paginated with an opaque ?cursor= token; page length set with ?page_size=
+    ?fields= or ?exclude= (comma separated) limit the task fields returned
     """
     permission_classes = [IsAuthenticated]
+    pagination_class = TaskCursorPagination
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
     
     def get(self, request):
         tasks = Task.objects.filter(assigned_to=request.user)
-        serializer = TaskSerializer(tasks, many=True)
-        return Response(serializer.data)
+        try:
+            fields = TaskRowSerializer.select_fields(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Polling clients send the ETag back and get a 304 from one aggregate query.
+        # The list names each task's creator, whose rename has to change the ETag
+        shows_creator = fields is None or 'created_by_name' in fields
+        etag = queryset_validators(
+            tasks, request.user.username, request.get_full_path(), request.accepted_media_type,
+            related=('created_by__username',) if shows_creator else (),
+        )
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        
+        paginator = self.pagination_class()
+        page = paginator.paginate_queryset(TaskRowSerializer.queryset(tasks, fields), request, view=self)
+        serializer = TaskRowSerializer(page, fields)
+        return set_validators(paginator.get_paginated_response(serializer.data), etag)
+
+
+class TaskChangesView(APIView):
+    """
+    GET /api/tasks/changes - Tasks of the logged-in user changed or removed since ?since=
+    Returns the changed tasks, the ids of deleted or reassigned ones and a new
+    watermark to pass as ?since= next time; without ?since= every task is returned
+    Takes ?fields= and ?exclude= like GET /api/tasks
+    """
+    permission_classes = [IsAuthenticated]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
+    
+    def get(self, request):
+        try:
+            fields = TaskRowSerializer.select_fields(request.query_params)
+            # A watermark taken on a lagging replica would skip the
+            # changes it hadn't received yet
+            with use_primary():
+                changed, deleted, watermark, has_more = task_changes(
+                    request.user, request.query_params.get('since'), fields=fields
+                )
+        except WatermarkExpired:
+            return Response(
+                {'error': 'Watermark has expired, fetch all tasks again without ?since='}, 
+                status=status.HTTP_410_GONE
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response({
+            'changed': TaskRowSerializer(changed, fields).data,
+            'deleted': deleted,
+            'watermark': watermark,
+            'has_more': has_more,
+        })
+
+
+class TaskEventsView(AsyncAPIView):
+    """
+    GET /api/tasks/events - Server-Sent Events stream of changes to the logged-in user's tasks
+    Pushes task.created, task.updated, task.status_changed and task.deleted events
+    to the assignee and the admin who created the task. Async, so it should be served
+    through ASGI; EventSource clients that can't send headers may pass ?token=
+    """
+    
+    async def authenticate(self, request):
+        authenticator = self.authentication_class()
+        token = request.query_params.get('token')
+        if token and not authenticator.get_header(request):
+            return await authenticator.aget_user(authenticator.get_validated_token(token))
+        return await super().authenticate(request)
+    
+    async def get(self, request):
+        broker = get_event_broker()
+        subscription = broker.subscribe(request.user.pk)
+        response = StreamingHttpResponse(
+            event_stream(broker, subscription), content_type='text/event-stream'
+        )
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
 
 
 class UpdateTaskView(APIView):
@@ -60,7 +224,9 @@ class UpdateTaskView(APIView):
     permission_classes = [IsAuthenticated]
     
     def get_object(self, task_id, user):
-        return get_object_or_404(Task, id=task_id, assigned_to=user)
+        # The response names the assignee and the creator
+        tasks = Task.objects.select_related('assigned_to', 'created_by')
+        return get_object_or_404(tasks, id=task_id, assigned_to=user)
     
     def put(self, request, task_id):
         task = self.get_object(task_id, request.user)
@@ -79,20 +245,144 @@ class UpdateTaskView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class BulkTasksView(APIView):
+    """
+    POST /api/tasks/bulk - Create many tasks at once (admins and superadmins)
+    PATCH /api/tasks/bulk - Update status of many of the logged-in user's tasks
+    
+    Both accept a JSON list. Every item is validated first; if any item is
+    invalid nothing is written and the errors are returned by item index.
+    """
+    max_items = 5000
+    
+    def get_permissions(self):
+        if self.request.method == 'POST':
+            return [IsAdminOrSuperAdmin()]
+        return [IsAuthenticated()]
+    
+    def get_items(self, request):
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return None, Response(
+                {'error': 'Expected a non-empty list of tasks'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > self.max_items:
+            return None, Response(
+                {'error': f'At most {self.max_items} tasks can be sent at once'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return items, None
+    
+    def get_assignees(self, request, items):
+        # Same assignee rules as the admin panel task form
+        ids = set()
+        for item in items:
+            try:
+                ids.add(int(item.get('assigned_to')))
+            except (AttributeError, TypeError, ValueError):
+                pass
+        
+        if request.user.is_superadmin():
+            assignees = User.objects.filter(role='user')
+        else:
+            assignees = User.objects.filter(assigned_admin=request.user)
+        return {user.pk: user for user in assignees.filter(pk__in=ids)}
+    
+    def item_errors(self, serializer):
+        return Response(
+            {'errors': [
+                {'index': index, 'errors': errors}
+                for index, errors in enumerate(serializer.errors) if errors
+            ]},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    
+    def post(self, request):
+        items, error = self.get_items(request)
+        if error:
+            return error
+        
+        serializer = TaskBulkCreateSerializer(
+            data=items, many=True,
+            context={'assignees': self.get_assignees(request, items)}
+        )
+        if not serializer.is_valid():
+            return self.item_errors(serializer)
+        
+        created = bulk_create_tasks([
+            Task(created_by=request.user, **attrs) for attrs in serializer.validated_data
+        ])
+        return Response(TaskSerializer(created, many=True).data, status=status.HTTP_201_CREATED)
+    
+    def patch(self, request):
+        items, error = self.get_items(request)
+        if error:
+            return error
+        
+        ids = [item.get('id') for item in items if isinstance(item, dict)]
+        tasks_by_id = (
+            Task.objects.filter(assigned_to=request.user)
+            .select_related('assigned_to', 'created_by')
+            # Other ids fail validation: the id field takes JSON integers only
+            .in_bulk([pk for pk in ids if type(pk) is int])
+        )
+        serializer = TaskBulkUpdateSerializer(
+            data=items, many=True, context={'tasks': tasks_by_id}
+        )
+        if not serializer.is_valid():
+            return self.item_errors(serializer)
+        
+        tasks, fields = {}, set()
+        for attrs in serializer.validated_data:
+            task = tasks_by_id[attrs.pop('id')]
+            if task.pk in tasks:
+                return Response(
+                    {'error': f'Task {task.pk} appears more than once'}, 
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            for field, value in attrs.items():
+                setattr(task, field, value)
+                fields.add(field)
+            tasks[task.pk] = task
+        
+        if fields:
+            bulk_update_tasks(list(tasks.values()), sorted(fields))
+        return Response(TaskSerializer(tasks.values(), many=True).data)
+
+
 class TaskReportView(APIView):
     """
     GET /api/tasks/{id}/report - View completion report for admins and superadmins
     """
     permission_classes = [IsAdminOrSuperAdmin]
     
-    def get_object(self, task_id):
-        return get_object_or_404(Task, id=task_id)
+    # Reports are cached until their task changes, so they are built from
+    # the primary rather than a replica that may not have the change yet
+    def get_object(self, task_id, using=None):
+        with use_primary():
+            task = get_report_task(task_id, using)
+        if task is None:
+            raise Http404
+        return task
+    
+    def get_validators(self, task_id, using=None):
+        # Everything the checks and the validators need, in one query per table
+        with use_primary():
+            row = get_report_row(task_id, REPORT_FIELDS, using)
+        if row is None:
+            raise Http404
+        return row
     
     def get(self, request, task_id):
-        task = self.get_object(task_id)
+        # Reports of completed tasks are cached together with the row,
+        # so a cache hit makes no query at all
+        report = cached_report(task_id)
+        shard = None if report else task_shard(request.user, task_id)
+        row = report or self.get_validators(task_id, shard)
         
         # Check if task is completed
-        if task.status != 'completed':
+        if row['status'] != 'completed':
             return Response(
                 {'error': 'Task report is only available for completed tasks'}, 
                 status=status.HTTP_400_BAD_REQUEST
@@ -100,17 +390,95 @@ class TaskReportView(APIView):
         
         # Check permissions - admin can only see tasks they created or assigned to their users
         if request.user.is_admin():
-            if task.created_by != request.user and task.assigned_to.assigned_admin != request.user:
+            if request.user.pk not in (row['created_by_id'], row['assigned_to__assigned_admin_id']):
                 return Response(
                     {'error': 'You do not have permission to view this task report'}, 
                     status=status.HTTP_403_FORBIDDEN
                 )
         
-        serializer = TaskReportSerializer(task)
-        return Response(serializer.data)
+        etag = make_etag(
+            task_id, row['updated_at'], row['assigned_to__username'], row['assigned_to__email'],
+            request.accepted_media_type,
+        )
+        response = not_modified(request, etag, row['updated_at'])
+        if response is not None:
+            return response
+        
+        if report is None:
+            report = cache_report(task_id, row, TaskReportSerializer(self.get_object(task_id, shard)).data)
+        return set_validators(Response(report['data']), etag, row['updated_at'])
+
+
+class ExportTaskReportsView(APIView):
+    """
+    GET /api/tasks/reports/export/{csv|ndjson} - Stream task reports for admins and superadmins
+    Optional filters: ?status= (default completed), ?from= and ?to= dates
+    """
+    permission_classes = [IsAdminOrSuperAdmin]
     
+    def get(self, request, export_format):
+        if export_format not in EXPORT_FORMATS:
+            return Response(
+                {'error': 'Export format must be csv or ndjson'}, 
+                status=status.HTTP_404_NOT_FOUND
+            )
+        
+        try:
+            rows = export_queryset(request.user, request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return streaming_export(rows, export_format)
+
+
+class TaskAnalyticsView(APIView):
+    """
+    GET /api/tasks/reports/analytics - Worked hours and completion statistics for admins and superadmins
+    ?group_by= assignee, admin, week or status; optional ?from= and ?to= creation dates
+    """
+    permission_classes = [IsAdminOrSuperAdmin]
+    
+    def get(self, request):
+        group_by = request.query_params.get('group_by', 'assignee')
+        if group_by not in GROUPINGS:
+            return Response(
+                {'error': f'group_by must be one of: {", ".join(GROUPINGS)}'}, 
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        filters = {}
+        for param, lookup in (('from', 'created_at__date__gte'), ('to', 'created_at__date__lte')):
+            value = request.query_params.get(param)
+            if value:
+                day = parse_date(value)
+                if day is None:
+                    return Response(
+                        {'error': f'"{param}" must be a date formatted as YYYY-MM-DD'}, 
+                        status=status.HTTP_400_BAD_REQUEST
+                    )
+                filters[lookup] = day
+        
+        # Archived tasks are completed tasks all the same
+        tasks = with_archive(lambda tasks: tasks.visible_to(request.user).filter(**filters), request.user)
+        return Response(worked_hours_report(tasks, group_by))
 
 
+class ProfilingReportView(APIView):
+    """
+    GET /api/profiling - Latency, query count, SQL, serialization and template
+    time percentiles per URL name, recorded by this server process (superadmins only)
+    """
+    permission_classes = [IsSuperAdmin]
+    
+    def get(self, request):
+        return Response({'views': profile_report()})
 
 
-  
\ No newline at end of file
+class ProfilingMetricsView(APIView):
+    """
+    GET /api/profiling/metrics - The same histograms in the Prometheus text format (superadmins only)
+    """
+    permission_classes = [IsSuperAdmin]
+    
+    def get(self, request):
+        return HttpResponse(prometheus_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -2,4 +2,7 @@ from django.apps import AppConfig
 
 class TasksConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'tasks'
\ No newline at end of file
+    name = 'tasks'
+
+    def ready(self):
+        from . import signals  # noqa: F401
\ No newline at end of file
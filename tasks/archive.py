@@ -0,0 +1,185 @@
+"""
+Hot/cold storage of completed tasks.
+
+``archive_tasks`` moves completed tasks that haven't changed for
+``TASK_ARCHIVE_AFTER_DAYS`` from the Task table to ArchivedTask, in the
+same database or shard. The live table, its indexes and the counts the
+admin pages run over it then only hold tasks still in use. Report pages,
+report exports and analytics read both tables.
+
+Rows are moved with raw SQL and no model signals: an archived task still
+counts in TaskCounter, keeps its search index row and its cached report,
+and is not a deletion for delta sync clients, who keep the copy they
+have. Task lists and delta sync only return live tasks.
+"""
+from datetime import timedelta
+from itertools import chain
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Value
+from django.utils import timezone
+
+from .models import ArchivedTask, Task
+from .sharding import FanOutList, task_databases, user_databases
+
+ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_BATCH_SIZE = 500
+
+
+def archive_after():
+    return timedelta(days=getattr(settings, 'TASK_ARCHIVE_AFTER_DAYS', ARCHIVE_AFTER_DAYS))
+
+
+def _move_rows(source, target, task_ids, using, archived_at=None):
+    """Copy ``task_ids`` from the ``source`` model's table to ``target``'s and delete them"""
+    connection = connections[using]
+    quote = connection.ops.quote_name
+    columns = [quote(field.column) for field in Task._meta.concrete_fields]
+    values, params = list(columns), []
+    if archived_at is not None:
+        columns.append(quote(ArchivedTask._meta.get_field('archived_at').column))
+        values.append('%s')
+        params.append(connection.ops.adapt_datetimefield_value(archived_at))
+    placeholders = ', '.join(['%s'] * len(task_ids))
+    source_table, target_table = quote(source._meta.db_table), quote(target._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {target_table} ({", ".join(columns)}) '
+            f'SELECT {", ".join(values)} FROM {source_table} WHERE id IN ({placeholders})',
+            params + task_ids,
+        )
+        cursor.execute(f'DELETE FROM {source_table} WHERE id IN ({placeholders})', task_ids)
+
+
+def archivable_tasks(using, cutoff):
+    """Completed tasks in ``using`` last changed before ``cutoff``"""
+    return Task.objects.using(using).filter(status='completed', updated_at__lt=cutoff)
+
+
+def archive_tasks(older_than=None, batch_size=ARCHIVE_BATCH_SIZE, databases=None):
+    """
+    Move completed tasks last changed more than ``older_than`` ago to the
+    archive, one transaction per batch so writers are never held up for
+    long. Returns how many were archived.
+    """
+    cutoff = timezone.now() - (older_than if older_than is not None else archive_after())
+    archived = 0
+    for alias in databases or task_databases():
+        last_id = 0
+        while True:
+            with transaction.atomic(using=alias):
+                # Keyset on id, so each batch starts where the last one ended
+                batch = list(
+                    archivable_tasks(alias, cutoff).filter(id__gt=last_id)
+                    .order_by('id').values_list('id', flat=True)[:batch_size]
+                )
+                if not batch:
+                    break
+                _move_rows(Task, ArchivedTask, batch, alias, archived_at=timezone.now())
+            archived += len(batch)
+            last_id = batch[-1]
+    return archived
+
+
+def restore_tasks(task_ids=None, batch_size=ARCHIVE_BATCH_SIZE, databases=None):
+    """
+    Move archived tasks back to the live table: those in ``task_ids``, or
+    every one when it is None. Returns how many were restored.
+    """
+    restored = 0
+    for alias in databases or task_databases():
+        archived = ArchivedTask.objects.using(alias).order_by('id')
+        if task_ids is not None:
+            archived = archived.filter(id__in=task_ids)
+        last_id = 0
+        while True:
+            with transaction.atomic(using=alias):
+                batch = list(archived.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size])
+                if not batch:
+                    break
+                _move_rows(ArchivedTask, Task, batch, alias)
+            restored += len(batch)
+            last_id = batch[-1]
+    return restored
+
+
+class ArchiveUnion:
+    """
+    The live and the archived tasks of one database, read as one list in
+    the ordering of ``live``.
+
+    Supports what Paginator needs, in SQL: count() adds up both tables,
+    and a slice runs as a UNION ALL of the columns it is ordered by with
+    the OFFSET and LIMIT pushed down, then loads the rows of the page from
+    their own table. iterator() reads the two tables one after the other.
+    """
+    ordered = True
+
+    def __init__(self, live, archived):
+        self.querysets = [live, archived]
+        # Read by FanOutList when tasks are merged over shards
+        self.query, self.model = live.query, live.model
+        ordering = list(live.query.order_by or live.model._meta.ordering)
+        # The id breaks ties, so rows with an equal sort key keep their page
+        self.ordering = ordering + ['-id']
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        columns = [field.lstrip('-') for field in self.ordering]
+        live, archived = (
+            queryset.order_by().annotate(archived=Value(model is ArchivedTask)).values(*columns, 'archived')
+            for model, queryset in zip((Task, ArchivedTask), self.querysets)
+        )
+        keys = list(live.union(archived, all=True).order_by(*self.ordering)[key])
+        rows = {}
+        # Only the tables holding rows of the slice are read
+        for in_archive, queryset in enumerate(self.querysets):
+            task_ids = [row['id'] for row in keys if row['archived'] == in_archive]
+            if task_ids:
+                rows.update((task.id, task) for task in queryset.filter(id__in=task_ids))
+        return [rows[row['id']] for row in keys]
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def iterator(self, chunk_size=None):
+        return chain.from_iterable(queryset.iterator(chunk_size=chunk_size) for queryset in self.querysets)
+
+
+def with_archive(build, user):
+    """
+    ``build(manager)`` applied to the live and the archived tasks ``user``
+    may read, as one list in the order of the queryset it returns: an
+    ArchiveUnion of one database, or a FanOutList of those over shards.
+    """
+    unions = [
+        ArchiveUnion(build(Task.objects).using(alias), build(ArchivedTask.objects).using(alias))
+        for alias in user_databases(user)
+    ]
+    return unions[0] if len(unions) == 1 else FanOutList(unions)
+
+
+def get_report_row(task_id, fields, using=None):
+    """``fields`` of task ``task_id``, live or archived, or None"""
+    for model in (Task, ArchivedTask):
+        row = model.objects.using(using).filter(id=task_id).values(*fields).first()
+        if row is not None:
+            return row
+    return None
+
+
+def get_report_task(task_id, using=None):
+    """Task ``task_id`` with its assignee, live or archived, or None"""
+    for model in (Task, ArchivedTask):
+        task = model.objects.using(using).select_related('assigned_to').filter(id=task_id).first()
+        if task is not None:
+            return task
+    return None
@@ -0,0 +1,184 @@
+import time
+
+from django.core.cache import cache, caches
+from django.db import router
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .models import User
+from .revocation import get_revocation_store
+from .routers import use_primary
+
+AUTH_USER_CACHE_TIMEOUT = 60
+# Cache of the revocation markers, which must not be evicted before they
+# expire: a lost marker would let older tokens keep their stale claims
+REVOCATION_CACHE = 'auth_revocations'
+
+# Token claim -> User attribute it carries
+USER_CLAIMS = {
+    'username': 'username',
+    'role': 'role',
+    'assigned_admin': 'assigned_admin_id',
+}
+
+# Stored values a request user is built from; a change to any of them
+# revokes the claims of tokens already issued
+TOKEN_USER_FIELDS = ('username', 'role', 'assigned_admin_id', 'is_active')
+
+
+def _user_key(user_id):
+    return f'auth_user:{user_id}'
+
+
+def _revoked_key(user_id):
+    return f'auth_revoked:{user_id}'
+
+
+def token_user_values(user):
+    return {field: getattr(user, field) for field in TOKEN_USER_FIELDS}
+
+
+def user_from_values(user_id, values):
+    """
+    A User built from ``values`` without a query.
+
+    It is loaded like ``User.objects.only(...)``: any other field is
+    fetched from the database the first time it is read.
+    """
+    values = {'id': user_id, **values}
+    # from_db() expects the values in model field order
+    fields = [field.attname for field in User._meta.concrete_fields if field.attname in values]
+    return User.from_db(router.db_for_read(User), fields, [values[field] for field in fields])
+
+
+def add_user_claims(token, user):
+    for claim, field in USER_CLAIMS.items():
+        token[claim] = getattr(user, field)
+
+
+def _active_user(user_id, values):
+    if values is None:
+        raise AuthenticationFailed('User not found', code='user_not_found')
+    if not values['is_active']:
+        raise AuthenticationFailed('User is inactive', code='user_inactive')
+    return user_from_values(user_id, values)
+
+
+def load_user(user_id):
+    """Stored values of an active user, cached for ``AUTH_USER_CACHE_TIMEOUT``"""
+    values = cache.get(_user_key(user_id))
+    if values is None:
+        # A replica could still see a user who was just deactivated
+        with use_primary():
+            values = User.objects.filter(pk=user_id).values(*TOKEN_USER_FIELDS).first()
+        if values is not None:
+            cache.set(_user_key(user_id), values, AUTH_USER_CACHE_TIMEOUT)
+    return _active_user(user_id, values)
+
+
+async def aload_user(user_id):
+    values = await cache.aget(_user_key(user_id))
+    if values is None:
+        with use_primary():
+            values = await User.objects.filter(pk=user_id).values(*TOKEN_USER_FIELDS).afirst()
+        if values is not None:
+            await cache.aset(_user_key(user_id), values, AUTH_USER_CACHE_TIMEOUT)
+    return _active_user(user_id, values)
+
+
+def revoke_user_tokens(user_id):
+    """Make tokens issued so far for ``user_id`` reload the user from the database"""
+    caches[REVOCATION_CACHE].set(
+        _revoked_key(user_id),
+        int(time.time()),
+        int(api_settings.ACCESS_TOKEN_LIFETIME.total_seconds()),
+    )
+    cache.delete(_user_key(user_id))
+
+
+def _revoked_since(revoked_at, token):
+    return revoked_at is not None and token.get('iat', 0) <= revoked_at
+
+
+def claims_revoked(user_id, token):
+    return _revoked_since(caches[REVOCATION_CACHE].get(_revoked_key(user_id)), token)
+
+
+async def aclaims_revoked(user_id, token):
+    return _revoked_since(await caches[REVOCATION_CACHE].aget(_revoked_key(user_id)), token)
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    Refresh token whose access tokens carry the user's role and admin.
+
+    A token replaced by rotation is revoked and can't be used again.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        add_user_claims(token, user)
+        return token
+
+    def verify(self):
+        super().verify()
+        if get_revocation_store().is_revoked(self[api_settings.JTI_CLAIM]):
+            raise TokenError('Token is revoked')
+
+    def revoke(self):
+        get_revocation_store().revoke(self[api_settings.JTI_CLAIM], datetime_from_epoch(self['exp']))
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    """
+    JWT authentication that builds ``request.user`` from the token claims.
+
+    The user is only loaded from the database (through a short-lived
+    cache) for tokens without the claims, or whose claims were revoked
+    because the user was changed, deactivated or deleted after the token
+    was issued. Revocations are kept in the Django cache, which has to be
+    shared between processes when more than one serves the API.
+    """
+
+    def get_user_id(self, validated_token):
+        try:
+            return validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Token contained no recognizable user identification')
+
+    def claims_user(self, user_id, validated_token):
+        """The user the token's claims describe, or None if it has none"""
+        if any(claim not in validated_token for claim in USER_CLAIMS):
+            return None
+        values = {field: validated_token[claim] for claim, field in USER_CLAIMS.items()}
+        values['is_active'] = True
+        return user_from_values(user_id, values)
+
+    def get_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        user = self.claims_user(user_id, validated_token)
+        if user is None or claims_revoked(user_id, validated_token):
+            return load_user(user_id)
+        return user
+
+    async def aget_user(self, validated_token):
+        user_id = self.get_user_id(validated_token)
+        user = self.claims_user(user_id, validated_token)
+        if user is None or await aclaims_revoked(user_id, validated_token):
+            return await aload_user(user_id)
+        return user
+
+    async def aauthenticate(self, request):
+        """authenticate() for async views; only a fallback user load leaves the event loop"""
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
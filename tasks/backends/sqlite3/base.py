@@ -0,0 +1,109 @@
+"""
+SQLite backend for serving the app with concurrent readers and writers.
+
+Set ``'ENGINE': 'tasks.backends.sqlite3'`` and a ``CONN_MAX_AGE`` so each
+worker thread keeps its connection instead of reconnecting per request.
+``OPTIONS`` takes, besides the sqlite3.connect() arguments:
+
+``pragmas``
+    PRAGMA values applied to every new connection, merged over
+    ``DEFAULT_PRAGMAS``.
+``transaction_mode``
+    How ``atomic()`` blocks begin, ``IMMEDIATE`` by default.
+``write_retries``
+    How many times a statement that hit a locked database outside a
+    transaction, without SQLite having waited ``busy_timeout`` for it, is
+    run again, with exponential backoff.
+"""
+import random
+import time
+
+from django.db.backends.sqlite3 import base
+
+DEFAULT_PRAGMAS = {
+    # Readers don't block the writer and the writer doesn't block readers
+    'journal_mode': 'WAL',
+    # In WAL mode only a power loss can lose the latest commits, never corrupt
+    'synchronous': 'NORMAL',
+    'mmap_size': 256 * 1024 * 1024,
+    # Negative values are KiB: 64 MB of page cache per connection
+    'cache_size': -64000,
+    # Milliseconds to wait for a lock before failing with "database is locked"
+    'busy_timeout': 5000,
+    'temp_store': 'MEMORY',
+}
+WRITE_RETRIES = 5
+RETRY_BASE_DELAY = 0.02
+RETRY_MAX_DELAY = 1.0
+
+
+def is_locked_error(error):
+    message = str(error)
+    return 'database is locked' in message or 'database is busy' in message
+
+
+class RetryingCursorWrapper(base.SQLiteCursorWrapper):
+    """
+    Runs a statement again when the database was locked and no transaction
+    was open, i.e. nothing was written that the retry could repeat.
+
+    ``busy_timeout`` already makes SQLite wait for most locks, so only the
+    errors it returns sooner are retried, like a write from a read snapshot
+    another connection has since committed past. With ``busy_timeout`` 0
+    every lock is waited for here instead.
+    """
+    retries = WRITE_RETRIES
+    busy_timeout = DEFAULT_PRAGMAS['busy_timeout'] / 1000
+
+    def execute(self, query, params=None):
+        return self._retry(super().execute, query, params)
+
+    def executemany(self, query, param_list):
+        return self._retry(super().executemany, query, param_list)
+
+    def _retry(self, method, *args):
+        for attempt in range(self.retries + 1):
+            started = time.monotonic()
+            try:
+                return method(*args)
+            except base.Database.OperationalError as e:
+                if (
+                    attempt == self.retries
+                    or self.connection.in_transaction
+                    or not is_locked_error(e)
+                    or 0 < self.busy_timeout <= time.monotonic() - started
+                ):
+                    raise
+            delay = min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt)
+            time.sleep(delay * random.uniform(0.5, 1))
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    def get_connection_params(self):
+        kwargs = super().get_connection_params()
+        for option in ('pragmas', 'transaction_mode', 'write_retries'):
+            kwargs.pop(option, None)
+        return kwargs
+
+    @property
+    def pragmas(self):
+        return {**DEFAULT_PRAGMAS, **self.settings_dict['OPTIONS'].get('pragmas', {})}
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def create_cursor(self, name=None):
+        cursor = self.connection.cursor(factory=RetryingCursorWrapper)
+        cursor.retries = self.settings_dict['OPTIONS'].get('write_retries', WRITE_RETRIES)
+        cursor.busy_timeout = int(self.pragmas['busy_timeout']) / 1000
+        return cursor
+
+    def _start_transaction_under_autocommit(self):
+        # A deferred transaction that reads before writing can't wait for
+        # the write lock: once another connection has committed it fails at
+        # once. IMMEDIATE takes the lock up front, where busy_timeout applies
+        mode = self.settings_dict['OPTIONS'].get('transaction_mode', 'IMMEDIATE')
+        self.cursor().execute(f'BEGIN {mode}')
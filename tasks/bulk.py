@@ -0,0 +1,97 @@
+from collections import defaultdict
+
+from django.db import router, transaction
+from django.utils import timezone
+
+from .counters import apply_changes, counter_keys, task_values
+from .events import change_event_type, publish_task_events, task_recipients
+from .models import Task
+from .search import get_search_backend
+from .sharding import allocate_task_ids, task_placement
+from .stats import invalidate_stats
+
+# bulk_create() and bulk_update() skip model signals, so these helpers
+# keep counters, the search index, cached stats and pushed events in step
+# themselves.
+
+
+def bulk_create_tasks(tasks, batch_size=1000):
+    """
+    Insert ``tasks`` in one transaction per database they go to; their
+    assignees must be loaded.
+    """
+    ids = allocate_task_ids(len(tasks))
+    if ids is None:
+        groups = {router.db_for_write(Task): tasks}
+    else:
+        groups = defaultdict(list)
+        for task, task_id in zip(tasks, ids):
+            task.pk = task_id
+            groups[task_placement(task)].append(task)
+
+    for alias, group in groups.items():
+        with transaction.atomic(using=alias):
+            group = Task.objects.using(alias).bulk_create(group, batch_size=batch_size)
+            keys = [key for task in group for key in counter_keys(task_values(task))]
+            apply_changes([], keys, using=alias)
+            get_search_backend().index_new_tasks(group, using=alias)
+            invalidate_stats(*{task.created_by_id for task in group})
+            publish_task_events([('task.created', task, task_recipients(task)) for task in group])
+    # bulk_create() sets the ids on the objects it was given
+    return tasks
+
+
+def bulk_update_tasks(tasks, fields, batch_size=1000):
+    """
+    Save ``fields`` of already loaded ``tasks`` in one transaction per
+    database they are stored in.
+
+    Counter changes are worked out from the values the tasks were loaded
+    with. Title and assignee are not allowed since they are copied into
+    the search index.
+    """
+    if {'title', 'assigned_to'} & set(fields):
+        raise ValueError('Use save() to change a task title or assignee')
+
+    now = timezone.now()
+    for task in tasks:
+        task.updated_at = now
+
+    by_database = defaultdict(list)
+    for task in tasks:
+        by_database[router.db_for_write(Task, instance=task)].append(task)
+    for alias, group in by_database.items():
+        _update_tasks(alias, group, fields, now, batch_size)
+
+    for task in tasks:
+        task._loaded_values = task_values(task)
+    return tasks
+
+
+def _update_tasks(alias, tasks, fields, now, batch_size):
+    # Tasks getting identical values share one plain UPDATE, which is much
+    # cheaper than the per-row CASE expressions bulk_update() builds
+    groups = defaultdict(list)
+    for task in tasks:
+        groups[tuple(getattr(task, field) for field in fields)].append(task)
+
+    with transaction.atomic(using=alias):
+        singles = []
+        for values, group in groups.items():
+            if len(group) == 1:
+                singles.extend(group)
+                continue
+            Task.objects.using(alias).filter(pk__in=[task.pk for task in group]).update(
+                updated_at=now, **dict(zip(fields, values))
+            )
+        Task.objects.using(alias).bulk_update(singles, [*fields, 'updated_at'], batch_size=batch_size)
+        apply_changes(
+            [key for task in tasks for key in counter_keys(task._loaded_values)],
+            [key for task in tasks for key in counter_keys(task_values(task))],
+            using=alias,
+        )
+        invalidate_stats(*{task.created_by_id for task in tasks})
+        publish_task_events([
+            (change_event_type(task._loaded_values['status'], task), task, task_recipients(task))
+            for task in tasks
+        ])
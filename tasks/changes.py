@@ -0,0 +1,117 @@
+import base64
+from datetime import timedelta
+from urllib import parse
+
+from django.db.models import Max, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .models import Task, TaskTombstone
+from .serializers import TaskRowSerializer
+from .sharding import shard_for_user, task_databases
+
+CHANGES_PAGE_SIZE = 500
+# Rows are only returned once this old, so a transaction that stamped
+# updated_at but had not committed yet can't be skipped by a watermark
+CHANGES_SETTLE_TIME = timedelta(seconds=1)
+TOMBSTONE_RETENTION = timedelta(days=30)
+
+
+class WatermarkExpired(Exception):
+    """
+    The watermark predates tombstones that have already been pruned, or
+    was issued by another shard than the one the user's tasks are in now
+    """
+
+
+def encode_watermark(updated_at, pk, tombstone_id, synced_at, shard=''):
+    querystring = parse.urlencode({
+        'c': updated_at.isoformat() if updated_at else '',
+        'i': pk,
+        'd': tombstone_id,
+        's': synced_at.isoformat(),
+        'h': shard,
+    })
+    return base64.urlsafe_b64encode(querystring.encode('ascii')).decode('ascii')
+
+
+def decode_watermark(encoded):
+    """(updated_at, id, tombstone id, synced at, shard) of a watermark; ValueError if invalid"""
+    try:
+        querystring = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+        tokens = parse.parse_qs(querystring, keep_blank_values=True)
+        updated_at = parse_datetime(tokens['c'][0]) if tokens['c'][0] else None
+        synced_at = parse_datetime(tokens['s'][0])
+        pk = int(tokens['i'][0])
+        tombstone_id = int(tokens['d'][0])
+        # Watermarks from before sharding have no shard
+        shard = tokens.get('h', [''])[0]
+    except (TypeError, ValueError, KeyError, IndexError, UnicodeError):
+        raise ValueError('Invalid watermark')
+
+    if synced_at is None:
+        raise ValueError('Invalid watermark')
+    return updated_at, pk, tombstone_id, synced_at, shard
+
+
+def task_changes(user, watermark=None, limit=CHANGES_PAGE_SIZE, fields=None):
+    """
+    Tasks of ``user`` changed and removed since ``watermark``.
+
+    Changed tasks are read in (updated_at, id) order and removals from the
+    tombstone table in id order, both after the positions the watermark
+    encodes. Without a watermark every task is returned as changed and the
+    existing tombstones are skipped. ``fields`` narrows the columns read
+    as in TaskRowSerializer. Returns (changed task rows, deleted task ids,
+    new watermark, has more); raises ValueError for an invalid watermark
+    and WatermarkExpired for one older than ``TOMBSTONE_RETENTION`` or
+    from another shard, whose tombstone ids mean nothing in this one.
+    """
+    synced_at = timezone.now() - CHANGES_SETTLE_TIME
+    shard = shard_for_user(user)
+    tasks = TaskRowSerializer.queryset(
+        Task.objects.using(shard)
+        .filter(assigned_to=user, updated_at__lte=synced_at)
+        .order_by('updated_at', 'id'),
+        fields,
+    )
+    tombstones = TaskTombstone.objects.using(shard).filter(user=user, deleted_at__lte=synced_at)
+
+    if watermark:
+        updated_at, pk, tombstone_id, previous_sync, previous_shard = decode_watermark(watermark)
+        if previous_sync < timezone.now() - TOMBSTONE_RETENTION or previous_shard != (shard or ''):
+            raise WatermarkExpired
+        if updated_at is not None:
+            tasks = tasks.filter(Q(updated_at__gt=updated_at) | Q(updated_at=updated_at, id__gt=pk))
+        deleted = list(
+            tombstones.filter(id__gt=tombstone_id)
+            # A task that came back to the user is sent as changed instead
+            .exclude(task_id__in=Task.objects.filter(assigned_to=user).values('id'))
+            .order_by('id')
+            .values_list('id', 'task_id')[:limit + 1]
+        )
+    else:
+        updated_at, pk = None, 0
+        tombstone_id = tombstones.aggregate(last=Max('id'))['last'] or 0
+        deleted = []
+
+    changed = list(tasks[:limit + 1])
+    has_more = len(changed) > limit or len(deleted) > limit
+    changed, deleted = changed[:limit], deleted[:limit]
+
+    if changed:
+        updated_at, pk = changed[-1]['updated_at'], changed[-1]['id']
+    if deleted:
+        tombstone_id = deleted[-1][0]
+
+    new_watermark = encode_watermark(updated_at, pk, tombstone_id, synced_at, shard or '')
+    return changed, [task_id for _, task_id in deleted], new_watermark, has_more
+
+
+def prune_tombstones(retention=TOMBSTONE_RETENTION):
+    """Delete tombstones no unexpired watermark can still ask for"""
+    cutoff = timezone.now() - retention
+    return sum(
+        TaskTombstone.objects.using(alias).filter(deleted_at__lt=cutoff).delete()[0]
+        for alias in task_databases()
+    )
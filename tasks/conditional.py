@@ -0,0 +1,57 @@
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_vary_headers
+from django.utils.crypto import md5
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(*parts):
+    """A strong ETag digesting everything a response's content depends on"""
+    digest = md5(repr(parts).encode(), usedforsecurity=False).hexdigest()
+    return quote_etag(digest)
+
+
+def queryset_validators(queryset, *parts, related=()):
+    """
+    ETag for a response built from ``queryset``.
+
+    One aggregate query: editing a task moves ``Max(updated_at)`` and
+    adding or removing one changes the count. ``related`` are lookups of
+    related rows the response shows, such as the creator's username;
+    the aggregate is grouped by them, so renaming a creator changes the
+    ETag as well. ``parts`` are the other inputs of the response, such
+    as the page requested. There is no Last-Modified: ``Max(updated_at)``
+    stays put when a task is deleted, reassigned away or its creator
+    renamed, so If-Modified-Since would keep stale lists.
+    """
+    aggregates = {'last_modified': Max('updated_at'), 'count': Count('id')}
+    queryset = queryset.order_by()
+    if related:
+        rows = list(queryset.values_list(*related).annotate(**aggregates).order_by(*related))
+    else:
+        row = queryset.aggregate(**aggregates)
+        rows = [(row['count'], row['last_modified'])]
+    return make_etag(rows, *parts)
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # The content depends on who is asking
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+def not_modified(request, etag, last_modified=None):
+    """
+    A 304 (or 412) response when the request's preconditions say the
+    client's copy is current, otherwise None.
+    """
+    response = get_conditional_response(
+        request,
+        etag=etag,
+        last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
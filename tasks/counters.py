@@ -0,0 +1,144 @@
+from collections import Counter
+
+from django.db import connections, router, transaction
+from django.db.models import Case, Count, F, Q, When
+
+from .models import ArchivedTask, Task, TaskCounter, TaskTotal
+from .sharding import user_databases
+
+SCOPE_FIELDS = {
+    'assigned': 'assigned_to_id',
+    'created': 'created_by_id',
+}
+# Counter rows changed per statement
+COUNTS_BATCH_SIZE = 250
+
+
+def counter_keys(values):
+    """(user_id, scope, status) keys a task with ``values`` is counted under"""
+    return [
+        (values[field], scope, values['status'])
+        for scope, field in SCOPE_FIELDS.items()
+        if values.get(field) is not None
+    ]
+
+
+def task_values(task):
+    return {
+        'assigned_to_id': task.assigned_to_id,
+        'created_by_id': task.created_by_id,
+        'status': task.status,
+    }
+
+
+def _add_counts(model, key_fields, deltas, using=None):
+    """
+    Add each delta to the ``model`` row keyed by ``key_fields``: one F()
+    update for the rows that go down, which exist as they counted the
+    task, and one upsert for those that go up, creating missing rows.
+    """
+    decreases = [(key, delta) for key, delta in deltas.items() if delta < 0]
+    increases = [(key, delta) for key, delta in deltas.items() if delta > 0]
+    for start in range(0, len(decreases), COUNTS_BATCH_SIZE):
+        whens, matches = [], Q()
+        for key, delta in decreases[start:start + COUNTS_BATCH_SIZE]:
+            match = Q(**dict(zip(key_fields, key)))
+            whens.append(When(match, then=F('count') + delta))
+            matches |= match
+        model.objects.using(using).filter(matches).update(count=Case(*whens))
+    if not increases:
+        return
+
+    connection = connections[using or router.db_for_write(model)]
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    keys = [quote(model._meta.get_field(field).column) for field in key_fields]
+    count = quote('count')
+    row = f'({", ".join(["%s"] * (len(keys) + 1))})'
+    with connection.cursor() as cursor:
+        for start in range(0, len(increases), COUNTS_BATCH_SIZE):
+            batch = increases[start:start + COUNTS_BATCH_SIZE]
+            cursor.execute(
+                f'INSERT INTO {table} ({", ".join(keys)}, {count}) VALUES {", ".join([row] * len(batch))} '
+                f'ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {count} = {table}.{count} + EXCLUDED.{count}',
+                [value for key, delta in batch for value in (*key, delta)],
+            )
+
+
+def apply_changes(before, after, using=None):
+    """Move tasks' contributions from the ``before`` keys to the ``after`` keys"""
+    changes = Counter(after)
+    changes.subtract(before)
+    # Every task has a creator, so their counters add up to the totals
+    totals = Counter()
+    for (_, scope, status), delta in changes.items():
+        if scope == 'created':
+            totals[(status,)] += delta
+    _add_counts(TaskCounter, ('user_id', 'scope', 'status'), changes, using)
+    _add_counts(TaskTotal, ('status',), totals, using)
+
+
+def get_task_counts(user, scope):
+    """Task counts for ``user`` in ``scope`` keyed by status, plus a 'total'"""
+    counts = {status: 0 for status, _ in Task.STATUS_CHOICES}
+    # A superadmin's tasks can be in any shard
+    for alias in user_databases(user):
+        rows = TaskCounter.objects.using(alias).filter(user=user, scope=scope)
+        for status, count in rows.values_list('status', 'count'):
+            counts[status] += count
+    counts['total'] = sum(counts.values())
+    return counts
+
+
+def expected_counters(using=None):
+    """Recount every counter from the Task table and the archive"""
+    expected = Counter()
+    for model in (Task, ArchivedTask):
+        for scope, field in SCOPE_FIELDS.items():
+            rows = (
+                model.objects.using(using).order_by()
+                .values_list(field, 'status')
+                .annotate(n=Count('id'))
+            )
+            for user_id, status, n in rows:
+                expected[(user_id, scope, status)] += n
+    return expected
+
+
+def stored_counters(using=None):
+    return Counter({
+        (user_id, scope, status): count
+        for user_id, scope, status, count in TaskCounter.objects.using(using).values_list(
+            'user_id', 'scope', 'status', 'count'
+        )
+        if count
+    })
+
+
+def expected_totals(using=None):
+    """Recount the per-status totals from the Task table and the archive"""
+    expected = Counter()
+    for model in (Task, ArchivedTask):
+        for status, n in model.objects.using(using).order_by().values_list('status').annotate(n=Count('id')):
+            expected[status] += n
+    return expected
+
+
+def stored_totals(using=None):
+    return Counter(dict(TaskTotal.objects.using(using).filter(count__gt=0).values_list('status', 'count')))
+
+
+def rebuild_counters(using=None):
+    """Replace every counter and total with a fresh recount of the Task table and the archive"""
+    with transaction.atomic(using=using):
+        expected = expected_counters(using)
+        TaskCounter.objects.using(using).all().delete()
+        TaskCounter.objects.using(using).bulk_create([
+            TaskCounter(user_id=user_id, scope=scope, status=status, count=count)
+            for (user_id, scope, status), count in expected.items()
+        ])
+        TaskTotal.objects.using(using).all().delete()
+        TaskTotal.objects.using(using).bulk_create([
+            TaskTotal(status=status, count=count) for status, count in expected_totals(using).items()
+        ])
+    return expected
@@ -0,0 +1,133 @@
+"""
+Deleting users in the background.
+
+A user's tasks, assigned and created, cascade when the user is deleted,
+and Django's collector loads every one of them to run its signals. For a
+long-serving admin that takes longer than a request should.
+``start_user_deletion`` instead disables the user at once, which logs
+them out and revokes their tokens, and queues a job. The job deletes
+their tasks in batches of raw ``DELETE ... WHERE id IN`` and reports its
+progress, and deletes the user row the usual way once no task is left.
+
+Raw deletes bypass the task signals, so each batch does in bulk what
+they would have done: it adjusts the counters, writes delta sync
+tombstones, drops search rows and cached reports, and pushes
+task.deleted events.
+"""
+from django.db import connections, transaction
+
+from .counters import apply_changes, counter_keys
+from .events import publish_task_deletions
+from .jobs import enqueue_job, report_progress, retry_job
+from .models import BackgroundJob, Task, TaskTombstone, User
+from .reports import invalidate_reports
+from .search import get_search_backend
+from .sharding import TASK_MODELS, task_databases
+from .stats import invalidate_stats
+
+DELETE_BATCH_SIZE = 500
+
+# Columns a deleted task's counters, tombstone and events are built from
+DELETED_TASK_FIELDS = ('id', 'assigned_to_id', 'created_by_id', 'status')
+
+
+def user_deletions():
+    """User deletions that are queued, running or failed, oldest first"""
+    return BackgroundJob.objects.filter(kind='delete_user').exclude(status='done').order_by('id')
+
+
+def start_user_deletion(user):
+    """Disable ``user`` and queue the deletion of them and their tasks; returns the job"""
+    with transaction.atomic():
+        if user.is_active:
+            user.is_active = False
+            user.save(update_fields=['is_active'])
+        job = user_deletions().filter(payload__user_id=user.pk).first()
+        if job is None:
+            job = enqueue_job('delete_user', user_id=user.pk, username=user.username)
+        elif job.status == 'failed':
+            retry_job(job)
+    return job
+
+
+def delete_task_rows(model, using, rows, deleted_user_id=None):
+    """
+    Delete ``model`` rows given as ``DELETED_TASK_FIELDS`` tuples from
+    ``using`` without loading them. Runs in the caller's transaction.
+    """
+    task_ids = [task_id for task_id, _, _, _ in rows]
+    apply_changes([
+        key
+        for _, assigned_to_id, created_by_id, status in rows
+        for key in counter_keys({'assigned_to_id': assigned_to_id, 'created_by_id': created_by_id, 'status': status})
+    ], [], using=using)
+    # The deleted user can't sync any more, so only their tasks' other
+    # assignees need tombstones
+    TaskTombstone.objects.using(using).bulk_create([
+        TaskTombstone(task_id=task_id, user_id=assigned_to_id)
+        for task_id, assigned_to_id, _, _ in rows
+        if assigned_to_id != deleted_user_id
+    ])
+
+    connection = connections[using]
+    placeholders = ', '.join(['%s'] * len(task_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)} WHERE id IN ({placeholders})',
+            task_ids,
+        )
+
+    get_search_backend().remove_tasks(task_ids, using)
+    invalidate_reports(*task_ids)
+    invalidate_stats(*{created_by_id for _, _, created_by_id, _ in rows})
+    # Like the signals, archived tasks are gone from the streams already
+    if model is Task:
+        publish_task_deletions([
+            (task_id, {user_id for user_id in (assigned_to_id, created_by_id) if user_id})
+            for task_id, assigned_to_id, created_by_id, _ in rows
+        ])
+
+
+def delete_user_tasks(user_id, batch_size=DELETE_BATCH_SIZE, progress=None):
+    """
+    Delete the live and archived tasks assigned to or created by
+    ``user_id`` in every task database, ``batch_size`` per transaction,
+    calling ``progress(deleted)`` after each batch. Returns how many were
+    deleted.
+    """
+    deleted = 0
+    for alias in task_databases():
+        for model in TASK_MODELS:
+            for field in ('assigned_to_id', 'created_by_id'):
+                tasks = model.objects.using(alias).filter(**{field: user_id}).order_by()
+                while True:
+                    with transaction.atomic(using=alias):
+                        rows = list(tasks.values_list(*DELETED_TASK_FIELDS)[:batch_size])
+                        if not rows:
+                            break
+                        delete_task_rows(model, alias, rows, deleted_user_id=user_id)
+                    deleted += len(rows)
+                    if progress is not None:
+                        progress(deleted)
+    return deleted
+
+
+def count_user_tasks(user_id):
+    """Live and archived tasks assigned to or created by ``user_id``"""
+    return sum(
+        model.objects.using(alias).filter(assigned_to_id=user_id).count()
+        + model.objects.using(alias).filter(created_by_id=user_id).exclude(assigned_to_id=user_id).count()
+        for alias in task_databases()
+        for model in TASK_MODELS
+    )
+
+
+def run_user_deletion(job, user_id, username=None, batch_size=DELETE_BATCH_SIZE):
+    """The ``delete_user`` job; a retry carries on where the last attempt stopped"""
+    done = job.done
+    report_progress(job, done, done + count_user_tasks(user_id))
+    delete_user_tasks(user_id, batch_size, progress=lambda deleted: report_progress(job, done + deleted))
+    # Only the user's own rows are left for the collector
+    user = User.objects.filter(pk=user_id).first()
+    if user is not None:
+        user.delete()
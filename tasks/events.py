@@ -0,0 +1,180 @@
+import asyncio
+import json
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+from .exports import format_value
+
+EVENT_QUEUE_SIZE = 100
+EVENT_KEEPALIVE_INTERVAL = 25
+EVENT_RETRY_MS = 3000
+# Django 4.2 doesn't tell a streaming response that its client went away,
+# so streams end after this long and EventSource reconnects on its own
+EVENT_STREAM_LIFETIME = 300
+
+EVENT_TASK_FIELDS = (
+    ('id', 'id'),
+    ('title', 'title'),
+    ('status', 'status'),
+    ('assigned_to', 'assigned_to_id'),
+    ('created_by', 'created_by_id'),
+    ('due_date', 'due_date'),
+    ('updated_at', 'updated_at'),
+)
+
+
+def task_event(event_type, task):
+    if event_type == 'task.deleted':
+        return {'type': event_type, 'task': {'id': task.pk}}
+    return {
+        'type': event_type,
+        'task': {name: format_value(getattr(task, attname)) for name, attname in EVENT_TASK_FIELDS},
+    }
+
+
+class Subscription:
+    """One open event stream; its events arrive on an asyncio queue"""
+
+    def __init__(self, user_id, loop):
+        self.user_id = user_id
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, event):
+        # Runs on the subscriber's event loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class LocalEventBroker:
+    """
+    In-process fan-out from model signals to the streams of this process.
+
+    Publishing is thread-safe: events are handed to each subscriber's event
+    loop, so signals can fire from any sync worker thread. A broker shared
+    between processes has to provide the same ``subscribe``, ``unsubscribe``
+    and ``publish`` methods.
+    """
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def subscribe(self, user_id):
+        subscription = Subscription(user_id, asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions[user_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscriptions = self._subscriptions.get(subscription.user_id)
+            if subscriptions is not None:
+                subscriptions.discard(subscription)
+                if not subscriptions:
+                    del self._subscriptions[subscription.user_id]
+
+    def publish(self, user_ids, event):
+        with self._lock:
+            targets = [
+                subscription
+                for user_id in user_ids
+                for subscription in self._subscriptions.get(user_id, ())
+            ]
+        for subscription in targets:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # The subscriber's loop has already been closed
+                self.unsubscribe(subscription)
+
+
+@lru_cache(maxsize=None)
+def get_event_broker():
+    """The broker named by ``TASK_EVENT_BROKER``, or the in-process one"""
+    path = getattr(settings, 'TASK_EVENT_BROKER', None)
+    return import_string(path)() if path else LocalEventBroker()
+
+
+def publish_task_events(events):
+    """
+    Send (event type, task, recipient user ids) events once the current
+    transaction commits, so rolled back changes are never pushed.
+    """
+    messages = [(task_event(event_type, task), user_ids) for event_type, task, user_ids in events]
+    _publish_on_commit(messages)
+
+
+def publish_task_deletions(deletions):
+    """
+    Send task.deleted for (task id, recipient user ids) pairs once the
+    current transaction commits, for tasks deleted without their signals.
+    """
+    _publish_on_commit([
+        ({'type': 'task.deleted', 'task': {'id': task_id}}, user_ids)
+        for task_id, user_ids in deletions
+    ])
+
+
+def _publish_on_commit(messages):
+    if not messages:
+        return
+
+    def publish():
+        broker = get_event_broker()
+        for event, user_ids in messages:
+            broker.publish(user_ids, event)
+
+    transaction.on_commit(publish)
+
+
+def task_recipients(task):
+    """The assignee and the admin who owns the task"""
+    return {user_id for user_id in (task.assigned_to_id, task.created_by_id) if user_id}
+
+
+def change_event_type(previous_status, task):
+    if previous_status is None:
+        return 'task.created'
+    if previous_status != task.status:
+        return 'task.status_changed'
+    return 'task.updated'
+
+
+def format_event(event):
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+
+async def event_stream(broker, subscription, lifetime=EVENT_STREAM_LIFETIME):
+    """Server-Sent Events for ``subscription``, with keep-alive comments while idle"""
+    deadline = time.monotonic() + lifetime
+    try:
+        yield f'retry: {EVENT_RETRY_MS}\n: connected\n\n'
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            try:
+                event = await asyncio.wait_for(
+                    subscription.queue.get(), min(EVENT_KEEPALIVE_INTERVAL, remaining)
+                )
+            except asyncio.TimeoutError:
+                yield ': keep-alive\n\n'
+                continue
+
+            if subscription.overflowed:
+                # The client fell behind; it has to catch up through delta sync
+                yield format_event({'type': 'overflow'})
+                return
+            yield format_event(event)
+    finally:
+        broker.unsubscribe(subscription)
@@ -0,0 +1,159 @@
+"""
+Local, database-backed background jobs.
+
+A job is a ``BackgroundJob`` row, so queueing one needs no broker and a
+queued job survives a restart. Once the transaction that queued it
+commits, a thread of the same process runs it, unless
+``TASK_JOBS_RUN_IN_PROCESS`` is False; ``manage.py run_jobs`` runs jobs in
+a worker process instead, and picks up jobs whose process stopped.
+
+A job holds a lease while it runs and renews it each time it reports
+progress. A job whose process died is claimed again once its lease has
+run out, and a failed job is retried up to ``JOB_MAX_ATTEMPTS`` times, so
+handlers have to be safe to run again after a partial run.
+"""
+import threading
+import traceback
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import BackgroundJob
+
+# Job kind -> handler, called as handler(job, **job.payload)
+JOB_HANDLERS = {
+    'delete_user': 'tasks.deletion.run_user_deletion',
+}
+JOB_LEASE = timedelta(minutes=5)
+JOB_MAX_ATTEMPTS = 3
+JOB_RETRY_DELAY = timedelta(minutes=1)
+# Seconds a runner waits before looking for claimable jobs again
+JOB_POLL_INTERVAL = 5
+
+UNFINISHED_STATUSES = ('pending', 'running')
+
+
+def enqueue_job(kind, **payload):
+    """Queue a ``kind`` job; it runs once the current transaction commits"""
+    job = BackgroundJob.objects.create(kind=kind, payload=payload)
+    if getattr(settings, 'TASK_JOBS_RUN_IN_PROCESS', True):
+        transaction.on_commit(get_job_runner().wake)
+    return job
+
+
+def _claimable(now):
+    return Q(status__in=UNFINISHED_STATUSES) & (Q(run_after__isnull=True) | Q(run_after__lte=now))
+
+
+def claim_job():
+    """Take the oldest job that is due and lease it, or return None"""
+    now = timezone.now()
+    with transaction.atomic():
+        job = (
+            BackgroundJob.objects.select_for_update(skip_locked=True)
+            .filter(_claimable(now)).order_by('id').first()
+        )
+        if job is None:
+            return None
+        job.status = 'running'
+        job.attempts += 1
+        job.run_after = now + JOB_LEASE
+        job.save(update_fields=['status', 'attempts', 'run_after', 'updated_at'])
+    return job
+
+
+def report_progress(job, done, total=None):
+    """Record how far ``job`` got and renew its lease"""
+    job.done = done
+    if total is not None:
+        job.total = total
+    job.run_after = timezone.now() + JOB_LEASE
+    job.save(update_fields=['done', 'total', 'run_after', 'updated_at'])
+
+
+def run_job(job):
+    """Run a claimed job and record how it ended"""
+    try:
+        import_string(JOB_HANDLERS[job.kind])(job, **job.payload)
+    except Exception:
+        job.error = traceback.format_exc()
+        if job.attempts >= JOB_MAX_ATTEMPTS:
+            job.status, job.run_after, job.finished_at = 'failed', None, timezone.now()
+        else:
+            job.status, job.run_after = 'pending', timezone.now() + JOB_RETRY_DELAY
+    else:
+        job.status, job.run_after, job.finished_at, job.error = 'done', None, timezone.now(), ''
+    job.save(update_fields=['status', 'run_after', 'finished_at', 'error', 'updated_at'])
+    return job
+
+
+def run_next_job():
+    """Claim and run one job; returns it, or None when none is due"""
+    job = claim_job()
+    return run_job(job) if job is not None else None
+
+
+def has_unfinished_jobs():
+    return BackgroundJob.objects.filter(status__in=UNFINISHED_STATUSES).exists()
+
+
+def retry_job(job):
+    """Queue a failed job again with a fresh set of attempts"""
+    job.status, job.attempts, job.run_after, job.error, job.finished_at = 'pending', 0, None, '', None
+    job.save(update_fields=['status', 'attempts', 'run_after', 'error', 'finished_at', 'updated_at'])
+    if getattr(settings, 'TASK_JOBS_RUN_IN_PROCESS', True):
+        transaction.on_commit(get_job_runner().wake)
+
+
+class LocalJobRunner:
+    """
+    One thread per process that runs jobs until none is left unfinished.
+
+    Jobs are claimed through the database, so the runners of several
+    processes and ``run_jobs`` workers never run the same job at once.
+    """
+
+    def __init__(self, poll_interval=JOB_POLL_INTERVAL):
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def wake(self):
+        with self._lock:
+            self._wake.set()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='task-jobs', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        try:
+            while True:
+                self._wake.clear()
+                if run_next_job() is not None:
+                    continue
+                # Jobs leased by other processes or waiting for a retry
+                if has_unfinished_jobs():
+                    self._wake.wait(self.poll_interval)
+                    continue
+                # Checked under the lock, so a wake() from now on starts a new thread
+                with self._lock:
+                    if not self._wake.is_set():
+                        self._thread = None
+                        return
+        except BaseException:
+            with self._lock:
+                self._thread = None
+            raise
+        finally:
+            connections.close_all()
+
+
+@lru_cache(maxsize=None)
+def get_job_runner():
+    return LocalJobRunner()
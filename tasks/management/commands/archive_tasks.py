@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from tasks.archive import (
+    ARCHIVE_BATCH_SIZE, archivable_tasks, archive_after, archive_tasks, restore_tasks,
+)
+from tasks.sharding import task_databases
+
+
+class Command(BaseCommand):
+    help = (
+        'Move completed tasks that have not changed for a while to the task archive; '
+        'with --restore, move archived tasks back'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Archive completed tasks last changed more than DAYS ago (default: TASK_ARCHIVE_AFTER_DAYS)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=ARCHIVE_BATCH_SIZE,
+            help='Tasks moved per transaction',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the tasks that would be archived',
+        )
+        parser.add_argument(
+            '--restore',
+            nargs='*',
+            type=int,
+            metavar='TASK_ID',
+            help='Move the given archived tasks, or all of them, back to the live table',
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be at least 1')
+
+        if options['restore'] is not None:
+            if options['dry_run']:
+                raise CommandError('--dry-run only applies to archiving')
+            restored = restore_tasks(options['restore'] or None, options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Restored {restored} archived tasks'))
+            return
+
+        older_than = timedelta(days=options['days']) if options['days'] is not None else archive_after()
+        if options['dry_run']:
+            cutoff = timezone.now() - older_than
+            count = sum(archivable_tasks(alias, cutoff).count() for alias in task_databases())
+            self.stdout.write(f'Would archive {count} completed tasks last changed before {cutoff:%Y-%m-%d}')
+            return
+
+        archived = archive_tasks(older_than, options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Archived {archived} completed tasks last changed more than {older_than.days} days ago'
+        ))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from tasks.changes import TOMBSTONE_RETENTION, prune_tombstones
+
+
+class Command(BaseCommand):
+    help = 'Delete task tombstones older than the delta sync watermark retention'
+
+    def handle(self, *args, **options):
+        deleted = prune_tombstones()
+        self.stdout.write(self.style.SUCCESS(
+            f'Deleted {deleted} task tombstones older than {TOMBSTONE_RETENTION.days} days'
+        ))
@@ -0,0 +1,82 @@
+from collections import Counter
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.models import User
+from tasks.sharding import (
+    TASK_MODELS, admin_loads, assign_shard, balance_plan, get_shards, misplaced_tasks, move_tasks,
+    shard_for_admin, sync_users,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy users to the task shards and move every task to the shard of its admin; '
+        'with --move or --balance, reassign admins to other shards first'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--move',
+            nargs=2,
+            metavar=('ADMIN_ID', 'SHARD'),
+            help='Move an admin, their users and their tasks to SHARD',
+        )
+        parser.add_argument(
+            '--balance',
+            action='store_true',
+            help='Reassign admins so the shards hold about as many tasks each',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would be reassigned and moved',
+        )
+
+    def handle(self, *args, **options):
+        shards = get_shards()
+        if not shards:
+            raise CommandError('Task sharding is off; set TASK_DB_SHARDS to enable it')
+        dry_run = options['dry_run']
+
+        plan = {}
+        if options['move']:
+            admin_id, shard = options['move']
+            if shard not in shards:
+                raise CommandError(f'Unknown shard "{shard}"; shards are {", ".join(shards)}')
+            if not User.objects.filter(pk=admin_id, role='admin').exists():
+                raise CommandError(f'No admin with id {admin_id}')
+            plan[int(admin_id)] = shard
+        if options['balance']:
+            loads = admin_loads()
+            plan.update(balance_plan(loads))
+            totals = Counter()
+            for admin_id, n in loads.items():
+                totals[plan.get(admin_id) or shard_for_admin(admin_id)] += n
+            self.stdout.write('Tasks per shard after balancing: ' + ', '.join(
+                f'{shard}={totals[shard]}' for shard in shards
+            ))
+
+        for admin_id, shard in plan.items():
+            self.stdout.write(f'admin={admin_id}: {shard_for_admin(admin_id)} -> {shard}')
+            if not dry_run:
+                assign_shard(admin_id, shard)
+
+        if dry_run:
+            if options['move'] or options['balance']:
+                self.stdout.write('Dry run; tasks are counted where their admins are now')
+            for model in TASK_MODELS:
+                for (source, target), task_ids in sorted(misplaced_tasks(model).items()):
+                    self.stdout.write(
+                        f'Would move {len(task_ids)} {model._meta.verbose_name_plural} from {source} to {target}'
+                    )
+            return
+
+        users = sync_users()
+        self.stdout.write(f'Copied {users} users to {len(shards)} shards')
+        for model in TASK_MODELS:
+            moved = sum(
+                move_tasks(task_ids, source, target, model)
+                for (source, target), task_ids in sorted(misplaced_tasks(model).items())
+            )
+            self.stdout.write(self.style.SUCCESS(f'Moved {moved} {model._meta.verbose_name_plural}'))
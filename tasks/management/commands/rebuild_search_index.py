@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, transaction
+
+from tasks.search import get_search_backend
+from tasks.sharding import task_databases
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the task and user full-text search index'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        # Users are indexed in the default database, tasks where they are stored
+        for alias in sorted({DEFAULT_DB_ALIAS, *task_databases()}):
+            with transaction.atomic(using=alias):
+                backend.rebuild(using=alias)
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt search index with {type(backend).__name__}'
+        ))
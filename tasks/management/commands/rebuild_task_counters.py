@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tasks.counters import (
+    expected_counters, expected_totals, rebuild_counters, stored_counters, stored_totals,
+)
+from tasks.sharding import task_databases
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the TaskCounter and TaskTotal tables from live and archived task rows, '
+        'or verify them with --verify'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only compare stored counters with a fresh recount; do not write',
+        )
+
+    def handle(self, *args, **options):
+        # Each database tasks are stored in keeps the counters of its tasks
+        databases = task_databases()
+        if not options['verify']:
+            rebuilt = sum(len(rebuild_counters(alias)) for alias in databases)
+            self.stdout.write(self.style.SUCCESS(f'Rebuilt {rebuilt} task counters'))
+            return
+
+        mismatches, checked = [], 0
+        for alias in databases:
+            where = f'{alias}: ' if len(databases) > 1 else ''
+            expected = expected_counters(alias)
+            stored = stored_counters(alias)
+            checked += len(expected)
+            for key in sorted(expected.keys() | stored.keys()):
+                if expected[key] != stored[key]:
+                    mismatches.append(key)
+                    user_id, scope, status = key
+                    self.stdout.write(
+                        f'{where}user={user_id} scope={scope} status={status}: '
+                        f'stored {stored[key]}, expected {expected[key]}'
+                    )
+            expected, stored = expected_totals(alias), stored_totals(alias)
+            checked += len(expected)
+            for status in sorted(expected.keys() | stored.keys()):
+                if expected[status] != stored[status]:
+                    mismatches.append(status)
+                    self.stdout.write(
+                        f'{where}total status={status}: stored {stored[status]}, expected {expected[status]}'
+                    )
+
+        if mismatches:
+            raise CommandError(
+                f'{len(mismatches)} task counters are out of date; '
+                'run rebuild_task_counters to fix them'
+            )
+        self.stdout.write(self.style.SUCCESS(f'All {checked} task counters are correct'))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from tasks.jobs import JOB_POLL_INTERVAL, run_next_job
+
+
+class Command(BaseCommand):
+    help = (
+        'Run queued background jobs, such as user deletions; '
+        'with --once, exit when none is due'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the jobs that are due and exit',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            job = run_next_job()
+            if job is not None:
+                progress = f'{job.done} of {job.total}' if job.total is not None else job.done
+                message = f'{job.kind} #{job.pk} {job.status} ({progress}, attempt {job.attempts})'
+                style = self.style.SUCCESS if job.status == 'done' else self.style.ERROR
+                self.stdout.write(style(message))
+                if job.status != 'done':
+                    self.stderr.write(job.error)
+                continue
+            if options['once']:
+                return
+            time.sleep(JOB_POLL_INTERVAL)
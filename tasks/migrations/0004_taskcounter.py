@@ -0,0 +1,49 @@
+# Generated by Django 4.2.7 on 2026-10-17 03:56
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_counters(apps, schema_editor):
+    Task = apps.get_model('tasks', 'Task')
+    TaskCounter = apps.get_model('tasks', 'TaskCounter')
+    db_alias = schema_editor.connection.alias
+
+    counters = []
+    for scope, field in (('assigned', 'assigned_to_id'), ('created', 'created_by_id')):
+        rows = (
+            Task.objects.using(db_alias).order_by()
+            .values_list(field, 'status')
+            .annotate(n=models.Count('id'))
+        )
+        counters.extend(
+            TaskCounter(user_id=user_id, scope=scope, status=status, count=n)
+            for user_id, status, n in rows
+        )
+    TaskCounter.objects.using(db_alias).bulk_create(counters)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0003_task_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('scope', models.CharField(choices=[('assigned', 'Assigned'), ('created', 'Created')], max_length=10)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('in_progress', 'In Progress'), ('completed', 'Completed')], max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='task_counters', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='taskcounter',
+            constraint=models.UniqueConstraint(fields=('user', 'scope', 'status'), name='unique_task_counter'),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
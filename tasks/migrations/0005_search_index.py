@@ -0,0 +1,39 @@
+from django.db import migrations
+
+
+def create_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    schema_editor.execute('CREATE VIRTUAL TABLE tasks_task_fts USING fts5(title, assignee)')
+    schema_editor.execute(
+        'CREATE VIRTUAL TABLE tasks_user_fts USING fts5(username, first_name, last_name, email)'
+    )
+    schema_editor.execute(
+        'INSERT INTO tasks_task_fts (rowid, title, assignee) '
+        'SELECT t.id, t.title, u.username FROM tasks_task t '
+        'JOIN tasks_user u ON u.id = t.assigned_to_id'
+    )
+    schema_editor.execute(
+        'INSERT INTO tasks_user_fts (rowid, username, first_name, last_name, email) '
+        'SELECT id, username, first_name, last_name, email FROM tasks_user'
+    )
+
+
+def drop_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+
+    schema_editor.execute('DROP TABLE IF EXISTS tasks_task_fts')
+    schema_editor.execute('DROP TABLE IF EXISTS tasks_user_fts')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0004_taskcounter'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
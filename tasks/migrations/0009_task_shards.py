@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-17 05:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0008_tasktombstone'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskIdSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('next_id', models.BigIntegerField()),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ShardAssignment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('shard', models.CharField(max_length=100)),
+                ('admin', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='task_shard', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+    ]
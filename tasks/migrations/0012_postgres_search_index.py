@@ -0,0 +1,40 @@
+from django.db import migrations
+
+
+def create_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for table in ('tasks_task_search', 'tasks_user_search'):
+        schema_editor.execute(f'CREATE TABLE {table} (id bigint PRIMARY KEY, vector tsvector NOT NULL)')
+        schema_editor.execute(f'CREATE INDEX {table}_vector_idx ON {table} USING gin (vector)')
+    for task_table in ('tasks_task', 'tasks_archivedtask'):
+        schema_editor.execute(
+            'INSERT INTO tasks_task_search (id, vector) '
+            "SELECT t.id, to_tsvector('simple', concat_ws(' ', t.title, u.username)) "
+            f'FROM {task_table} t JOIN tasks_user u ON u.id = t.assigned_to_id'
+        )
+    schema_editor.execute(
+        'INSERT INTO tasks_user_search (id, vector) '
+        "SELECT id, to_tsvector('simple', concat_ws(' ', username, first_name, last_name, email)) "
+        'FROM tasks_user'
+    )
+
+
+def drop_search_tables(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    schema_editor.execute('DROP TABLE IF EXISTS tasks_task_search')
+    schema_editor.execute('DROP TABLE IF EXISTS tasks_user_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0011_backgroundjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_tables, drop_search_tables),
+    ]
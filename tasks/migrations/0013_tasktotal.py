@@ -0,0 +1,37 @@
+# Generated by Django 4.2.7 on 2026-10-17 06:26
+
+from django.db import migrations, models
+
+
+def populate_totals(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    TaskTotal = apps.get_model('tasks', 'TaskTotal')
+
+    totals = {}
+    for model_name in ('Task', 'ArchivedTask'):
+        model = apps.get_model('tasks', model_name)
+        rows = model.objects.using(db_alias).order_by().values_list('status').annotate(n=models.Count('id'))
+        for status, n in rows:
+            totals[status] = totals.get(status, 0) + n
+    TaskTotal.objects.using(db_alias).bulk_create(
+        TaskTotal(status=status, count=count) for status, count in totals.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tasks', '0012_postgres_search_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskTotal',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('in_progress', 'In Progress'), ('completed', 'Completed')], max_length=20, unique=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_totals, migrations.RunPython.noop),
+    ]
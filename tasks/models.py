@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth.models import AbstractUser, BaseUserManager
 
 
@@ -55,6 +55,45 @@ class User(AbstractUser):
         return self.role == 'user'
 
 
+class TaskQuerySet(models.QuerySet):
+    """Role-scoped task queries that join and load only what a page renders"""
+
+    def visible_to(self, user):
+        """Superadmins see every task, admins only the tasks they created"""
+        if user.is_superadmin():
+            return self
+        return self.filter(created_by=user)
+
+    def for_task_list(self):
+        """Columns shown on the manage tasks page"""
+        return self.select_related('assigned_to').only(
+            'id', 'title', 'description', 'status', 'due_date', 'created_at',
+            'assigned_to__username', 'assigned_to__first_name', 'assigned_to__last_name',
+        )
+
+    def for_report_list(self):
+        """Completed tasks with the columns shown on the reports page"""
+        return self.filter(status='completed').select_related(
+            'assigned_to', 'created_by'
+        ).only(
+            'id', 'title', 'description', 'status', 'due_date', 'completion_report',
+            'worked_hours', 'updated_at',
+            'assigned_to__username', 'assigned_to__email', 'created_by__username',
+        )
+
+    def assigned_list(self, user):
+        """Tasks assigned to ``user``, as listed on their profile"""
+        return self.filter(assigned_to=user).select_related('created_by').only(
+            'id', 'title', 'status', 'due_date', 'created_by__username',
+        )
+
+    def created_list(self, user):
+        """Tasks created by ``user``, as listed on their profile"""
+        return self.filter(created_by=user).select_related('assigned_to').only(
+            'id', 'title', 'status', 'due_date', 'assigned_to__username',
+        )
+
+
 class Task(models.Model):
     STATUS_CHOICES = [
         ('pending', 'Pending'),
@@ -90,8 +129,226 @@ class Task(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = TaskQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Superadmin task listing
+            models.Index(fields=['-created_at'], name='task_created_idx'),
+            # A user's own tasks, keyset-paginated on (created_at, id)
+            models.Index(fields=['assigned_to', '-created_at', '-id'], name='task_assignee_created_idx'),
+            # Covers Max(updated_at) and the count per creator behind the task list ETag
+            models.Index(fields=['assigned_to', 'created_by', 'updated_at'], name='task_assignee_creator_idx'),
+            # An admin's tasks, with and without a status filter
+            models.Index(fields=['created_by', '-created_at'], name='task_creator_created_idx'),
+            models.Index(fields=['created_by', 'status', '-created_at'], name='task_creator_status_idx'),
+            # Completed task reports
+            models.Index(
+                fields=['-created_at'],
+                name='task_completed_idx',
+                condition=models.Q(status='completed'),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.title} - {self.assigned_to.username}"
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what was loaded so signal handlers can see what changed
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def save(self, *args, **kwargs):
+        from .sharding import allocate_task_ids
+
+        if self._state.adding and self.pk is None:
+            # Sharded tasks take ids from one sequence, so they are unique
+            # across shards, and are stored in their assignee's shard rather
+            # than that of the queryset create() was called on
+            ids = allocate_task_ids(1)
+            if ids:
+                self.pk = ids[0]
+                kwargs['force_insert'] = True
+                kwargs.pop('using', None)
+        # Keep the row and the post_save counter updates in one transaction
+        # of the database the task is stored in
+        using = kwargs.pop('using', None) or router.db_for_write(Task, instance=self)
+        with transaction.atomic(using=using):
+            super().save(*args, using=using, **kwargs)
+
+
+class ArchivedTask(models.Model):
+    """
+    A completed task moved out of the live table by ``archive_tasks``.
+
+    Same columns as Task, so rows are copied across with a plain
+    INSERT ... SELECT and keep their id and timestamps.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=200)
+    description = models.TextField()
+    assigned_to = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_assigned_tasks'
+    )
+    created_by = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='archived_created_tasks'
+    )
+    due_date = models.DateField()
+    status = models.CharField(
+        max_length=20,
+        choices=Task.STATUS_CHOICES,
+        default='completed'
+    )
+    completion_report = models.TextField(blank=True, null=True)
+    worked_hours = models.DecimalField(
+        max_digits=5,
+        decimal_places=2,
+        blank=True,
+        null=True
+    )
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    objects = TaskQuerySet.as_manager()
+
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Report listings of superadmins and of one admin
+            models.Index(fields=['-created_at'], name='archived_created_idx'),
+            models.Index(fields=['created_by', '-created_at'], name='archived_creator_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.assigned_to.username}"
+
+
+class TaskCounter(models.Model):
+    """Denormalized number of tasks per user, role scope and status"""
+    SCOPE_CHOICES = [
+        ('assigned', 'Assigned'),
+        ('created', 'Created'),
+    ]
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='task_counters'
+    )
+    scope = models.CharField(max_length=10, choices=SCOPE_CHOICES)
+    status = models.CharField(max_length=20, choices=Task.STATUS_CHOICES)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'scope', 'status'],
+                name='unique_task_counter',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.scope} {self.status}: {self.count}"
+
+
+class TaskTotal(models.Model):
+    """Denormalized number of tasks per status over every user, for the superadmin dashboard"""
+    status = models.CharField(max_length=20, choices=Task.STATUS_CHOICES, unique=True)
+    count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.status}: {self.count}"
+
+
+class RevokedToken(models.Model):
+    """JTI of a rotated refresh token, kept until the token would have expired"""
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
+
+
+class TaskTombstone(models.Model):
+    """A task that left a user's task list, by deletion or reassignment"""
+    task_id = models.BigIntegerField()
+    # Deleting a user cascades to tasks whose tombstones point back at that
+    # user, so no constraint; such rows are pruned with the others
+    user = models.ForeignKey(
+        User,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name='task_tombstones'
+    )
+    deleted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # Delta sync reads a user's tombstones after a watermark id
+            models.Index(fields=['user', 'id'], name='tombstone_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task_id} left {self.user_id}"
+
+
+class ShardAssignment(models.Model):
+    """The shard holding the tasks of an admin and their users"""
+    admin = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='task_shard'
+    )
+    shard = models.CharField(max_length=100)
+
+    def __str__(self):
+        return f"{self.admin_id} -> {self.shard}"
+
+
+class TaskIdSequence(models.Model):
+    """Next free task id across all shards; processes reserve ids in blocks"""
+    next_id = models.BigIntegerField()
+
+    def __str__(self):
+        return str(self.next_id)
+
+
+class BackgroundJob(models.Model):
+    """Work queued by a request and run later by the local job runner"""
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    # Progress the job reports, in whatever units it counts
+    done = models.PositiveIntegerField(default=0)
+    total = models.PositiveIntegerField(null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    # A running job's lease, or when a failed attempt is retried; the job
+    # can be claimed again once it has passed
+    run_after = models.DateTimeField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='job_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} #{self.pk}: {self.status}"
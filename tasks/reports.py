@@ -0,0 +1,54 @@
+from django.core.cache import caches
+
+from .models import ArchivedTask, Task
+from .sharding import task_databases
+
+# Cache alias holding task reports. Its size bound and LRU eviction come
+# from the backend: LocMemCache evicts least recently read entries once
+# MAX_ENTRIES is reached
+REPORT_CACHE = 'task_reports'
+# Only a safety net; entries are dropped when their task or assignee changes
+REPORT_CACHE_TIMEOUT = 24 * 60 * 60
+
+# Everything the report view checks before rendering a report
+REPORT_FIELDS = (
+    'status', 'created_by_id', 'updated_at', 'assigned_to__assigned_admin_id',
+    'assigned_to__username', 'assigned_to__email',
+)
+
+
+def _report_key(task_id):
+    return f'task_report:{task_id}'
+
+
+def cached_report(task_id):
+    """
+    The cached report of a completed task: its ``REPORT_FIELDS`` plus the
+    serialized report under ``data``, or None.
+    """
+    return caches[REPORT_CACHE].get(_report_key(task_id))
+
+
+def cache_report(task_id, row, data):
+    """
+    Cache the report of a completed task and return the cached entry.
+
+    Completed tasks can't be updated through the API, so the entry stays
+    valid until an admin edits or deletes the task or its assignee changes.
+    """
+    report = {**row, 'data': dict(data)}
+    if row['status'] == 'completed':
+        caches[REPORT_CACHE].set(_report_key(task_id), report, REPORT_CACHE_TIMEOUT)
+    return report
+
+
+def invalidate_reports(*task_ids):
+    caches[REPORT_CACHE].delete_many([_report_key(task_id) for task_id in task_ids])
+
+
+def invalidate_user_reports(user_id):
+    """Drop the reports of tasks assigned to ``user_id``, which embed their name and admin"""
+    for alias in task_databases():
+        for model in (Task, ArchivedTask):
+            completed = model.objects.using(alias).filter(assigned_to_id=user_id, status='completed')
+            invalidate_reports(*completed.values_list('id', flat=True))
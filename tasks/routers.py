@@ -0,0 +1,194 @@
+import contextvars
+import random
+from contextlib import contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.functional import SimpleLazyObject, empty
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# Seconds a user or session reads from the primary after writing, long
+# enough for the replicas to have caught up with the write
+REPLICA_STICKY_SECONDS = 10
+# Models whose reads decide who is logged in, never read from a replica
+PRIMARY_MODELS = {'sessions.session', 'tasks.revokedtoken'}
+
+_routing = contextvars.ContextVar('replica_routing', default=None)
+
+
+def get_replicas():
+    return getattr(settings, 'READ_REPLICAS', ())
+
+
+def _pinned_key(identity):
+    return f'db_pinned:{identity}'
+
+
+def request_user(request):
+    """The user of ``request`` if it is known without a query, else None"""
+    user = getattr(request, 'user', None)
+    if isinstance(user, SimpleLazyObject) and user._wrapped is empty:
+        return None
+    return user
+
+
+def request_identities(request):
+    """
+    The user and session ``request`` belongs to, as far as they are known
+    without a query: a session user that hasn't been loaded yet is left out.
+    """
+    identities = []
+    user = request_user(request)
+    if user is not None and user.is_authenticated:
+        identities.append(f'user:{user.pk}')
+    session = getattr(request, 'session', None)
+    if session is not None and session.session_key:
+        identities.append(f'session:{session.session_key}')
+    return tuple(identities)
+
+
+def pin_to_primary(identities):
+    """Read from the primary for ``identities`` over the next ``REPLICA_STICKY_SECONDS``"""
+    timeout = getattr(settings, 'READ_REPLICA_STICKY_SECONDS', REPLICA_STICKY_SECONDS)
+    cache.set_many({_pinned_key(identity): True for identity in identities}, timeout)
+
+
+def is_pinned(identities):
+    return bool(identities) and bool(cache.get_many([_pinned_key(identity) for identity in identities]))
+
+
+class RequestRouting:
+    """Where the reads of one request go"""
+    __slots__ = ('request', 'writing', 'wrote', 'forced', 'replica', '_identities', '_pinned')
+
+    def __init__(self, request):
+        self.request = request
+        self.writing = request.method not in SAFE_METHODS
+        self.wrote = False
+        self.forced = False
+        self.replica = None
+        self._identities = ()
+        self._pinned = False
+
+    def read_alias(self, replicas):
+        if self.writing or self.wrote or self.forced:
+            return DEFAULT_DB_ALIAS
+        # The user only becomes known once authentication has run
+        identities = request_identities(self.request)
+        if identities != self._identities:
+            self._identities = identities
+            self._pinned = self._pinned or is_pinned(identities)
+        if self._pinned:
+            return DEFAULT_DB_ALIAS
+        # One replica per request, so its queries see the same snapshot
+        if self.replica is None:
+            self.replica = random.choice(replicas)
+        return self.replica
+
+    def finish(self):
+        # Without replicas every read goes to the primary anyway
+        if not get_replicas():
+            return
+        if self.writing or self.wrote:
+            pin_to_primary(request_identities(self.request))
+
+
+def note_write():
+    """Tell the current request it wrote, for routers that decide writes before ReplicaRouter"""
+    routing = _routing.get()
+    if routing is not None:
+        routing.wrote = True
+
+
+@contextmanager
+def use_primary():
+    """
+    Read from the primary inside the block, for reads that must not lag
+    behind writes, such as those filling long-lived caches.
+    """
+    routing = _routing.get()
+    if routing is None:
+        yield
+        return
+    forced = routing.forced
+    routing.forced = True
+    try:
+        yield
+    finally:
+        routing.forced = forced
+
+
+class ReplicaRouter:
+    """
+    Send the reads of GET, HEAD and OPTIONS requests to one of the
+    ``READ_REPLICAS`` database aliases and everything else to the primary.
+
+    A request that writes pins its user and session to the primary for
+    ``READ_REPLICA_STICKY_SECONDS``, so they read their own writes while
+    the replicas catch up. Pins are kept in the Django cache, which has to
+    be shared between processes when more than one serves the app. Reads
+    outside requests, in non-safe requests, in transactions and of
+    ``PRIMARY_MODELS`` always go to the primary. Needs
+    ``ReplicaRoutingMiddleware``.
+    """
+
+    def db_for_read(self, model, **hints):
+        replicas = get_replicas()
+        routing = _routing.get()
+        if not replicas or routing is None:
+            return None
+        if model._meta.label_lower in PRIMARY_MODELS or connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        return routing.read_alias(replicas)
+
+    def db_for_write(self, model, **hints):
+        note_write()
+        # Also for instances read from a replica
+        return DEFAULT_DB_ALIAS if get_replicas() else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas are copies of the primary and get its schema with its data
+        if db in get_replicas():
+            return False
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Track the reads and writes of each request for ReplicaRouter"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        routing = RequestRouting(request)
+        token = _routing.set(routing)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        routing.finish()
+        return response
+
+    async def __acall__(self, request):
+        routing = RequestRouting(request)
+        token = _routing.set(routing)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _routing.reset(token)
+        routing.finish()
+        return response
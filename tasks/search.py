@@ -0,0 +1,282 @@
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import ArchivedTask, User, Task
+from .sharding import task_databases
+
+TOKEN_RE = re.compile(r'\w+')
+
+
+class SearchBackend:
+    """
+    Search interface used by the admin panel.
+
+    This base implementation keeps the original ``icontains`` behaviour and
+    needs no index, so it works on any database.
+    """
+    task_fields = ('title', 'assigned_to__username')
+    user_fields = ('username', 'first_name', 'last_name', 'email')
+
+    def search_tasks(self, queryset, query):
+        return self._icontains(queryset, self.task_fields, query)
+
+    def search_users(self, queryset, query):
+        return self._icontains(queryset, self.user_fields, query)
+
+    def index_task(self, task):
+        pass
+
+    def index_new_tasks(self, tasks, using=None):
+        for task in tasks:
+            self.index_task(task)
+
+    def remove_task(self, task_id, using=None):
+        pass
+
+    def remove_tasks(self, task_ids, using=None):
+        for task_id in task_ids:
+            self.remove_task(task_id, using)
+
+    def index_user(self, user):
+        pass
+
+    def remove_user(self, user_id):
+        pass
+
+    def rebuild(self, using=None):
+        pass
+
+    def _icontains(self, queryset, fields, query):
+        condition = Q()
+        for field in fields:
+            condition |= Q(**{f'{field}__icontains': query})
+        return queryset.filter(condition)
+
+
+class SQLiteSearchBackend(SearchBackend):
+    """
+    FTS5 search on SQLite.
+
+    Tasks are indexed by title and assignee username, users by name and
+    email, in virtual tables keyed by the row id. Every search word is
+    matched as a prefix and results are ordered by bm25 rank. Task rows
+    are kept in the database, or shard, of their task, and stay when the
+    task is archived so report searches find archived tasks too.
+    """
+    task_table = 'tasks_task_fts'
+    user_table = 'tasks_user_fts'
+
+    def search_tasks(self, queryset, query):
+        return self._match(queryset, self.task_table, query)
+
+    def search_users(self, queryset, query):
+        return self._match(queryset, self.user_table, query)
+
+    def match_expression(self, query):
+        return ' '.join(f'"{token}"*' for token in TOKEN_RE.findall(query))
+
+    def _match(self, queryset, table, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset.none()
+
+        # The unary + keeps SQLite from probing the FTS table once per task
+        # row; it has to run the MATCH once and join tasks by primary key
+        model_table = queryset.model._meta.db_table
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        return queryset.extra(
+            tables=[table],
+            where=[f'+{table}.rowid = {model_table}.id', f'{table} MATCH %s'],
+            params=[expression],
+            select={'search_rank': f'{table}.rank'},
+        ).order_by('search_rank', *ordering)
+
+    def index_task(self, task):
+        using = task._state.db
+        self.remove_task(task.pk, using)
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.task_table} (rowid, title, assignee) '
+                f'SELECT %s, %s, username FROM {User._meta.db_table} WHERE id = %s',
+                [task.pk, task.title, task.assigned_to_id],
+            )
+
+    def index_new_tasks(self, tasks, using=None):
+        # Rows for fresh tasks can't exist yet, so skip the per-row delete
+        with connections[using or DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.task_table} (rowid, title, assignee) VALUES (%s, %s, %s)',
+                [(task.pk, task.title, task.assigned_to.username) for task in tasks],
+            )
+
+    def remove_task(self, task_id, using=None):
+        with connections[using or DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.task_table} WHERE rowid = %s', [task_id])
+
+    def remove_tasks(self, task_ids, using=None):
+        placeholders = ', '.join(['%s'] * len(task_ids))
+        with connections[using or DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.task_table} WHERE rowid IN ({placeholders})', list(task_ids))
+
+    def index_user(self, user):
+        self.remove_user(user.pk)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.user_table} (rowid, username, first_name, last_name, email) '
+                'VALUES (%s, %s, %s, %s, %s)',
+                [user.pk, user.username, user.first_name, user.last_name, user.email],
+            )
+        # The assignee username is copied into each of the user's task rows
+        for alias in task_databases():
+            with connections[alias].cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {self.task_table} SET assignee = %s WHERE rowid IN '
+                    f'(SELECT id FROM {Task._meta.db_table} WHERE assigned_to_id = %s '
+                    f'UNION ALL SELECT id FROM {ArchivedTask._meta.db_table} WHERE assigned_to_id = %s)',
+                    [user.username, user.pk, user.pk],
+                )
+
+    def remove_user(self, user_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.user_table} WHERE rowid = %s', [user_id])
+
+    def rebuild(self, using=None):
+        user_table = User._meta.db_table
+        with connections[using or DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.task_table}')
+            cursor.execute(f'DELETE FROM {self.user_table}')
+            for task_table in (Task._meta.db_table, ArchivedTask._meta.db_table):
+                cursor.execute(
+                    f'INSERT INTO {self.task_table} (rowid, title, assignee) '
+                    f'SELECT t.id, t.title, u.username FROM {task_table} t '
+                    f'JOIN {user_table} u ON u.id = t.assigned_to_id'
+                )
+            cursor.execute(
+                f'INSERT INTO {self.user_table} (rowid, username, first_name, last_name, email) '
+                f'SELECT id, username, first_name, last_name, email FROM {user_table}'
+            )
+
+
+class PostgresSearchBackend(SearchBackend):
+    """
+    tsvector search on PostgreSQL.
+
+    Like the FTS5 tables on SQLite, tasks and users have search tables
+    keyed by the row id, holding a stored ``tsvector`` of the task title
+    and assignee username, or of the user's names and email, under a GIN
+    index. Rows are kept in sync on save and delete, every search word is
+    matched as a prefix and results are ordered by ``ts_rank``.
+    """
+    task_table = 'tasks_task_search'
+    user_table = 'tasks_user_search'
+    config = 'simple'
+
+    def search_tasks(self, queryset, query):
+        return self._match(queryset, self.task_table, query)
+
+    def search_users(self, queryset, query):
+        return self._match(queryset, self.user_table, query)
+
+    def match_expression(self, query):
+        return ' & '.join(f'{token}:*' for token in TOKEN_RE.findall(query))
+
+    def _match(self, queryset, table, query):
+        expression = self.match_expression(query)
+        if not expression:
+            return queryset.none()
+
+        model_table = queryset.model._meta.db_table
+        ts_query = f"to_tsquery('{self.config}', %s)"
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        return queryset.extra(
+            tables=[table],
+            where=[f'{table}.id = {model_table}.id', f'{table}.vector @@ {ts_query}'],
+            params=[expression],
+            select={'search_rank': f'ts_rank({table}.vector, {ts_query})'},
+            select_params=[expression],
+        ).order_by('-search_rank', *ordering)
+
+    def _vector(self, *columns):
+        return f"to_tsvector('{self.config}', concat_ws(' ', {', '.join(columns)}))"
+
+    def index_task(self, task):
+        with connections[task._state.db].cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.task_table} (id, vector) '
+                f'SELECT %s, {self._vector("%s", "username")} FROM {User._meta.db_table} WHERE id = %s '
+                'ON CONFLICT (id) DO UPDATE SET vector = EXCLUDED.vector',
+                [task.pk, task.title, task.assigned_to_id],
+            )
+
+    def index_new_tasks(self, tasks, using=None):
+        with connections[using or DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {self.task_table} (id, vector) VALUES (%s, {self._vector("%s", "%s")})',
+                [(task.pk, task.title, task.assigned_to.username) for task in tasks],
+            )
+
+    def remove_task(self, task_id, using=None):
+        with connections[using or DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.task_table} WHERE id = %s', [task_id])
+
+    def remove_tasks(self, task_ids, using=None):
+        with connections[using or DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.task_table} WHERE id = ANY(%s)', [list(task_ids)])
+
+    def index_user(self, user):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {self.user_table} (id, vector) VALUES (%s, {self._vector("%s", "%s", "%s", "%s")}) '
+                'ON CONFLICT (id) DO UPDATE SET vector = EXCLUDED.vector',
+                [user.pk, user.username, user.first_name, user.last_name, user.email],
+            )
+        # The assignee username is part of each of the user's task vectors
+        for alias in task_databases():
+            with connections[alias].cursor() as cursor:
+                cursor.execute(
+                    f'UPDATE {self.task_table} s SET vector = {self._vector("t.title", "%s")} '
+                    f'FROM (SELECT id, title FROM {Task._meta.db_table} WHERE assigned_to_id = %s '
+                    f'UNION ALL SELECT id, title FROM {ArchivedTask._meta.db_table} WHERE assigned_to_id = %s) t '
+                    'WHERE s.id = t.id',
+                    [user.username, user.pk, user.pk],
+                )
+
+    def remove_user(self, user_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.user_table} WHERE id = %s', [user_id])
+
+    def rebuild(self, using=None):
+        user_table = User._meta.db_table
+        with connections[using or DEFAULT_DB_ALIAS].cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.task_table}')
+            cursor.execute(f'DELETE FROM {self.user_table}')
+            for task_table in (Task._meta.db_table, ArchivedTask._meta.db_table):
+                cursor.execute(
+                    f'INSERT INTO {self.task_table} (id, vector) '
+                    f'SELECT t.id, {self._vector("t.title", "u.username")} FROM {task_table} t '
+                    f'JOIN {user_table} u ON u.id = t.assigned_to_id'
+                )
+            cursor.execute(
+                f'INSERT INTO {self.user_table} (id, vector) '
+                f'SELECT id, {self._vector("username", "first_name", "last_name", "email")} FROM {user_table}'
+            )
+
+
+VENDOR_BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """The backend named by ``TASK_SEARCH_BACKEND``, or one for the database in use"""
+    path = getattr(settings, 'TASK_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    return VENDOR_BACKENDS.get(connection.vendor, SearchBackend)()
@@ -1,5 +1,9 @@
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
 from django.contrib.auth import authenticate
+from django.utils import timezone
+from .authentication import ClaimsRefreshToken, add_user_claims, load_user
 from .models import User, Task
 
 class UserSerializer(serializers.ModelSerializer):
@@ -26,6 +30,29 @@ class LoginSerializer(serializers.Serializer):
         else:
             raise serializers.ValidationError('Must include username and password')
 
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    """Re-reads the user's claims so a refreshed token never carries a stale role"""
+    token_class = ClaimsRefreshToken
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        add_user_claims(refresh, load_user(refresh.get(api_settings.USER_ID_CLAIM)))
+
+        # Issued now, so a revocation older than this token doesn't apply
+        access = refresh.access_token
+        access.set_iat()
+        data = {'access': str(access)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            refresh.revoke()
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+
+        return data
+
 class TaskSerializer(serializers.ModelSerializer):
     assigned_to_name = serializers.CharField(source='assigned_to.username', read_only=True)
     created_by_name = serializers.CharField(source='created_by.username', read_only=True)
@@ -38,6 +65,132 @@ class TaskSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_by', 'created_at', 'updated_at']
 
 
+def _datetime(value, tz):
+    # What DateTimeField.to_representation() returns
+    value = value.astimezone(tz).isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+class TaskRowSerializer:
+    """
+    Read-only TaskSerializer for listings, working on ``values()`` rows.
+
+    ``queryset()`` narrows a task queryset to the columns the output needs,
+    joining the two usernames in, and ``data`` converts the rows in one
+    loop instead of through a field object per value. The result equals
+    ``TaskSerializer(tasks, many=True).data`` for the same tasks.
+
+    ``fields`` limits the output, and the columns read, to some of the
+    fields; ``id``, ``created_at`` and ``updated_at`` are always read since
+    pagination and delta sync position on them.
+    """
+    # TaskSerializer field -> values() lookup, in TaskSerializer order
+    field_lookups = {
+        'id': 'id',
+        'title': 'title',
+        'description': 'description',
+        'assigned_to': 'assigned_to_id',
+        'assigned_to_name': 'assigned_to__username',
+        'created_by': 'created_by_id',
+        'created_by_name': 'created_by__username',
+        'due_date': 'due_date',
+        'status': 'status',
+        'completion_report': 'completion_report',
+        'worked_hours': 'worked_hours',
+        'created_at': 'created_at',
+        'updated_at': 'updated_at',
+    }
+    position_lookups = ('id', 'created_at', 'updated_at')
+
+    def __init__(self, rows, fields=None):
+        self.rows = rows
+        self.fields = fields
+
+    @classmethod
+    def select_fields(cls, params):
+        """
+        The fields picked by the ``fields`` and ``exclude`` parameters, comma
+        separated, or None for all of them. Raises ValueError for unknown names.
+        """
+        fields, exclude = params.get('fields'), params.get('exclude')
+        if not fields and not exclude:
+            return None
+        selected = {name for name in fields.split(',') if name} if fields else set(cls.field_lookups)
+        excluded = {name for name in exclude.split(',') if name} if exclude else set()
+        unknown = (selected | excluded) - set(cls.field_lookups)
+        if unknown:
+            raise ValueError(f'Unknown fields: {", ".join(sorted(unknown))}')
+        return [name for name in cls.field_lookups if name in selected - excluded]
+
+    @classmethod
+    def queryset(cls, tasks, fields=None):
+        if fields is None:
+            return tasks.values(*cls.field_lookups.values())
+        lookups = dict.fromkeys([*(cls.field_lookups[name] for name in fields), *cls.position_lookups])
+        return tasks.values(*lookups)
+
+    @property
+    def data(self):
+        tz = timezone.get_current_timezone()
+        if self.fields is not None:
+            return self.selected_data(tz)
+        return [
+            {
+                'id': row['id'],
+                'title': row['title'],
+                'description': row['description'],
+                'assigned_to': row['assigned_to_id'],
+                'assigned_to_name': row['assigned_to__username'],
+                'created_by': row['created_by_id'],
+                'created_by_name': row['created_by__username'],
+                'due_date': row['due_date'].isoformat(),
+                'status': row['status'],
+                'completion_report': row['completion_report'],
+                'worked_hours': None if row['worked_hours'] is None else format(row['worked_hours'], 'f'),
+                'created_at': _datetime(row['created_at'], tz),
+                'updated_at': _datetime(row['updated_at'], tz),
+            }
+            for row in self.rows
+        ]
+
+    def selected_data(self, tz):
+        converters = {
+            'due_date': lambda value: value.isoformat(),
+            'worked_hours': lambda value: format(value, 'f'),
+            'created_at': lambda value: _datetime(value, tz),
+            'updated_at': lambda value: _datetime(value, tz),
+        }
+        columns = [(name, self.field_lookups[name], converters.get(name)) for name in self.fields]
+        data = []
+        for row in self.rows:
+            item = {}
+            for name, lookup, convert in columns:
+                value = row[lookup]
+                item[name] = value if value is None or convert is None else convert(value)
+            data.append(item)
+        return data
+
+
+class PreloadedAssigneeField(serializers.PrimaryKeyRelatedField):
+    """Resolves assignees from ``context['assignees']`` instead of one query per item"""
+
+    def to_internal_value(self, data):
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        user = self.context['assignees'].get(pk)
+        if user is None:
+            self.fail('does_not_exist', pk_value=data)
+        return user
+
+
+class TaskBulkCreateSerializer(TaskSerializer):
+    assigned_to = PreloadedAssigneeField(queryset=User.objects.all())
+
+    class Meta(TaskSerializer.Meta):
+        pass
+
 
 class TaskUpdateSerializer(serializers.ModelSerializer):
     completion_report = serializers.CharField(
@@ -89,6 +242,37 @@ class TaskUpdateSerializer(serializers.ModelSerializer):
 
 
 
+class StrictIntegerField(serializers.IntegerField):
+    """IntegerField taking JSON integers only, not numeric strings or booleans"""
+
+    def to_internal_value(self, data):
+        if type(data) is not int:
+            self.fail('invalid')
+        return super().to_internal_value(data)
+
+
+class TaskBulkUpdateSerializer(TaskUpdateSerializer):
+    """One item of a bulk update, checked against ``context['tasks']`` by id"""
+    id = StrictIntegerField()
+
+    class Meta(TaskUpdateSerializer.Meta):
+        fields = ['id'] + TaskUpdateSerializer.Meta.fields
+
+    def validate(self, attrs):
+        task = self.context['tasks'].get(attrs['id'])
+        if task is None:
+            raise serializers.ValidationError({'id': 'Task not found'})
+        if task.status == 'completed':
+            raise serializers.ValidationError('Cannot update a completed task')
+
+        # Run the single-task checks against this item's task
+        self.instance = task
+        try:
+            return super().validate(attrs)
+        finally:
+            self.instance = None
+
+
 class TaskReportSerializer(serializers.ModelSerializer):
     assigned_to_name = serializers.CharField(source='assigned_to.username', read_only=True)
     assigned_to_email = serializers.CharField(source='assigned_to.email', read_only=True)
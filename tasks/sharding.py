@@ -0,0 +1,553 @@
+"""
+Opt-in sharding of task storage by owning admin.
+
+With ``TASK_SHARDS`` set, tasks, their counters and their tombstones are
+stored in one of those databases instead of the default one. Everything
+else, users included, stays in the default database; every shard keeps
+a copy of the user table so task foreign keys and joins work there.
+
+A task belongs to the admin of its assignee (or to the assignee, if that
+is an admin), so an admin's tasks and each user's tasks are all in one
+shard. ``ShardAssignment`` maps admins to shards; an admin without a row
+is placed by id the first time it is looked up. Tasks of users without
+an admin are kept in the first shard.
+"""
+import functools
+import heapq
+import threading
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from itertools import chain, islice
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Count, F, Max
+
+from .models import ArchivedTask, ShardAssignment, Task, TaskIdSequence, User
+from .routers import note_write, request_user
+
+SHARDED_MODELS = {'tasks.task', 'tasks.archivedtask', 'tasks.taskcounter', 'tasks.tasktombstone'}
+# Tables holding tasks, which move between shards together
+TASK_MODELS = (Task, ArchivedTask)
+SHARD_MAP_CACHE_TIMEOUT = 300
+# Task ids a process reserves from TaskIdSequence at a time
+TASK_ID_BLOCK = 100
+MOVE_BATCH_SIZE = 500
+
+_shard = ContextVar('task_shard', default=None)
+_request = ContextVar('task_shard_request', default=None)
+
+
+def get_shards():
+    return getattr(settings, 'TASK_SHARDS', ())
+
+
+def task_databases():
+    """Every database tasks are stored in"""
+    return list(get_shards()) or [DEFAULT_DB_ALIAS]
+
+
+def _shard_key(admin_id):
+    return f'task_shard:{admin_id}'
+
+
+def _owner(user_id, role, admin_id):
+    if role == 'admin':
+        return user_id
+    if role == 'user':
+        return admin_id
+    return None
+
+
+def owner_admin_id(user):
+    """The admin whose shard holds the tasks assigned to ``user``"""
+    return _owner(user.pk, user.role, user.assigned_admin_id)
+
+
+def shard_for_admin(admin_id):
+    """The shard of ``admin_id``'s tasks, placing the admin on first use"""
+    shards = get_shards()
+    if admin_id is None:
+        return shards[0]
+    shard = cache.get(_shard_key(admin_id))
+    if shard is None:
+        shard = (
+            ShardAssignment.objects.using(DEFAULT_DB_ALIAS)
+            .filter(admin_id=admin_id)
+            .values_list('shard', flat=True)
+            .first()
+        )
+        if shard not in shards:
+            shard = shards[admin_id % len(shards)]
+            ShardAssignment.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+                admin_id=admin_id, defaults={'shard': shard}
+            )
+        cache.set(_shard_key(admin_id), shard, SHARD_MAP_CACHE_TIMEOUT)
+    return shard
+
+
+def assign_shard(admin_id, shard):
+    """Point ``admin_id`` at ``shard``; their tasks still have to be moved"""
+    ShardAssignment.objects.using(DEFAULT_DB_ALIAS).update_or_create(
+        admin_id=admin_id, defaults={'shard': shard}
+    )
+    cache.delete(_shard_key(admin_id))
+
+
+def shard_for_user(user):
+    """
+    The one shard ``user``'s tasks are in, or None without sharding or for
+    superadmins, whose tasks can be in any shard.
+    """
+    if not get_shards() or user.is_superadmin():
+        return None
+    return shard_for_admin(owner_admin_id(user))
+
+
+def user_databases(user):
+    """Databases to read ``user``'s tasks from; None stands for the router's choice"""
+    if not get_shards():
+        return [None]
+    if user.is_superadmin():
+        return list(get_shards())
+    return [shard_for_user(user)]
+
+
+def task_placement(task):
+    """The shard a task belongs in, from its assignee"""
+    return shard_for_admin(owner_admin_id(task.assigned_to))
+
+
+def find_task_shard(task_id):
+    """The shard holding task ``task_id``, live or archived, looked up in each of them"""
+    for alias in get_shards():
+        if any(model.objects.using(alias).filter(pk=task_id).exists() for model in TASK_MODELS):
+            return alias
+    return None
+
+
+def task_shard(user, task_id):
+    """
+    Database to read task ``task_id`` from for ``user``: None lets the
+    router resolve it from the request, except for a superadmin with
+    sharding on, for whom the task is looked up.
+    """
+    if get_shards() and user.is_superadmin():
+        return find_task_shard(task_id)
+    return None
+
+
+@contextmanager
+def use_shard(alias):
+    """Send queries on sharded models to ``alias`` inside the block; None changes nothing"""
+    if alias is None:
+        yield
+        return
+    token = _shard.set(alias)
+    try:
+        yield
+    finally:
+        _shard.reset(token)
+
+
+def request_shard():
+    """The shard of the current request's user, if there is one"""
+    request = _request.get()
+    user = request_user(request) if request is not None else None
+    if user is None or not user.is_authenticated:
+        return None
+    # Resolved once per request; the user can only change through login
+    cached = getattr(request, '_task_shard', None)
+    if cached is None or cached[0] != user.pk:
+        cached = (user.pk, shard_for_user(user))
+        request._task_shard = cached
+    return cached[1]
+
+
+class ShardRouter:
+    """
+    Route sharded models to the shard of, in order: a ``use_shard()``
+    block, the instance being saved or read from, or the request user.
+    Superadmins and code outside requests fall back to the first shard,
+    so views listing every task read from ``for_user()`` instead.
+    """
+
+    def _shard(self, model, hints):
+        shards = get_shards()
+        if not shards or model._meta.label_lower not in SHARDED_MODELS:
+            return None
+        shard = _shard.get()
+        if shard is not None:
+            return shard
+        instance = hints.get('instance')
+        if isinstance(instance, TASK_MODELS):
+            if isinstance(instance, Task) and instance._state.adding and instance.assigned_to_id is not None:
+                return task_placement(instance)
+            if instance._state.db in shards:
+                return instance._state.db
+        elif isinstance(instance, User):
+            # Related managers of a user, such as user.assigned_tasks
+            return shard_for_user(instance) or shards[0]
+        return request_shard() or shards[0]
+
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints)
+
+    def db_for_write(self, model, **hints):
+        shard = self._shard(model, hints)
+        if shard is not None:
+            # ReplicaRouter isn't asked once this router has answered
+            note_write()
+        return shard
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *get_shards()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+
+class ShardRoutingMiddleware:
+    """Make the request user available to ShardRouter"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _request.reset(token)
+
+    async def __acall__(self, request):
+        token = _request.set(request)
+        try:
+            return await self.get_response(request)
+        finally:
+            _request.reset(token)
+
+
+class TaskIdAllocator:
+    """
+    Hands out task ids from blocks reserved in ``TaskIdSequence``, so ids
+    are unique across shards and tasks keep theirs when moved.
+    """
+
+    def __init__(self, block_size=TASK_ID_BLOCK):
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+
+    def allocate(self, count):
+        with self._lock:
+            if self._end - self._next < count:
+                self._next = self._reserve(max(count, self.block_size))
+                self._end = self._next + max(count, self.block_size)
+            ids = list(range(self._next, self._next + count))
+            self._next += count
+        return ids
+
+    def _reserve(self, count):
+        sequences = TaskIdSequence.objects.using(DEFAULT_DB_ALIAS)
+        with transaction.atomic(using=DEFAULT_DB_ALIAS):
+            sequence = sequences.select_for_update().first()
+            if sequence is None:
+                start = 1 + max(
+                    model.objects.using(alias).aggregate(last=Max('id'))['last'] or 0
+                    for alias in {DEFAULT_DB_ALIAS, *get_shards()}
+                    for model in TASK_MODELS
+                )
+                sequences.create(next_id=start + count)
+                return start
+            sequences.filter(pk=sequence.pk).update(next_id=F('next_id') + count)
+            return sequence.next_id
+
+
+_allocator = TaskIdAllocator()
+
+
+def allocate_task_ids(count):
+    """``count`` new task ids with sharding on, else None to let the database number them"""
+    if not get_shards():
+        return None
+    return _allocator.allocate(count)
+
+
+# User columns copied to the shards; password hashes stay in the default database
+COPIED_USER_FIELDS = [
+    field.attname for field in User._meta.concrete_fields
+    if not field.primary_key and field.attname != 'password'
+]
+
+
+def copy_users(users, databases=None):
+    """Insert or update the shard copies of ``users``"""
+    for alias in databases or get_shards():
+        copies = [
+            User(pk=user.pk, password='', **{field: getattr(user, field) for field in COPIED_USER_FIELDS})
+            for user in users
+        ]
+        User.objects.using(alias).bulk_create(
+            copies, update_conflicts=True, unique_fields=['id'], update_fields=COPIED_USER_FIELDS,
+        )
+
+
+def delete_user_copies(user_id):
+    # Cascades to the user's tasks in each shard, with their signals
+    for alias in get_shards():
+        User.objects.using(alias).filter(pk=user_id).delete()
+
+
+def sync_users():
+    """Copy every user to every shard; returns how many were copied"""
+    users = list(User.objects.using(DEFAULT_DB_ALIAS).order_by('id'))
+    for alias in get_shards():
+        with transaction.atomic(using=alias):
+            copy_users(users, [alias])
+    return len(users)
+
+
+def _insert_tasks(tasks, alias, model):
+    # A plain INSERT keeps ids and timestamps; save() and bulk_create() would
+    # stamp created_at and updated_at again
+    connection = connections[alias]
+    fields = model._meta.concrete_fields
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    placeholders = ', '.join(['%s'] * len(fields))
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'INSERT INTO {connection.ops.quote_name(model._meta.db_table)} ({columns}) '
+            f'VALUES ({placeholders})',
+            [[field.get_db_prep_save(getattr(task, field.attname), connection) for field in fields]
+             for task in tasks],
+        )
+
+
+def _delete_tasks(task_ids, alias, model):
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {connection.ops.quote_name(model._meta.db_table)} '
+            f'WHERE id IN ({", ".join(["%s"] * len(task_ids))})',
+            task_ids,
+        )
+
+
+def move_tasks(task_ids, source, target, model=Task):
+    """
+    Move tasks, or archived tasks with ``model=ArchivedTask``, with their
+    counters and search index rows from ``source`` to ``target``, keeping
+    ids and timestamps. No model signals are sent:
+    for the users involved nothing changed. Returns how many were moved.
+
+    Each batch commits in ``target`` and then in ``source``; if ``source``
+    fails to commit, moving again replaces the copies already in ``target``.
+    """
+    from .counters import apply_changes, counter_keys, task_values
+    from .search import get_search_backend
+
+    search = get_search_backend()
+    moved = 0
+    for start in range(0, len(task_ids), MOVE_BATCH_SIZE):
+        batch = task_ids[start:start + MOVE_BATCH_SIZE]
+        tasks = list(model.objects.using(source).filter(pk__in=batch).select_related('assigned_to'))
+        if not tasks:
+            continue
+        batch = [task.pk for task in tasks]
+        keys = [key for task in tasks for key in counter_keys(task_values(task))]
+        with transaction.atomic(using=source), transaction.atomic(using=target):
+            _delete_tasks(batch, target, model)
+            for task_id in batch:
+                search.remove_task(task_id, using=target)
+            _insert_tasks(tasks, target, model)
+            apply_changes([], keys, using=target)
+            search.index_new_tasks(tasks, using=target)
+            apply_changes(keys, [], using=source)
+            _delete_tasks(batch, source, model)
+            for task_id in batch:
+                search.remove_task(task_id, using=source)
+        moved += len(tasks)
+    return moved
+
+
+def move_user_tasks(user_ids, source, target):
+    """Move the live and archived tasks assigned to ``user_ids`` from ``source`` to ``target``"""
+    if source == target:
+        return 0
+    moved = 0
+    for model in TASK_MODELS:
+        tasks = model.objects.using(source).filter(assigned_to_id__in=user_ids)
+        moved += move_tasks(list(tasks.values_list('id', flat=True)), source, target, model)
+    return moved
+
+
+def relocate_user_tasks(user, previous):
+    """
+    Move the tasks of ``user`` to their shard after a change of role or
+    admin; ``previous`` holds the role and admin id they were stored by.
+    """
+    if not get_shards():
+        return 0
+    source = shard_for_admin(_owner(user.pk, previous['role'], previous['assigned_admin_id']))
+    return move_user_tasks([user.pk], source, shard_for_user(user) or get_shards()[0])
+
+
+def relocate_task(task):
+    """Move a saved task to the shard of its assignee if it isn't there"""
+    if not get_shards():
+        return
+    source, target = task._state.db, task_placement(task)
+    if source != target:
+        move_tasks([task.pk], source, target)
+        task._state.db = target
+
+
+def remember_admin_users(admin):
+    # Deleting an admin unsets their users' admin without saving the users
+    admin._sharded_user_ids = list(
+        User.objects.using(DEFAULT_DB_ALIAS).filter(assigned_admin=admin).values_list('id', flat=True)
+    )
+    admin._shard = shard_for_admin(admin.pk)
+
+
+def remove_user(user):
+    """
+    Delete the shard copies of a deleted user, with their tasks. The tasks
+    of a deleted admin's users move to the first shard, where the tasks of
+    users without an admin are kept.
+    """
+    delete_user_copies(user.pk)
+    cache.delete(_shard_key(user.pk))
+    user_ids = getattr(user, '_sharded_user_ids', None)
+    if user_ids:
+        move_user_tasks(user_ids, user._shard, get_shards()[0])
+
+
+def misplaced_tasks(model=Task):
+    """{(source, target): task ids} of tasks not in the shard they belong in"""
+    misplaced = defaultdict(list)
+    for alias in {DEFAULT_DB_ALIAS, *get_shards()}:
+        rows = model.objects.using(alias).values_list(
+            'id', 'assigned_to_id', 'assigned_to__role', 'assigned_to__assigned_admin_id'
+        )
+        for task_id, assignee_id, role, admin_id in rows.iterator():
+            target = shard_for_admin(_owner(assignee_id, role, admin_id))
+            if target != alias:
+                misplaced[(alias, target)].append(task_id)
+    return misplaced
+
+
+def admin_loads():
+    """{admin id or None: task count} over every database tasks are in"""
+    loads = Counter()
+    for alias in {DEFAULT_DB_ALIAS, *get_shards()}:
+        rows = (
+            Task.objects.using(alias).order_by()
+            .values_list('assigned_to_id', 'assigned_to__role', 'assigned_to__assigned_admin_id')
+            .annotate(n=Count('id'))
+        )
+        for assignee_id, role, admin_id, n in rows:
+            loads[_owner(assignee_id, role, admin_id)] += n
+    return loads
+
+
+def balance_plan(loads):
+    """
+    {admin id: shard} moves evening out the task counts of the shards.
+
+    Repeatedly moves from the fullest to the emptiest shard the largest
+    admin that narrows the gap between them, so each move helps and no
+    admin is moved twice.
+    """
+    shards = get_shards()
+    placement = {admin_id: shard_for_admin(admin_id) for admin_id in loads}
+    totals = Counter(dict.fromkeys(shards, 0))
+    for admin_id, n in loads.items():
+        totals[placement[admin_id]] += n
+
+    plan = {}
+    while True:
+        fullest = max(shards, key=totals.__getitem__)
+        emptiest = min(shards, key=totals.__getitem__)
+        gap = totals[fullest] - totals[emptiest]
+        candidates = [
+            admin_id for admin_id, shard in placement.items()
+            if shard == fullest and admin_id is not None and admin_id not in plan
+            and 0 < loads[admin_id] < gap
+        ]
+        if not candidates:
+            return plan
+        admin_id = max(candidates, key=loads.__getitem__)
+        plan[admin_id] = placement[admin_id] = emptiest
+        totals[fullest] -= loads[admin_id]
+        totals[emptiest] += loads[admin_id]
+
+
+class FanOutList:
+    """
+    Equally ordered querysets, such as one task queryset on every shard,
+    read as one list merged in their ordering.
+
+    Supports what Paginator needs: count() and slicing, which reads up to
+    the end of the slice from each queryset. iterator() reads the querysets
+    one after the other instead, without merging.
+    """
+    ordered = True
+
+    def __init__(self, querysets):
+        self.querysets = list(querysets)
+        queryset = self.querysets[0]
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        self.ordering = [
+            (field.lstrip('-'), field.startswith('-')) for field in ordering if field != '?'
+        ]
+
+    def _compare(self, a, b):
+        for field, descending in self.ordering:
+            x, y = getattr(a, field), getattr(b, field)
+            if x != y:
+                result = -1 if x < y else 1
+                return -result if descending else result
+        return 0
+
+    def count(self):
+        return sum(queryset.count() for queryset in self.querysets)
+
+    def __len__(self):
+        return self.count()
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice):
+            return self[key:key + 1][0]
+        if key.stop is None:
+            rows = [list(queryset) for queryset in self.querysets]
+        else:
+            rows = [list(queryset[:key.stop]) for queryset in self.querysets]
+        merged = heapq.merge(*rows, key=functools.cmp_to_key(self._compare))
+        return list(islice(merged, key.start, key.stop, key.step))
+
+    def __iter__(self):
+        return iter(self[:])
+
+    def iterator(self, chunk_size=None):
+        return chain.from_iterable(queryset.iterator(chunk_size=chunk_size) for queryset in self.querysets)
+
+
+def for_user(queryset, user):
+    """
+    ``queryset`` over the tasks of ``user``: read from their shard, or from
+    every shard for a superadmin with sharding on.
+    """
+    if get_shards() and user.is_superadmin():
+        return FanOutList(queryset.using(alias) for alias in get_shards())
+    return queryset.using(shard_for_user(user))
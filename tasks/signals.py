@@ -0,0 +1,231 @@
+from django.db import DEFAULT_DB_ALIAS
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from .authentication import TOKEN_USER_FIELDS, revoke_user_tokens, token_user_values
+from .counters import apply_changes, counter_keys, task_values
+from .events import change_event_type, publish_task_events, task_recipients
+from .models import ArchivedTask, User, Task, TaskTombstone
+from .profiling import install_query_profiler
+from .reports import invalidate_reports, invalidate_user_reports
+from .search import get_search_backend
+from .sharding import (
+    copy_users, get_shards, relocate_task, relocate_user_tasks, remember_admin_users, remove_user,
+)
+from .stats import invalidate_stats
+
+
+@receiver(pre_save, sender=Task)
+def remember_task_values(sender, instance, using, **kwargs):
+    # Rows loaded with deferred fields don't know their stored values
+    loaded = getattr(instance, '_loaded_values', None)
+    if instance.pk and (
+        loaded is None or any(field not in loaded for field in task_values(instance))
+    ):
+        instance._loaded_values = (
+            Task.objects.using(using).filter(pk=instance.pk)
+            .values('assigned_to_id', 'created_by_id', 'status')
+            .first()
+        )
+
+
+@receiver(pre_save, sender=Task)
+def remember_assignee(sender, instance, **kwargs):
+    loaded = getattr(instance, '_loaded_values', None) or {}
+    instance._previous_assignee_id = loaded.get('assigned_to_id')
+    instance._previous_status = loaded.get('status')
+
+
+@receiver(post_save, sender=Task)
+def update_task_counters(sender, instance, created, using, **kwargs):
+    before = [] if created else counter_keys(instance._loaded_values or {})
+    current = task_values(instance)
+    apply_changes(before, counter_keys(current), using=using)
+    instance._loaded_values = current
+
+
+@receiver(post_delete, sender=Task)
+def release_task_counters(sender, instance, using, **kwargs):
+    values = getattr(instance, '_loaded_values', None) or task_values(instance)
+    apply_changes(counter_keys(values), [], using=using)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def task_changed(sender, instance, **kwargs):
+    invalidate_stats(instance.created_by_id)
+
+
+@receiver(post_save, sender=Task)
+@receiver(post_delete, sender=Task)
+def drop_task_report(sender, instance, **kwargs):
+    invalidate_reports(instance.pk)
+
+
+@receiver(post_save, sender=Task)
+def record_reassignment(sender, instance, created, using, **kwargs):
+    # The previous assignee's delta sync has to drop the task
+    previous = getattr(instance, '_previous_assignee_id', None)
+    if not created and previous and previous != instance.assigned_to_id:
+        TaskTombstone.objects.using(using).create(task_id=instance.pk, user_id=previous)
+
+
+@receiver(post_delete, sender=Task)
+def record_deletion(sender, instance, using, **kwargs):
+    TaskTombstone.objects.using(using).create(task_id=instance.pk, user_id=instance.assigned_to_id)
+
+
+@receiver(post_save, sender=Task)
+def push_task_change(sender, instance, created, **kwargs):
+    previous_status = None if created else getattr(instance, '_previous_status', None)
+    events = [(change_event_type(previous_status, instance), instance, task_recipients(instance))]
+    previous = getattr(instance, '_previous_assignee_id', None)
+    if not created and previous and previous != instance.assigned_to_id:
+        events.append(('task.deleted', instance, {previous}))
+    publish_task_events(events)
+
+
+@receiver(post_delete, sender=Task)
+def push_task_deletion(sender, instance, **kwargs):
+    publish_task_events([('task.deleted', instance, task_recipients(instance))])
+
+
+# Task fields copied into its search row: the title, and through the
+# assignee their username
+TASK_SEARCH_FIELDS = ('title', 'assigned_to_id')
+
+
+@receiver(pre_save, sender=Task)
+def remember_search_change(sender, instance, update_fields=None, **kwargs):
+    # Saves that change neither, like status updates, keep the search row
+    if update_fields is not None and not {'title', 'assigned_to', 'assigned_to_id'} & set(update_fields):
+        instance._search_changed = False
+        return
+    indexed = getattr(instance, '_indexed_values', None) or getattr(instance, '_loaded_values', None) or {}
+    instance._search_changed = any(
+        field not in indexed or indexed[field] != getattr(instance, field)
+        for field in TASK_SEARCH_FIELDS
+    )
+
+
+@receiver(post_save, sender=Task)
+def index_task(sender, instance, **kwargs):
+    if instance._search_changed:
+        get_search_backend().index_task(instance)
+    instance._indexed_values = {field: getattr(instance, field) for field in TASK_SEARCH_FIELDS}
+
+
+@receiver(post_delete, sender=Task)
+def unindex_task(sender, instance, using, **kwargs):
+    get_search_backend().remove_task(instance.pk, using)
+
+
+@receiver(post_delete, sender=ArchivedTask)
+def drop_archived_task(sender, instance, using, **kwargs):
+    # Archived tasks are only deleted with their assignee or creator, and
+    # still count in the counters and the search index until then. Delta
+    # sync clients kept their copy when it was archived, so drop it now.
+    apply_changes(counter_keys(task_values(instance)), [], using=using)
+    TaskTombstone.objects.using(using).create(task_id=instance.pk, user_id=instance.assigned_to_id)
+    get_search_backend().remove_task(instance.pk, using)
+    invalidate_reports(instance.pk)
+    invalidate_stats(instance.created_by_id)
+
+
+@receiver(pre_save, sender=User)
+def remember_user_values(sender, instance, update_fields=None, **kwargs):
+    # Keep the previous admin so its counters can be dropped on reassignment,
+    # and the values issued tokens were built from so a change revokes them
+    instance._previous_admin_id = None
+    instance._stored_token_values = None
+    watched = {User._meta.get_field(field).name for field in TOKEN_USER_FIELDS}
+    if instance.pk and (update_fields is None or watched & set(update_fields)):
+        stored = User.objects.filter(pk=instance.pk).values(*TOKEN_USER_FIELDS).first()
+        if stored:
+            instance._previous_admin_id = stored['assigned_admin_id']
+            instance._stored_token_values = stored
+
+
+def _login_only(update_fields):
+    # Logins only touch last_login, which neither counters nor search use
+    return bool(update_fields) and set(update_fields) <= {'last_login'}
+
+
+@receiver(post_save, sender=User)
+def index_user(sender, instance, update_fields=None, **kwargs):
+    if not _login_only(update_fields):
+        get_search_backend().index_user(instance)
+
+
+@receiver(post_delete, sender=User)
+def unindex_user(sender, instance, **kwargs):
+    get_search_backend().remove_user(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def revoke_changed_tokens(sender, instance, **kwargs):
+    stored = getattr(instance, '_stored_token_values', None)
+    if stored and stored != token_user_values(instance):
+        revoke_user_tokens(instance.pk)
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_tokens(sender, instance, **kwargs):
+    revoke_user_tokens(instance.pk)
+
+
+@receiver(post_save, sender=User)
+def drop_user_reports(sender, instance, created, update_fields=None, **kwargs):
+    # Reports embed the assignee's name and email, and their admin may view them
+    if not created and not _login_only(update_fields):
+        invalidate_user_reports(instance.pk)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, update_fields=None, **kwargs):
+    if _login_only(update_fields):
+        return
+    invalidate_stats(
+        instance.assigned_admin_id,
+        getattr(instance, '_previous_admin_id', None),
+    )
+
+
+@receiver(post_save, sender=User)
+def copy_user_to_shards(sender, instance, using, update_fields=None, **kwargs):
+    # Shards keep a copy of every user for their task foreign keys
+    if using == DEFAULT_DB_ALIAS and get_shards() and not _login_only(update_fields):
+        copy_users([instance])
+
+
+@receiver(post_save, sender=User)
+def move_user_tasks_to_shard(sender, instance, created, using, **kwargs):
+    stored = getattr(instance, '_stored_token_values', None)
+    if using == DEFAULT_DB_ALIAS and stored and not created:
+        relocate_user_tasks(instance, stored)
+
+
+@receiver(pre_delete, sender=User)
+def remember_sharded_users(sender, instance, using, **kwargs):
+    if using == DEFAULT_DB_ALIAS and get_shards() and instance.is_admin():
+        remember_admin_users(instance)
+
+
+@receiver(post_delete, sender=User)
+def delete_user_from_shards(sender, instance, using, **kwargs):
+    if using == DEFAULT_DB_ALIAS and get_shards():
+        remove_user(instance)
+
+
+@receiver(post_save, sender=Task)
+def move_task_to_shard(sender, instance, created, **kwargs):
+    # Connected last, so the receivers above see the task where it was saved
+    if not created:
+        relocate_task(instance)
+
+
+@receiver(connection_created)
+def profile_queries(sender, connection, **kwargs):
+    install_query_profiler(connection)
@@ -0,0 +1,87 @@
+from django.core.cache import cache
+from django.db.models import Case, F, Func, IntegerField, Q, Subquery, When
+from django.db.models.functions import Coalesce
+
+from .models import User, TaskCounter, TaskTotal
+from .routers import use_primary
+from .sharding import task_databases, user_databases
+
+STATS_CACHE_TIMEOUT = 300
+
+
+def _aggregate(function, field, condition=None):
+    """``function(field)``, optionally restricted to rows matching ``condition``"""
+    expr = F(field) if condition is None else Case(When(condition, then=F(field)))
+    return Func(expr, function=function, output_field=IntegerField())
+
+
+def _count(condition=None):
+    return _aggregate('COUNT', 'id', condition)
+
+
+def _sum(field, condition=None):
+    return Coalesce(_aggregate('SUM', field, condition), 0)
+
+
+def _cache_key(admin_id=None):
+    if admin_id is None:
+        return 'dashboard_stats:global'
+    return f'dashboard_stats:admin:{admin_id}'
+
+
+def compute_stats(admin=None):
+    """
+    Count users, admins, tasks and completed tasks in a single query.
+
+    Task totals are read from the per-status ``TaskTotal`` rows, or with
+    ``admin`` from the ``TaskCounter`` rows of that admin, with one more
+    query per further shard when tasks are sharded. With ``admin`` the
+    counts are limited to that admin's assigned users and created tasks,
+    and the admin count is left out.
+    """
+    users = User.objects.order_by()
+    totals = {
+        'total_tasks': _sum('count'),
+        'completed_tasks': _sum('count', Q(status='completed')),
+    }
+    counts = dict(totals)
+
+    if admin is not None:
+        users = users.filter(assigned_admin=admin)
+        counters = TaskCounter.objects.order_by().filter(scope='created', user=admin)
+        databases = user_databases(admin)
+    else:
+        counters = TaskTotal.objects.order_by()
+        databases = task_databases()
+        users = users.filter(role='user')
+        admins = User.objects.order_by().filter(role='admin')
+        counts['admin_count'] = Subquery(admins.values(n=_count()))
+
+    counts['user_count'] = Subquery(users.values(n=_count()))
+    # Shards keep a copy of every user, so any of them can count users
+    stats = counters.using(databases[0]).values(**counts)[0]
+    for alias in databases[1:]:
+        for field, total in counters.using(alias).values(**totals)[0].items():
+            stats[field] += total
+    return stats
+
+
+def get_dashboard_stats(user):
+    """Return cached dashboard counters for the scope ``user`` can see"""
+    admin = user if user.is_admin() else None
+    key = _cache_key(admin.pk if admin else None)
+
+    stats = cache.get(key)
+    if stats is None:
+        # Cached past the read-your-writes window, so not from a lagging replica
+        with use_primary():
+            stats = compute_stats(admin)
+        cache.set(key, stats, STATS_CACHE_TIMEOUT)
+    return stats
+
+
+def invalidate_stats(*admin_ids):
+    """Drop the global counters and those of the given admins"""
+    keys = {_cache_key()}
+    keys.update(_cache_key(admin_id) for admin_id in admin_ids if admin_id)
+    cache.delete_many(list(keys))
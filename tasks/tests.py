@@ -1,3 +1,1412 @@
-from django.test import TestCase
+import asyncio
+import csv
+import json
+import os
+import sqlite3
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache, caches
+from django.core.management import CommandError, call_command
+from django.db import OperationalError, connection, connections
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .analytics import _grouped_metrics, hours_distribution
+from .api_views import AsyncAPIView
+from .archive import archive_tasks, restore_tasks
+from .backends.sqlite3.base import DatabaseWrapper
+from .authentication import REVOCATION_CACHE
+from .changes import encode_watermark, task_changes
+from .counters import get_task_counts
+from .deletion import delete_task_rows, start_user_deletion, user_deletions
+from .events import event_stream, get_event_broker
+from .exports import EXPORT_COLUMNS
+from .jobs import JOB_MAX_ATTEMPTS, run_next_job
+from .middleware import CompressionMiddleware
+from .models import (
+    ArchivedTask, BackgroundJob, RevokedToken, Task, TaskCounter, TaskTombstone, TaskTotal, User,
+)
+from .profiling import QUERY_BUCKETS, TIME_BUCKETS, Histogram, _histograms
+from .renderers import FastJSONRenderer
+from .reports import REPORT_CACHE, cached_report, invalidate_reports
+from .revocation import RevocationStore, get_revocation_store
+from .routers import is_pinned
+from .serializers import TaskRowSerializer, TaskSerializer
+from .sharding import assign_shard
+from .stats import compute_stats
+
+
+# Fast password hashing, for the many logins of the tests
+FAST_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
+
+
+class TaskFixtureMixin:
+    """A superadmin, an admin with two users, and helpers to give them tasks"""
+
+    @classmethod
+    def create_users(cls):
+        cls.superadmin = User.objects.create_user('root', 'pw', role='superadmin')
+        cls.admin = User.objects.create_user('admin', 'pw', role='admin')
+        cls.user = User.objects.create_user('user', 'pw', assigned_admin=cls.admin, email='user@example.com')
+        cls.other = User.objects.create_user('other', 'pw', assigned_admin=cls.admin, email='other@example.com')
+
+    def create_tasks(self, count, assigned_to=None, created_by=None, **fields):
+        return [
+            Task.objects.create(**{
+                'title': f'Task {n}', 'description': 'Description', 'due_date': date(2030, 1, 1),
+                'assigned_to': assigned_to or self.user, 'created_by': created_by or self.admin, **fields,
+            })
+            for n in range(count)
+        ]
+
+    def clear_caches(self):
+        """Forget the users, pins, revocations and reports cached by earlier tests"""
+        cache.clear()
+        caches[REVOCATION_CACHE].clear()
+        caches[REPORT_CACHE].clear()
+
+    def api_client(self, user, **kwargs):
+        client = APIClient(**kwargs)
+        response = client.post('/api/login/', {'username': user.username, 'password': 'pw'}, format='json')
+        client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.data['access']}")
+        return client
+
+
+class AsyncEchoView(AsyncAPIView):
+    """An async PUT endpoint for AsyncAPIViewTests, answering with the data sent"""
+
+    async def put(self, request):
+        return self.respond(request.data)
+
+
+# URLconf of AsyncAPIViewTests
+urlpatterns = [
+    path('api/', include('tasks.api_urls')),
+    path('async/echo/', AsyncEchoView.as_view()),
+]
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, ROOT_URLCONF='tasks.tests')
+class AsyncAPIViewTests(TaskFixtureMixin, TestCase):
+    """Async endpoints handle CSRF and request errors like the sync ones"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+
+    def setUp(self):
+        self.clear_caches()
+
+    def test_put_with_token_skips_csrf(self):
+        task, = self.create_tasks(1)
+        client = self.api_client(self.user, enforce_csrf_checks=True)
+        for url in (f'/api/tasks/{task.pk}/', '/async/echo/'):
+            with self.subTest(url=url):
+                response = client.put(url, {'status': 'in_progress'}, format='json')
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.json()['status'], 'in_progress')
+
+    def test_malformed_json_is_a_bad_request(self):
+        task, = self.create_tasks(1)
+        client = self.api_client(self.user)
+        for url in (f'/api/tasks/{task.pk}/', '/async/echo/'):
+            with self.subTest(url=url):
+                response = client.put(url, '{"status": ', content_type='application/json')
+                self.assertEqual(response.status_code, 400)
+                response = client.put(url, 'status', content_type='text/plain')
+                self.assertEqual(response.status_code, 415)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class TaskQueryPlanTests(TaskFixtureMixin, TestCase):
+    """The hot task views read tasks_task through an index, never by a full scan"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+
+    def setUp(self):
+        self.clear_caches()
+        self.create_tasks(5)
+        self.create_tasks(5, assigned_to=self.other, status='completed', completion_report='Done')
+
+    def task_queries(self, get):
+        """The tasks_task queries ``get()`` runs"""
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(get().status_code, 200)
+        return [
+            query['sql'] for query in queries.captured_queries
+            if query['sql'].startswith('SELECT') and '"tasks_task"' in query['sql']
+        ]
+
+    def assert_no_task_scan(self, get):
+        queries = self.task_queries(get)
+        self.assertTrue(queries, 'the view ran no task query')
+        for sql in queries:
+            with connection.cursor() as cursor:
+                # The captured SQL has its parameters inlined already
+                cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+                plan = [row[-1] for row in cursor.fetchall()]
+            with self.subTest(sql=sql):
+                # "SCAN tasks_task USING INDEX ..." walks an index in order; a
+                # bare "SCAN tasks_task" reads the whole table
+                self.assertNotIn('SCAN tasks_task', plan, plan)
+
+    def test_user_task_list(self):
+        client = self.api_client(self.user)
+        self.assert_no_task_scan(lambda: client.get('/api/tasks/'))
+
+    def test_admin_pages(self):
+        for user in (self.admin, self.superadmin):
+            self.client.force_login(user)
+            for url in ('/admin-panel/tasks/', '/admin-panel/tasks/?status=pending', '/admin-panel/reports/'):
+                with self.subTest(user=user.username, url=url):
+                    self.assert_no_task_scan(lambda: self.client.get(url))
+
+    def test_dashboard_reads_counters(self):
+        for user in (self.admin, self.superadmin):
+            self.client.force_login(user)
+            with self.subTest(user=user.username):
+                self.assertEqual(self.task_queries(lambda: self.client.get('/admin-panel/')), [])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class AdminPageQueryCountTests(TaskFixtureMixin, TestCase):
+    """Admin panel pages run as many queries for 3 rows as for a full page"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+
+    def pages(self):
+        # (user, url, queries), counting the session and user lookups
+        return [
+            (self.admin, '/admin-panel/', 3),
+            (self.admin, '/admin-panel/tasks/', 5),
+            (self.admin, '/admin-panel/reports/', 6),
+            (self.superadmin, '/admin-panel/', 3),
+            (self.superadmin, '/admin-panel/tasks/', 5),
+            (self.superadmin, '/admin-panel/reports/', 6),
+            (self.superadmin, f'/admin-panel/users/{self.user.pk}/view/', 5),
+            (self.superadmin, f'/admin-panel/users/{self.admin.pk}/view/', 6),
+        ]
+
+    def test_query_counts_do_not_grow_with_rows(self):
+        for rows in (3, 15):
+            missing = rows - Task.objects.filter(assigned_to=self.user).count()
+            self.create_tasks(missing)
+            self.create_tasks(missing, assigned_to=self.other, status='completed', completion_report='Done')
+            for user, url, queries in self.pages():
+                self.client.force_login(user)
+                # Dashboard stats would otherwise come from the cache
+                cache.clear()
+                with self.subTest(rows=rows, user=user.username, url=url):
+                    with self.assertNumQueries(queries):
+                        self.assertEqual(self.client.get(url).status_code, 200)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class TaskPagePermissionTests(TaskFixtureMixin, TestCase):
+    """Admins reach the pages of the tasks they created; missing tasks are 404 for everyone"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+        cls.other_admin = User.objects.create_user('other_admin', 'pw', role='admin')
+
+    def setUp(self):
+        self.task, = self.create_tasks(1)
+        self.missing_id = self.task.pk + 1000
+
+    def test_task_pages(self):
+        for suffix in ('', 'edit/', 'delete/'):
+            url = f'/admin-panel/tasks/{self.task.pk}/{suffix}'
+            for user in (self.admin, self.superadmin):
+                with self.subTest(url=url, user=user.username):
+                    self.client.force_login(user)
+                    self.assertEqual(self.client.get(url).status_code, 200)
+            with self.subTest(url=url, user=self.other_admin.username):
+                self.client.force_login(self.other_admin)
+                response = self.client.get(url, follow=True)
+                self.assertRedirects(response, '/admin-panel/tasks/')
+                self.assertEqual([str(message) for message in response.context['messages']], ['Access denied'])
+
+    def test_missing_task_is_not_found(self):
+        for user in (self.admin, self.superadmin):
+            for suffix in ('', 'edit/', 'delete/'):
+                url = f'/admin-panel/tasks/{self.missing_id}/{suffix}'
+                with self.subTest(url=url, user=user.username):
+                    self.client.force_login(user)
+                    self.assertEqual(self.client.get(url).status_code, 404)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class TaskPaginationTests(TaskFixtureMixin, TestCase):
+    """The task list pages by (created_at, id) cursors, newest first"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+
+    def setUp(self):
+        self.clear_caches()
+
+    def pages(self, client, page_size):
+        pages, url = [], f'/api/tasks/?page_size={page_size}'
+        while url:
+            body = client.get(url).json()
+            pages.append([task['id'] for task in body['results']])
+            url = body['next']
+        return pages
+
+    def test_pages_through_equal_created_at(self):
+        tasks = self.create_tasks(5)
+        Task.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        ids = sorted((task.pk for task in tasks), reverse=True)
+        client = self.api_client(self.user)
+        self.assertEqual(self.pages(client, 2), [ids[:2], ids[2:4], ids[4:]])
+
+    def test_newest_first_across_created_at(self):
+        older, newer = self.create_tasks(2)
+        Task.objects.filter(pk=older.pk).update(created_at=timezone.now() - timedelta(days=1))
+        Task.objects.filter(pk=newer.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        client = self.api_client(self.user)
+        self.assertEqual(self.pages(client, 1), [[newer.pk], [older.pk]])
+
+    def test_invalid_cursor_is_not_found(self):
+        self.create_tasks(1)
+        client = self.api_client(self.user)
+        for cursor in ('nonsense', 'Yz1ub3QtYS1kYXRlJmk9MQ==', '\u00e9'):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(client.get('/api/tasks/', {'cursor': cursor}).status_code, 404)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class ConditionalGetTests(TaskFixtureMixin, TestCase):
+    """Unchanged tasks are answered with a 304 from one lightweight query"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+
+    def setUp(self):
+        self.clear_caches()
+
+    def assert_not_modified(self, client, url, etag, queries=1):
+        with self.assertNumQueries(queries):
+            response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_user_task_list(self):
+        self.create_tasks(3)
+        client = self.api_client(self.user)
+        url = '/api/tasks/'
+        self.assert_not_modified(client, url, client.get(url)['ETag'])
+
+    def test_renaming_a_creator_changes_the_etag(self):
+        self.create_tasks(2)
+        client = self.api_client(self.user)
+        etag = client.get('/api/tasks/')['ETag']
+        self.admin.username = 'renamed_admin'
+        self.admin.save()
+        response = client.get('/api/tasks/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({task['created_by_name'] for task in response.json()['results']}, {'renamed_admin'})
+        self.assert_not_modified(client, '/api/tasks/', response['ETag'])
+
+    def test_task_report(self):
+        task, = self.create_tasks(1, status='completed', completion_report='Done')
+        client = self.api_client(self.admin)
+        url = f'/api/tasks/{task.pk}/report/'
+        etag = client.get(url)['ETag']
+        with self.subTest(cached=True):
+            # The cached report carries its validators
+            self.assert_not_modified(client, url, etag, queries=0)
+        invalidate_reports(task.pk)
+        with self.subTest(cached=False):
+            self.assert_not_modified(client, url, etag)
+
+    def test_task_list_has_no_last_modified(self):
+        first, second = self.create_tasks(2)
+        client = self.api_client(self.user)
+        response = client.get('/api/tasks/')
+        self.assertNotIn('Last-Modified', response)
+        # Deleting the older task leaves Max(updated_at) where it was
+        first.delete()
+        response = client.get('/api/tasks/', HTTP_IF_MODIFIED_SINCE='Fri, 01 Jan 2100 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([task['id'] for task in response.json()['results']], [second.pk])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, READ_REPLICAS=['test_replica'])
+class ReplicaRoutingTests(TaskFixtureMixin, TransactionTestCase):
+    """GET requests read from the replica unless their user just wrote"""
+    # The replica mirrors the test database, which only shows it committed rows
+    databases = {'default', 'test_replica'}
+
+    def setUp(self):
+        self.create_users()
+        self.task, = self.create_tasks(1)
+        self.client_api = self.api_client(self.user)
+        # Logging in is a POST, which pins to the primary like any write
+        self.clear_caches()
+
+    def query_counts(self, request):
+        """The status of ``request()`` and how many queries the primary and the replica ran"""
+        with CaptureQueriesContext(connections['default']) as primary:
+            with CaptureQueriesContext(connections['test_replica']) as replica:
+                response = request()
+        return response.status_code, len(primary), len(replica)
+
+    def test_get_reads_from_replica(self):
+        status, primary, replica = self.query_counts(lambda: self.client_api.get('/api/tasks/'))
+        self.assertEqual(status, 200)
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+
+    def test_write_pins_user_to_primary(self):
+        status, _, replica = self.query_counts(
+            lambda: self.client_api.put(f'/api/tasks/{self.task.pk}/', {'status': 'in_progress'}, format='json')
+        )
+        self.assertEqual((status, replica), (200, 0))
+        self.assertTrue(is_pinned([f'user:{self.user.pk}']))
+        status, primary, replica = self.query_counts(lambda: self.client_api.get('/api/tasks/'))
+        self.assertEqual((status, replica), (200, 0))
+        self.assertGreater(primary, 0)
+
+        # Once the pin has run out, reads go back to the replica
+        cache.clear()
+        status, primary, _ = self.query_counts(lambda: self.client_api.get('/api/tasks/'))
+        self.assertEqual((status, primary), (200, 0))
+
+    @override_settings(READ_REPLICAS=[])
+    def test_no_pin_without_replicas(self):
+        response = self.client_api.put(f'/api/tasks/{self.task.pk}/', {'status': 'in_progress'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(is_pinned([f'user:{self.user.pk}']))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, TASK_SHARDS=['test_shard1', 'test_shard2'])
+class ShardingTests(TaskFixtureMixin, TransactionTestCase):
+    """Tasks live in the shard of their admin and follow their user around"""
+    databases = {'default', 'test_shard1', 'test_shard2'}
+
+    def setUp(self):
+        self.clear_caches()
+        self.create_users()
+        self.other_admin = User.objects.create_user('admin2', 'pw', role='admin')
+        assign_shard(self.admin.pk, 'test_shard1')
+        assign_shard(self.other_admin.pk, 'test_shard2')
+        self.other.assigned_admin = self.other_admin
+        self.other.save()
+
+    def shards_of(self, task):
+        return [alias for alias in sorted(self.databases) if Task.objects.using(alias).filter(pk=task.pk).exists()]
+
+    def test_tasks_are_stored_in_their_admins_shard(self):
+        task, = self.create_tasks(1)
+        other_task, = self.create_tasks(1, assigned_to=self.other, created_by=self.other_admin)
+        self.assertEqual(self.shards_of(task), ['test_shard1'])
+        self.assertEqual(self.shards_of(other_task), ['test_shard2'])
+        # Each shard has the users its task foreign keys point to
+        self.assertTrue(User.objects.using('test_shard2').filter(pk=self.other.pk).exists())
+        call_command('rebuild_task_counters', '--verify', stdout=StringIO())
+
+    def test_api_reads_and_writes_the_users_shard(self):
+        task, = self.create_tasks(1)
+        self.create_tasks(1, assigned_to=self.other, created_by=self.other_admin)
+        client = self.api_client(self.user)
+        response = client.get('/api/tasks/')
+        self.assertEqual([row['id'] for row in response.json()['results']], [task.pk])
+        response = client.put(f'/api/tasks/{task.pk}/', {'status': 'in_progress'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Task.objects.using('test_shard1').get(pk=task.pk).status, 'in_progress')
+
+    def test_superadmin_sees_every_shard(self):
+        tasks = self.create_tasks(2) + self.create_tasks(2, assigned_to=self.other, created_by=self.other_admin)
+        self.client.force_login(self.superadmin)
+        response = self.client.get('/admin-panel/tasks/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(task.pk for task in response.context['page_obj']), sorted(task.pk for task in tasks)
+        )
+        client = self.api_client(self.superadmin)
+        response = client.get(f'/api/tasks/{tasks[-1].pk}/report/')
+        # Found in the second shard, and refused only because it isn't completed
+        self.assertEqual(response.status_code, 400)
+
+    def test_other_shards_tasks_are_denied_not_missing(self):
+        other_task, = self.create_tasks(1, assigned_to=self.other, created_by=self.other_admin)
+        self.client.force_login(self.admin)
+        response = self.client.get(f'/admin-panel/tasks/{other_task.pk}/', follow=True)
+        self.assertRedirects(response, '/admin-panel/tasks/')
+        self.assertEqual([str(message) for message in response.context['messages']], ['Access denied'])
+        self.assertEqual(self.client.get(f'/admin-panel/tasks/{other_task.pk + 1000}/').status_code, 404)
+
+    def test_tasks_move_with_their_user(self):
+        task, = self.create_tasks(1)
+        self.user.assigned_admin = self.other_admin
+        self.user.save()
+        self.assertEqual(self.shards_of(task), ['test_shard2'])
+        call_command('rebuild_task_counters', '--verify', stdout=StringIO())
+        response = self.api_client(self.user).get('/api/tasks/')
+        self.assertEqual([row['id'] for row in response.json()['results']], [task.pk])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class TokenRevocationTests(TaskFixtureMixin, TestCase):
+    """Tokens issued before a user change stay revoked however busy the caches are"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+
+    def setUp(self):
+        self.clear_caches()
+
+    def test_revocation_survives_cache_culling(self):
+        client = self.api_client(self.user)
+        self.user.is_active = False
+        self.user.save()
+        # Enough entries for the default cache to cull its oldest ones
+        cache.set_many({f'filler:{n}': n for n in range(1000)})
+        for url in ('/api/tasks/', '/api/tasks/events/'):
+            with self.subTest(url=url):
+                self.assertEqual(client.get(url).status_code, 401)
+
+    def refresh(self, token):
+        return self.client.post('/api/token/refresh/', {'refresh': token}, content_type='application/json')
+
+    def test_rotated_refresh_token_is_rejected(self):
+        response = self.client.post('/api/login/', {'username': 'user', 'password': 'pw'}, content_type='application/json')
+        first = response.json()['refresh']
+        response = self.refresh(first)
+        self.assertEqual(response.status_code, 200)
+        second = response.json()['refresh']
+        self.assertEqual(self.refresh(first).status_code, 401)
+
+        # Other processes see the revocation once it is written
+        get_revocation_store().flush()
+        jti = RefreshToken(second, verify=False)['jti']
+        self.assertEqual(self.refresh(second).status_code, 200)
+        get_revocation_store().flush()
+        self.assertTrue(RevocationStore().is_revoked(jti))
+
+    def test_bloom_filter_false_positives_are_checked_in_the_database(self):
+        store = RevocationStore()
+        RevokedToken.objects.create(jti='revoked', expires_at=timezone.now() + timedelta(days=1))
+        RevokedToken.objects.create(jti='expired', expires_at=timezone.now() - timedelta(days=1))
+        store.flush()
+        with self.assertNumQueries(0):
+            self.assertFalse(store.is_revoked('never revoked'))
+        # A saturated filter reports every JTI as possibly revoked
+        store._bloom.bits = bytearray(b'\xff' * len(store._bloom.bits))
+        with self.assertNumQueries(1):
+            self.assertFalse(store.is_revoked('never revoked'))
+        self.assertTrue(store.is_revoked('revoked'))
+        self.assertFalse(store.is_revoked('expired'))
+        # Revocations not written yet are answered from memory
+        store.revoke('pending', timezone.now() + timedelta(days=1))
+        with self.assertNumQueries(0):
+            self.assertTrue(store.is_revoked('pending'))
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class CompressionTests(TaskFixtureMixin, TestCase):
+    """Large API responses are compressed with the best encoding the client accepts, admin panel pages are not"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+
+    def setUp(self):
+        self.clear_caches()
+        self.create_tasks(20)
+
+    def test_api_responses_are_compressed(self):
+        client = self.api_client(self.user)
+        for encoding in ('br', 'gzip'):
+            with self.subTest(encoding=encoding):
+                response = client.get('/api/tasks/', HTTP_ACCEPT_ENCODING=encoding)
+                self.assertEqual(response['Content-Encoding'], encoding)
+
+    def test_admin_panel_is_not_compressed(self):
+        self.client.force_login(self.admin)
+        for url in ('/admin-panel/', '/admin-panel/tasks/'):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_ACCEPT_ENCODING='br, gzip')
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.has_header('Content-Encoding'))
+
+    def compress(self, response, accept_encoding='br, gzip'):
+        request = RequestFactory().get('/api/tasks/', HTTP_ACCEPT_ENCODING=accept_encoding)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_skips_small_encoded_and_incompressible_bodies(self):
+        compressible = b'{"title": "Task"}' * 100
+        encoded = HttpResponse(compressible)
+        encoded['Content-Encoding'] = 'identity'
+        for name, response in (
+            ('small', HttpResponse(b'{"title": "Task"}')),
+            ('encoded', encoded),
+            ('incompressible', HttpResponse(os.urandom(4096))),
+        ):
+            with self.subTest(name):
+                content = response.content
+                response = self.compress(response)
+                self.assertEqual(response.content, content)
+                self.assertNotEqual(response.get('Content-Encoding'), 'br')
+
+    def test_negotiates_the_encoding(self):
+        for accept_encoding, encoding in (
+            ('gzip, br', 'br'), ('gzip, br;q=0', 'gzip'), ('identity', None), ('', None),
+        ):
+            with self.subTest(accept_encoding=accept_encoding):
+                response = HttpResponse(b'{"title": "Task"}' * 100)
+                response['ETag'] = '"tasks"'
+                response = self.compress(response, accept_encoding)
+                self.assertEqual(response.get('Content-Encoding'), encoding)
+                # The ETag is only weakened when the bytes sent change
+                self.assertEqual(response['ETag'], 'W/"tasks"' if encoding else '"tasks"')
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class ProfilingTests(TaskFixtureMixin, TestCase):
+    """Every request's latency and query count is recorded per URL name"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+
+    def setUp(self):
+        self.clear_caches()
+        self.create_tasks(3)
+        _histograms.clear()
+        self.addCleanup(_histograms.clear)
+
+    def test_histogram_quantiles(self):
+        queries = Histogram(QUERY_BUCKETS, interpolate=False)
+        self.assertIsNone(queries.quantile(0.5))
+        for count in range(1, 11):
+            queries.observe(count)
+        self.assertEqual((queries.quantile(0.5), queries.quantile(0.95)), (5, 10))
+        durations = Histogram(TIME_BUCKETS)
+        for _ in range(100):
+            durations.observe(0.01)
+        # Interpolated within the bucket holding 10 ms
+        self.assertTrue(0.008 < durations.quantile(0.5) <= durations.quantile(0.99) < 0.0127)
+
+    def test_report_counts_requests_and_queries(self):
+        client = self.api_client(self.user)
+        with CaptureQueriesContext(connection) as queries:
+            client.get('/api/tasks/')
+        # Read now: the next request clears the connection's query log
+        query_count = len(queries)
+        client.get('/api/tasks/')
+        report = self.api_client(self.superadmin).get('/api/profiling/').json()['views']['get_user_tasks']
+        self.assertEqual(report['count'], 2)
+        self.assertEqual(report['queries']['p99'], query_count)
+        self.assertGreater(report['duration_ms']['p50'], 0)
+        self.assertGreater(report['serialize_ms']['mean'], 0)
+
+        metrics = self.api_client(self.superadmin).get('/api/profiling/metrics/').content.decode()
+        self.assertIn('http_request_queries_count{view="get_user_tasks"} 2\n', metrics)
+
+    def test_superadmins_only(self):
+        for url in ('/api/profiling/', '/api/profiling/metrics/'):
+            with self.subTest(url=url):
+                self.assertEqual(self.api_client(self.admin).get(url).status_code, 403)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class TaskArchiveTests(TaskFixtureMixin, TestCase):
+    """Archiving moves old completed tasks out of the live table and reports still list them"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+
+    def setUp(self):
+        self.clear_caches()
+        self.create_tasks(3)
+        self.completed = self.create_tasks(25, assigned_to=self.other, status='completed', completion_report='Done')
+        # Every other completed task was last changed long ago
+        self.old = self.completed[::2]
+        Task.objects.filter(id__in=[task.pk for task in self.old]).update(
+            updated_at=timezone.now() - timedelta(days=365),
+        )
+
+    def assert_counters_correct(self):
+        call_command('rebuild_task_counters', '--verify', stdout=StringIO())
+
+    def report_ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [task.id for task in response.context['page_obj']]
+
+    def test_archive_and_restore(self):
+        counts = get_task_counts(self.other, 'assigned')
+        self.assertEqual(archive_tasks(batch_size=5), len(self.old))
+        self.assertEqual(
+            sorted(ArchivedTask.objects.values_list('id', flat=True)),
+            [task.pk for task in self.old],
+        )
+        self.assertFalse(Task.objects.filter(id__in=[task.pk for task in self.old]).exists())
+        self.assertEqual(Task.objects.count(), 3 + len(self.completed) - len(self.old))
+        # Archived tasks still count, and the counters still match the rows
+        self.assertEqual(get_task_counts(self.other, 'assigned'), counts)
+        self.assert_counters_correct()
+
+        restored = self.old[:2]
+        self.assertEqual(restore_tasks([task.pk for task in restored]), 2)
+        self.assertEqual(ArchivedTask.objects.count(), len(self.old) - 2)
+        self.assertEqual(restore_tasks(), len(self.old) - 2)
+        self.assertFalse(ArchivedTask.objects.exists())
+        self.assertEqual(Task.objects.count(), 3 + len(self.completed))
+        self.assertEqual(get_task_counts(self.other, 'assigned'), counts)
+        self.assert_counters_correct()
+
+    def test_reports_list_live_and_archived_tasks(self):
+        archive_tasks()
+        expected = [task.pk for task in sorted(self.completed, key=lambda task: (task.created_at, task.pk), reverse=True)]
+        for user in (self.admin, self.superadmin):
+            self.client.force_login(user)
+            for search in ('', 'task'):
+                with self.subTest(user=user.username, search=search):
+                    pages = [self.report_ids(f'/admin-panel/reports/?page={page}&search={search}') for page in (1, 2, 3)]
+                    self.assertEqual([len(page) for page in pages], [10, 10, 5])
+                    if not search:
+                        self.assertEqual(sum(pages, []), expected)
+                    else:
+                        self.assertCountEqual(sum(pages, []), expected)
+        self.client.force_login(User.objects.create_user('admin2', 'pw', role='admin'))
+        self.assertEqual(self.report_ids('/admin-panel/reports/'), [])
+
+    def test_deep_report_pages_are_sliced_in_sql(self):
+        archive_tasks()
+        self.client.force_login(self.admin)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(len(self.report_ids('/admin-panel/reports/?page=3')), 5)
+        sql = [query['sql'] for query in queries.captured_queries]
+        self.assertTrue(any('UNION ALL' in query and 'OFFSET 20' in query for query in sql), sql)
+        # No query reads the rows of the pages before
+        self.assertFalse([query for query in sql if 'LIMIT 30' in query or 'LIMIT 25' in query], sql)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class TaskReportCacheTests(TaskFixtureMixin, TestCase):
+    """Reports of completed tasks are served from the cache until their task or assignee changes"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+
+    def setUp(self):
+        self.clear_caches()
+        self.task, = self.create_tasks(1, status='completed', completion_report='Done')
+        self.url = f'/api/tasks/{self.task.pk}/report/'
+        self.api = self.api_client(self.admin)
+
+    def test_cache_hits_make_no_query(self):
+        first = self.api.get(self.url).json()
+        with self.assertNumQueries(0):
+            response = self.api.get(self.url)
+        self.assertEqual(response.json(), first)
+
+    def test_task_and_assignee_changes_invalidate(self):
+        self.api.get(self.url)
+        self.task.completion_report = 'Done twice'
+        self.task.save()
+        self.assertEqual(self.api.get(self.url).json()['completion_report'], 'Done twice')
+        self.user.username = 'renamed'
+        self.user.save()
+        self.assertEqual(self.api.get(self.url).json()['assigned_to_name'], 'renamed')
+
+    def test_permissions_are_checked_on_cache_hits(self):
+        self.api.get(self.url)
+        other_admin = User.objects.create_user('other_admin', 'pw', role='admin')
+        self.assertEqual(self.api_client(other_admin).get(self.url).status_code, 403)
+
+    def test_unfinished_tasks_are_not_cached(self):
+        task, = self.create_tasks(1)
+        url = f'/api/tasks/{task.pk}/report/'
+        self.assertEqual(self.api.get(url).status_code, 400)
+        self.assertIsNone(cached_report(task.pk))
+        Task.objects.filter(pk=task.pk).update(status='completed', completion_report='Done')
+        self.assertEqual(self.api.get(url).json()['completion_report'], 'Done')
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class TaskExportTests(TaskFixtureMixin, TestCase):
+    """Exports stream the reports an admin may see, live and archived, as CSV or NDJSON"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+        cls.other_admin = User.objects.create_user('other_admin', 'pw', role='admin')
+
+    def setUp(self):
+        self.clear_caches()
+        self.live, self.archived = self.create_tasks(
+            2, status='completed', completion_report='Done', worked_hours=Decimal('2.50'),
+        )
+        Task.objects.filter(pk=self.archived.pk).update(updated_at=timezone.now() - timedelta(days=365))
+        archive_tasks()
+        self.create_tasks(1)
+        self.create_tasks(1, assigned_to=self.other, created_by=self.other_admin, status='completed')
+
+    def export(self, user, export_format, **params):
+        self.client.force_login(user)
+        response = self.client.get(f'/admin-panel/reports/export/{export_format}/', params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_csv(self):
+        header, *rows = csv.reader(self.export(self.admin, 'csv').splitlines())
+        self.assertEqual(header, [name for name, _ in EXPORT_COLUMNS])
+        rows = sorted((dict(zip(header, row)) for row in rows), key=lambda row: int(row['id']))
+        self.assertEqual([row['id'] for row in rows], [str(self.live.pk), str(self.archived.pk)])
+        self.assertEqual(
+            {name: rows[0][name] for name in ('assigned_to_name', 'assigned_to_email', 'created_by_name')},
+            {'assigned_to_name': 'user', 'assigned_to_email': 'user@example.com', 'created_by_name': 'admin'},
+        )
+        self.assertEqual(
+            [(row['status'], row['due_date'], row['completion_report'], row['worked_hours']) for row in rows],
+            [('completed', '2030-01-01', 'Done', '2.50')] * 2,
+        )
+
+    def test_ndjson(self):
+        rows = [json.loads(line) for line in self.export(self.admin, 'ndjson').splitlines()]
+        self.assertEqual(sorted(row['id'] for row in rows), [self.live.pk, self.archived.pk])
+        row = next(row for row in rows if row['id'] == self.live.pk)
+        self.assertEqual(list(row), [name for name, _ in EXPORT_COLUMNS])
+        self.assertEqual((row['worked_hours'], row['due_date']), ('2.50', '2030-01-01'))
+        self.assertTrue(row['updated_at'].endswith('Z'))
+
+    def test_scoped_to_the_user(self):
+        other_task = Task.objects.get(created_by=self.other_admin)
+        for user, ids in (
+            (self.other_admin, [other_task.pk]),
+            (self.superadmin, [self.live.pk, self.archived.pk, other_task.pk]),
+        ):
+            with self.subTest(user=user.username):
+                rows = [json.loads(line) for line in self.export(user, 'ndjson').splitlines()]
+                self.assertEqual(sorted(row['id'] for row in rows), ids)
+
+    def test_filters(self):
+        self.assertEqual(self.export(self.admin, 'ndjson', status='pending').count('\n'), 1)
+        # The archived report was last changed a year ago
+        since = (timezone.now() - timedelta(days=30)).date().isoformat()
+        rows = [json.loads(line) for line in self.export(self.admin, 'ndjson', **{'from': since}).splitlines()]
+        self.assertEqual([row['id'] for row in rows], [self.live.pk])
+        self.client.force_login(self.admin)
+        self.assertEqual(self.client.get('/admin-panel/reports/export/csv/', {'to': 'soon'}).status_code, 400)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class TaskSearchTests(TaskFixtureMixin, TestCase):
+    """Admin panel search matches word prefixes, ranks by relevance and keeps to the admin's tasks"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+        cls.admin2 = User.objects.create_user('admin2', 'pw', role='admin')
+        cls.user2 = User.objects.create_user('user2', 'pw', assigned_admin=cls.admin2)
+
+    def setUp(self):
+        self.clear_caches()
+
+    def create_task(self, title, **fields):
+        task, = self.create_tasks(1, title=title, **fields)
+        return task
+
+    def search(self, user, query):
+        self.client.force_login(user)
+        response = self.client.get('/admin-panel/tasks/', {'search': query})
+        self.assertEqual(response.status_code, 200)
+        return [task.title for task in response.context['page_obj']]
+
+    def test_matches_word_prefixes_of_title_and_assignee(self):
+        self.create_task('Quarterly budget review')
+        self.create_task('Budgeting workshop', assigned_to=self.other)
+        self.create_task('Office move')
+        self.assertCountEqual(self.search(self.admin, 'budg'), ['Quarterly budget review', 'Budgeting workshop'])
+        self.assertEqual(self.search(self.admin, 'budget rev'), ['Quarterly budget review'])
+        self.assertEqual(self.search(self.admin, 'othe'), ['Budgeting workshop'])
+        self.assertEqual(self.search(self.admin, 'udget'), [])
+        self.assertEqual(self.search(self.admin, '!!'), [])
+
+    def test_orders_by_rank(self):
+        self.create_task('Deploy the release after the review of every open item')
+        self.create_task('Deploy, deploy')
+        self.assertEqual(
+            self.search(self.admin, 'deploy'),
+            ['Deploy, deploy', 'Deploy the release after the review of every open item'],
+        )
+
+    def test_keeps_to_the_tasks_a_user_may_see(self):
+        self.create_task('Inventory count')
+        self.create_task('Inventory audit', assigned_to=self.user2, created_by=self.admin2)
+        self.assertEqual(self.search(self.admin, 'inventory'), ['Inventory count'])
+        self.assertEqual(self.search(self.admin2, 'inventory'), ['Inventory audit'])
+        self.assertCountEqual(self.search(self.superadmin, 'inventory'), ['Inventory count', 'Inventory audit'])
+
+    def test_index_follows_title_and_assignee(self):
+        task = self.create_task('Plan offsite')
+        # A status change leaves the search row alone
+        task.status = 'in_progress'
+        for save in (task.save, lambda: Task.objects.get(pk=task.pk).save(update_fields=['status'])):
+            with CaptureQueriesContext(connection) as queries:
+                save()
+            self.assertFalse([query for query in queries.captured_queries if '_fts' in query['sql']])
+
+        task.title = 'Plan retreat'
+        task.save()
+        self.assertEqual(self.search(self.admin, 'retreat'), ['Plan retreat'])
+        self.assertEqual(self.search(self.admin, 'offsite'), [])
+
+        task = Task.objects.get(pk=task.pk)
+        task.assigned_to = self.other
+        task.save()
+        self.assertEqual(self.search(self.admin, 'other'), ['Plan retreat'])
+        self.other.username = 'renamed'
+        self.other.save()
+        self.assertEqual(self.search(self.admin, 'renamed'), ['Plan retreat'])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class TaskAnalyticsTests(TaskFixtureMixin, TestCase):
+    """Analytics counts, totals and worked-hours percentiles of a small, known set of tasks"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+
+    def setUp(self):
+        self.clear_caches()
+        for hours in (1, 2, 3, 4):
+            self.create_tasks(1, status='completed', worked_hours=hours)
+        self.create_tasks(1, assigned_to=self.other, status='completed', worked_hours=10)
+        self.create_tasks(1, assigned_to=self.other, status='completed')
+        self.create_tasks(1, assigned_to=self.other, due_date=date(2020, 1, 1))
+
+    def test_grouped_metrics(self):
+        rows = _grouped_metrics(Task.objects.all(), F('assigned_to_id'), ['key', 'assigned_to__username'])
+        self.assertEqual(rows, [
+            {
+                'key': self.user.pk, 'assigned_to__username': 'user', 'total_tasks': 4,
+                'completed_tasks': 4, 'overdue_tasks': 0, 'reported_tasks': 4, 'total_hours': 10.0,
+            },
+            {
+                'key': self.other.pk, 'assigned_to__username': 'other', 'total_tasks': 3,
+                'completed_tasks': 2, 'overdue_tasks': 1, 'reported_tasks': 1, 'total_hours': 10.0,
+            },
+        ])
+
+    def test_hours_distribution(self):
+        by_group, summary = hours_distribution(Task.objects.all(), 'assigned_to_id')
+        self.assertEqual(by_group, {
+            self.user.pk: {'p50': 2.5, 'p90': 3.7, 'p95': 3.85, 'p99': 3.97},
+            self.other.pk: {'p50': 10.0, 'p90': 10.0, 'p95': 10.0, 'p99': 10.0},
+        })
+        self.assertEqual(summary['percentiles'], {'p50': 3.0, 'p90': 7.6, 'p95': 8.8, 'p99': 9.76})
+        self.assertEqual(summary['histogram'], {
+            'edges': [1.0, 1.9, 2.8, 3.7, 4.6, 5.5, 6.4, 7.3, 8.2, 9.1, 10.0],
+            'counts': [1, 1, 1, 1, 0, 0, 0, 0, 0, 1],
+        })
+        self.assertEqual(hours_distribution(Task.objects.filter(status='pending'), 'assigned_to_id'), ({}, None))
+
+    def test_report_reads_archived_tasks(self):
+        client = self.api_client(self.admin)
+        before = client.get('/api/tasks/reports/analytics/', {'group_by': 'status'}).json()
+        Task.objects.filter(status='completed').update(updated_at=timezone.now() - timedelta(days=365))
+        self.assertEqual(archive_tasks(), 6)
+        after = client.get('/api/tasks/reports/analytics/', {'group_by': 'status'}).json()
+        self.assertEqual(after, before)
+        self.assertEqual(after['summary']['total_hours'], 20.0)
+        self.assertEqual(
+            [(group['key'], group['total_tasks'], group['p50']) for group in after['groups']],
+            [('completed', 6, 3.0), ('pending', 1, None)],
+        )
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class TaskCounterTests(TaskFixtureMixin, TestCase):
+    """Task counters and totals follow every write and can be verified and rebuilt"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+
+    def setUp(self):
+        self.clear_caches()
+
+    def verify(self):
+        call_command('rebuild_task_counters', '--verify', stdout=StringIO())
+
+    def assert_counts(self, user, scope, **counts):
+        expected = {'pending': 0, 'in_progress': 0, 'completed': 0, **counts}
+        expected['total'] = sum(expected.values())
+        self.assertEqual(get_task_counts(user, scope), expected)
+
+    def test_status_transitions(self):
+        first, second, third = self.create_tasks(3)
+        self.assert_counts(self.user, 'assigned', pending=3)
+        client = self.api_client(self.user)
+        # The task, its counters and totals: one F() update and one upsert each
+        with self.assertNumQueries(8):
+            response = client.put(f'/api/tasks/{first.pk}/', {'status': 'in_progress'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        client.put(f'/api/tasks/{second.pk}/', {'status': 'completed'}, format='json')
+        second.refresh_from_db()
+        second.status = 'pending'
+        second.save()
+        third.status = 'completed'
+        third.save()
+        self.assert_counts(self.user, 'assigned', pending=1, in_progress=1, completed=1)
+        self.assert_counts(self.admin, 'created', pending=1, in_progress=1, completed=1)
+        self.assertEqual(compute_stats()['total_tasks'], 3)
+        self.assertEqual(compute_stats()['completed_tasks'], 1)
+        self.verify()
+
+    def test_reassignment_and_deletes(self):
+        first, second = self.create_tasks(2, status='completed')
+        first.assigned_to = self.other
+        first.save()
+        self.assert_counts(self.user, 'assigned', completed=1)
+        self.assert_counts(self.other, 'assigned', completed=1)
+        second.delete()
+        self.assert_counts(self.user, 'assigned')
+        self.assert_counts(self.admin, 'created', completed=1)
+        self.assertEqual(compute_stats()['total_tasks'], 1)
+        self.verify()
+
+    def test_superadmin_totals_are_one_read(self):
+        for n in range(3):
+            admin = User.objects.create_user(f'admin{n}', 'pw', role='admin')
+            self.create_tasks(2, created_by=admin, status='completed')
+        self.create_tasks(1)
+        # The counts of users and admins, and the totals, in one query
+        with self.assertNumQueries(1):
+            stats = compute_stats()
+        self.assertEqual((stats['total_tasks'], stats['completed_tasks']), (7, 6))
+        self.assertEqual(compute_stats(self.admin)['total_tasks'], 1)
+
+    def test_verify_reports_drift_and_rebuild_fixes_it(self):
+        self.create_tasks(2)
+        TaskCounter.objects.filter(user=self.user, status='pending').update(count=F('count') + 5)
+        TaskTotal.objects.filter(status='pending').update(count=0)
+        out = StringIO()
+        with self.assertRaisesMessage(CommandError, '2 task counters are out of date'):
+            call_command('rebuild_task_counters', '--verify', stdout=out)
+        self.assertIn(f'user={self.user.pk} scope=assigned status=pending: stored 7, expected 2', out.getvalue())
+        self.assertIn('total status=pending: stored 0, expected 2', out.getvalue())
+
+        call_command('rebuild_task_counters', stdout=StringIO())
+        self.verify()
+        self.assert_counts(self.user, 'assigned', pending=2)
+        self.assertEqual(compute_stats()['total_tasks'], 2)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class TaskRowSerializerTests(TaskFixtureMixin, TestCase):
+    """TaskRowSerializer and FastJSONRenderer write the bytes TaskSerializer and JSONRenderer do"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+        cls.other.username = 'ötzi_日本'
+        cls.other.save()
+
+    def setUp(self):
+        self.clear_caches()
+        self.create_tasks(1, title='Café ☕ "quoted" \\ back', description='Ünïcode 😀\nnew line')
+        self.create_tasks(
+            1, assigned_to=self.other, title='Line\u2028and paragraph\u2029separators', status='completed',
+            completion_report='Fertig – 完了', worked_hours=Decimal('7.50'), due_date=date(1999, 12, 31),
+        )
+        self.create_tasks(1, status='completed', completion_report='', worked_hours=Decimal('0.05'))
+
+    def assert_same_bytes(self, fields=None):
+        tasks = Task.objects.select_related('assigned_to', 'created_by').order_by('id')
+        expected = TaskSerializer(tasks, many=True).data
+        rows = TaskRowSerializer(TaskRowSerializer.queryset(Task.objects.order_by('id'), fields), fields).data
+        if fields is not None:
+            expected = [{name: task[name] for name in fields} for task in expected]
+        self.assertEqual(FastJSONRenderer().render(rows), JSONRenderer().render(expected))
+
+    def test_same_bytes(self):
+        for zone in ('UTC', 'Asia/Kolkata'):
+            with self.subTest(zone=zone), timezone.override(zone):
+                self.assert_same_bytes()
+                # Unset reports and hours stay None in a narrowed listing
+                self.assert_same_bytes(['title', 'due_date', 'completion_report', 'worked_hours', 'updated_at'])
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class BulkTasksTests(TaskFixtureMixin, TestCase):
+    """Bulk writes are all or nothing and keep to the tasks the caller may change"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+        cls.admin2 = User.objects.create_user('admin2', 'pw', role='admin')
+        cls.user2 = User.objects.create_user('user2', 'pw', assigned_admin=cls.admin2)
+
+    def setUp(self):
+        self.clear_caches()
+
+    def new_task(self, assigned_to, **fields):
+        return {
+            'title': 'Bulk task', 'description': 'Description', 'due_date': '2030-01-01',
+            'assigned_to': assigned_to.pk, **fields,
+        }
+
+    def test_create(self):
+        client = self.api_client(self.admin)
+        response = client.post('/api/tasks/bulk/', [self.new_task(self.user), self.new_task(self.other)], format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([task['assigned_to_name'] for task in response.json()], ['user', 'other'])
+        self.assertEqual(Task.objects.filter(created_by=self.admin).count(), 2)
+
+    def test_one_invalid_item_rejects_the_batch(self):
+        client = self.api_client(self.admin)
+        items = [
+            self.new_task(self.user),
+            # Not one of this admin's users
+            self.new_task(self.user2),
+            self.new_task(self.other, due_date='soon'),
+        ]
+        response = client.post('/api/tasks/bulk/', items, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([error['index'] for error in response.json()['errors']], [1, 2])
+        self.assertFalse(Task.objects.exists())
+
+        first, second = self.create_tasks(2)
+        client = self.api_client(self.user)
+        response = client.patch('/api/tasks/bulk/', [
+            {'id': first.pk, 'status': 'in_progress'},
+            {'id': second.pk, 'status': 'completed'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'][0]['index'], 1)
+        self.assertEqual(set(Task.objects.values_list('status', flat=True)), {'pending'})
+
+    def test_update(self):
+        first, second = self.create_tasks(2)
+        client = self.api_client(self.user)
+        response = client.patch('/api/tasks/bulk/', [
+            {'id': first.pk, 'status': 'in_progress'},
+            {'id': second.pk, 'status': 'completed', 'completion_report': 'Done', 'worked_hours': '1.5'},
+        ], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([task['status'] for task in response.json()], ['in_progress', 'completed'])
+        self.assertEqual(get_task_counts(self.user, 'assigned')['completed'], 1)
+
+    def test_update_keeps_to_the_callers_tasks(self):
+        own, = self.create_tasks(1)
+        others, = self.create_tasks(1, assigned_to=self.other)
+        client = self.api_client(self.user)
+        response = client.patch('/api/tasks/bulk/', [
+            {'id': own.pk, 'status': 'in_progress'},
+            {'id': others.pk, 'status': 'in_progress'},
+        ], format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()['errors'], [{'index': 1, 'errors': {'id': ['Task not found']}}])
+        self.assertEqual(set(Task.objects.values_list('status', flat=True)), {'pending'})
+
+    def test_ids_must_be_integers(self):
+        task, = self.create_tasks(1)
+        client = self.api_client(self.user)
+        for task_id in (str(task.pk), True, task.pk + 0.5):
+            with self.subTest(task_id=task_id):
+                response = client.patch('/api/tasks/bulk/', [{'id': task_id, 'status': 'in_progress'}], format='json')
+                self.assertEqual(response.status_code, 400)
+                self.assertEqual(response.json()['errors'][0]['errors'], {'id': ['A valid integer is required.']})
+        task.refresh_from_db()
+        self.assertEqual(task.status, 'pending')
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class TaskChangesTests(TaskFixtureMixin, TestCase):
+    """Delta sync returns each change once, after the watermark, with tombstones for tasks that left"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+
+    def setUp(self):
+        self.clear_caches()
+        self.an_hour_ago = timezone.now() - timedelta(hours=1)
+
+    def backdate(self, tasks, when):
+        """Settle ``tasks`` and the tombstones written so far at ``when``"""
+        Task.objects.filter(id__in=[task.pk for task in tasks]).update(updated_at=when)
+        TaskTombstone.objects.filter(deleted_at__gt=when).update(deleted_at=when)
+
+    def changes(self, watermark=None, user=None, **kwargs):
+        changed, deleted, watermark, has_more = task_changes(user or self.user, watermark, **kwargs)
+        return [row['id'] for row in changed], deleted, watermark, has_more
+
+    def test_first_sync_returns_every_task_and_no_tombstones(self):
+        tasks = self.create_tasks(3)
+        tasks.pop().delete()
+        self.create_tasks(1, assigned_to=self.other)
+        self.backdate(tasks, self.an_hour_ago)
+        changed, deleted, _, has_more = self.changes()
+        self.assertEqual(changed, [task.pk for task in tasks])
+        self.assertEqual((deleted, has_more), ([], False))
+
+    def test_only_changes_after_the_watermark(self):
+        first, second = self.create_tasks(2)
+        self.backdate([first, second], self.an_hour_ago)
+        _, _, watermark, _ = self.changes()
+        self.assertEqual(self.changes(watermark)[:2], ([], []))
+
+        second.status = 'in_progress'
+        second.save()
+        # Not settled yet: a transaction that stamped it could still be open
+        self.assertEqual(self.changes(watermark)[0], [])
+        self.backdate([second], timezone.now() - timedelta(minutes=10))
+        changed, _, watermark, _ = self.changes(watermark)
+        self.assertEqual(changed, [second.pk])
+        self.assertEqual(self.changes(watermark)[0], [])
+
+    def test_pages_through_equal_updated_at(self):
+        tasks = self.create_tasks(5)
+        self.backdate(tasks, self.an_hour_ago)
+        pages, watermark, has_more = [], None, True
+        while has_more:
+            changed, _, watermark, has_more = self.changes(watermark, limit=2)
+            pages.append(changed)
+        ids = [task.pk for task in tasks]
+        self.assertEqual(pages, [ids[:2], ids[2:4], ids[4:]])
+        # A task settled at the watermark's time with a higher id is not skipped
+        late, = self.create_tasks(1)
+        self.backdate([late], self.an_hour_ago)
+        self.assertEqual(self.changes(watermark)[0], [late.pk])
+
+    def test_tombstones_for_deleted_and_reassigned_tasks(self):
+        deleted, reassigned, returned, kept = self.create_tasks(4)
+        self.backdate([deleted, reassigned, returned, kept], self.an_hour_ago)
+        _, _, watermark, _ = self.changes()
+        _, _, other_watermark, _ = self.changes(user=self.other)
+
+        deleted_id = deleted.pk
+        deleted.delete()
+        for task in (reassigned, returned):
+            task.assigned_to = self.other
+            task.save()
+        returned.assigned_to = self.user
+        returned.save()
+        self.backdate([reassigned, returned], timezone.now() - timedelta(minutes=10))
+
+        changed, gone, watermark, _ = self.changes(watermark)
+        # The task that came back is sent as changed, not as deleted
+        self.assertEqual(changed, [returned.pk])
+        self.assertEqual(gone, [deleted_id, reassigned.pk])
+        self.assertEqual(self.changes(watermark)[:2], ([], []))
+        changed, gone, _, _ = self.changes(other_watermark, user=self.other)
+        self.assertEqual((changed, gone), ([reassigned.pk], [returned.pk]))
+
+    def test_invalid_and_expired_watermarks(self):
+        client = self.api_client(self.user)
+        self.assertEqual(client.get('/api/tasks/changes/', {'since': 'nonsense'}).status_code, 400)
+        expired = encode_watermark(None, 0, 0, timezone.now() - timedelta(days=31))
+        self.assertEqual(client.get('/api/tasks/changes/', {'since': expired}).status_code, 410)
+        response = client.get('/api/tasks/changes/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.get('/api/tasks/changes/', {'since': response.json()['watermark']}).status_code, 200)
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS)
+class TaskEventTests(TaskFixtureMixin, TestCase):
+    """Committed task changes reach the event streams of their assignee and admin"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+
+    def setUp(self):
+        self.clear_caches()
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.broker = get_event_broker()
+
+    def open_stream(self, user):
+        async def subscribe():
+            return self.broker.subscribe(user.pk)
+        subscription = self.loop.run_until_complete(subscribe())
+        stream = event_stream(self.broker, subscription, lifetime=1)
+        self.addCleanup(self.loop.run_until_complete, stream.aclose())
+        self.assertIn(': connected', self.next_message(stream))
+        return stream
+
+    def next_message(self, stream):
+        return self.loop.run_until_complete(anext(stream))
+
+    def test_subscribers_receive_their_task_events(self):
+        user_stream, admin_stream = self.open_stream(self.user), self.open_stream(self.admin)
+        other_stream = self.open_stream(self.other)
+        with self.captureOnCommitCallbacks(execute=True):
+            task, = self.create_tasks(1)
+        with self.captureOnCommitCallbacks(execute=True):
+            task.status = 'in_progress'
+            task.save()
+
+        for stream in (user_stream, admin_stream):
+            created = self.next_message(stream)
+            self.assertTrue(created.startswith('event: task.created\n'))
+            event = json.loads(created.split('data: ', 1)[1])
+            self.assertEqual(
+                (event['task']['id'], event['task']['title'], event['task']['assigned_to']),
+                (task.pk, 'Task 0', self.user.pk),
+            )
+            changed = json.loads(self.next_message(stream).split('data: ', 1)[1])
+            self.assertEqual((changed['type'], changed['task']['status']), ('task.status_changed', 'in_progress'))
+        # Other users' streams stay idle until they close
+        self.assertEqual(self.next_message(other_stream), ': keep-alive\n\n')
+
+    def test_uncommitted_changes_are_not_sent(self):
+        stream = self.open_stream(self.user)
+        with self.captureOnCommitCallbacks(execute=False):
+            self.create_tasks(1)
+        self.assertEqual(self.next_message(stream), ': keep-alive\n\n')
+
+
+@override_settings(PASSWORD_HASHERS=FAST_HASHERS, TASK_JOBS_RUN_IN_PROCESS=False)
+class UserDeletionTests(TaskFixtureMixin, TestCase):
+    """A deleted user is disabled at once and their tasks are removed by a background job"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.create_users()
+        cls.admin2 = User.objects.create_user('admin2', 'pw', role='admin')
+        cls.user2 = User.objects.create_user('user2', 'pw', assigned_admin=cls.admin2)
+
+    def setUp(self):
+        self.clear_caches()
+        self.create_tasks(3)
+        self.create_tasks(2, assigned_to=self.other)
+        old = self.create_tasks(2, status='completed', completion_report='Done')
+        Task.objects.filter(id__in=[task.pk for task in old]).update(updated_at=timezone.now() - timedelta(days=365))
+        archive_tasks()
+        self.kept = self.create_tasks(2, assigned_to=self.user2, created_by=self.admin2)
+
+    def assert_admin_deleted(self, job):
+        self.assertEqual((job.status, job.done, job.total), ('done', 7, 7))
+        self.assertFalse(User.objects.filter(pk=self.admin.pk).exists())
+        self.assertEqual(list(Task.objects.order_by('id')), self.kept)
+        self.assertFalse(ArchivedTask.objects.exists())
+        # Their users' lists lost every task: delta sync gets a tombstone for each
+        self.assertEqual(TaskTombstone.objects.filter(user=self.user).count(), 5)
+        self.assertEqual(TaskTombstone.objects.filter(user=self.other).count(), 2)
+        self.assertEqual(get_task_counts(self.user, 'assigned')['total'], 0)
+        self.assertEqual(compute_stats()['total_tasks'], 2)
+        call_command('rebuild_task_counters', '--verify', stdout=StringIO())
+        self.assertFalse(user_deletions().exists())
+
+    def test_deletion(self):
+        self.client.force_login(self.superadmin)
+        response = self.client.post(f'/admin-panel/users/{self.admin.pk}/delete/')
+        self.assertEqual(response.status_code, 302)
+        self.admin.refresh_from_db()
+        self.assertFalse(self.admin.is_active)
+        job, = user_deletions()
+        self.assertEqual((job.status, job.payload), ('pending', {'user_id': self.admin.pk, 'username': 'admin'}))
+        # Asking again queues nothing new
+        self.assertEqual(start_user_deletion(self.admin), job)
+
+        self.assert_admin_deleted(run_next_job())
+        self.assertIsNone(run_next_job())
+
+    def test_retry_after_failure(self):
+        job = start_user_deletion(self.admin)
+
+        def fail_on_archive(model, *args, **kwargs):
+            if model is ArchivedTask:
+                raise RuntimeError('archive unavailable')
+            return delete_task_rows(model, *args, **kwargs)
+
+        with mock.patch('tasks.deletion.delete_task_rows', fail_on_archive):
+            for attempt in range(1, JOB_MAX_ATTEMPTS + 1):
+                BackgroundJob.objects.filter(pk=job.pk).update(run_after=None)
+                job = run_next_job()
+                self.assertEqual(job.attempts, attempt)
+                self.assertIn('archive unavailable', job.error)
+        # The live tasks went in the first attempt and stay deleted
+        self.assertEqual((job.status, job.done, job.total), ('failed', 5, 7))
+        self.assertEqual(Task.objects.filter(created_by=self.admin).count(), 0)
+        self.assertEqual(ArchivedTask.objects.count(), 2)
+        self.assertTrue(User.objects.filter(pk=self.admin.pk).exists())
+        call_command('rebuild_task_counters', '--verify', stdout=StringIO())
+
+        # Deleting again retries the failed job where it stopped
+        self.assertEqual(start_user_deletion(self.admin), job)
+        self.assert_admin_deleted(run_next_job())
+
+
+class SQLiteBackendTests(SimpleTestCase):
+    """Statements that find the database locked outside a transaction are run again"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.name = os.path.join(directory.name, 'db.sqlite3')
+        # Another process's connection, holding the write lock while the tests write
+        self.blocker = sqlite3.connect(self.name, isolation_level=None)
+        self.addCleanup(self.blocker.close)
+        self.blocker.execute('CREATE TABLE item (id integer PRIMARY KEY)')
+
+    def database(self, **options):
+        # busy_timeout 0, so every wait happens in the retry loop
+        database = DatabaseWrapper({
+            **connections['default'].settings_dict,
+            'NAME': self.name,
+            'OPTIONS': {'pragmas': {'busy_timeout': 0}, **options},
+        }, alias='locked')
+        self.addCleanup(database.close)
+        # Connect before the lock is taken, which switching to WAL needs
+        database.ensure_connection()
+        self.blocker.execute('BEGIN IMMEDIATE')
+        return database
+
+    def insert(self, database):
+        with database.cursor() as cursor:
+            cursor.execute('INSERT INTO item (id) VALUES (1)')
+
+    def test_write_waits_for_the_lock(self):
+        database = self.database()
+        with mock.patch('tasks.backends.sqlite3.base.time.sleep') as sleep:
+            sleep.side_effect = lambda delay: self.blocker.execute('COMMIT')
+            self.insert(database)
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(self.blocker.execute('SELECT id FROM item').fetchall(), [(1,)])
+
+    def test_gives_up_after_write_retries(self):
+        database = self.database(write_retries=2)
+        with mock.patch('tasks.backends.sqlite3.base.time.sleep') as sleep:
+            with self.assertRaisesMessage(OperationalError, 'database is locked'):
+                self.insert(database)
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_no_retry_inside_a_transaction(self):
+        database = self.database()
+        with database.cursor() as cursor:
+            cursor.execute('BEGIN DEFERRED')
+            cursor.execute('SELECT count(*) FROM item')
+        with mock.patch('tasks.backends.sqlite3.base.time.sleep') as sleep:
+            with self.assertRaisesMessage(OperationalError, 'database is locked'):
+                self.insert(database)
+        sleep.assert_not_called()
@@ -25,4 +25,5 @@ urlpatterns = [
     
     # Task reports (Admin and SuperAdmin)
     path('reports/', web_views.TaskReportsView.as_view(), name='task_reports'),
+    path('reports/export/<str:export_format>/', web_views.ExportTaskReportsView.as_view(), name='export_task_reports'),
 ]
\ No newline at end of file
@@ -5,11 +5,18 @@ from django.views.generic import View, ListView, CreateView, UpdateView, DeleteV
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Q
+from django.http import Http404, HttpResponseBadRequest
 from django.urls import reverse_lazy
 from datetime import date
 from .models import User, Task
 from .forms import UserCreationForm, UserEditForm, TaskForm, TaskEditForm
+from .counters import get_task_counts
+from .archive import with_archive
+from .deletion import start_user_deletion, user_deletions
+from .exports import EXPORT_FORMATS, export_queryset, streaming_export
+from .search import get_search_backend
+from .sharding import for_user, task_databases, task_shard
+from .stats import get_dashboard_stats
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import user_passes_test
 
@@ -43,19 +50,40 @@ class SuperAdminRequiredMixin(LoginRequiredMixin, UserPassesTestMixin):
 
 
 class TaskPermissionMixin(LoginRequiredMixin):
-    """Mixin for task permissions"""
+    """
+    Mixin for task permissions
+    
+    Views routed with a task id get the permitted task as ``self.task``,
+    loaded together with its assignee and creator in a single query.
+    """
+    task = None
     
     def dispatch(self, request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return self.handle_no_permission()
+        
         if not (request.user.is_admin() or request.user.is_superadmin()):
             messages.error(request, 'Access denied')
             return redirect('admin_dashboard')
         
         if 'task_id' in kwargs or 'pk' in kwargs:
             task_id = kwargs.get('task_id') or kwargs.get('pk')
-            task = get_object_or_404(Task, id=task_id)
             
-            # Check if admin can access this task
-            if request.user.is_admin() and task.created_by != request.user:
+            # Admins can only access tasks they created
+            self.task = (
+                Task.objects.using(task_shard(request.user, task_id))
+                .visible_to(request.user)
+                .select_related('assigned_to', 'created_by')
+                .filter(id=task_id)
+                .first()
+            )
+            if self.task is None:
+                # Access is only denied to tasks that exist, in any shard
+                if request.user.is_superadmin() or not any(
+                    Task.objects.using(alias).filter(id=task_id).exists()
+                    for alias in task_databases()
+                ):
+                    raise Http404('No Task matches the given query.')
                 messages.error(request, 'Access denied')
                 return redirect('manage_tasks')
         
@@ -100,19 +128,9 @@ class DashboardView(AdminRequiredMixin, View):
     """Admin panel dashboard"""
     
     def get(self, request):
-        context = {
-            'user_count': User.objects.filter(role='user').count(),
-            'admin_count': User.objects.filter(role='admin').count(),
-            'total_tasks': Task.objects.all().count(),
-            'completed_tasks': Task.objects.filter(status='completed').count(),
-            'today': date.today(),
-        }
-        
-        if request.user.is_admin():
-            # Admin can only see their own statistics
-            context['user_count'] = User.objects.filter(assigned_admin=request.user).count()
-            context['total_tasks'] = Task.objects.filter(created_by=request.user).count()
-            context['completed_tasks'] = Task.objects.filter(created_by=request.user, status='completed').count()
+        # Admins only see statistics for their own users and tasks
+        context = dict(get_dashboard_stats(request.user))
+        context['today'] = date.today()
         
         return render(request, 'admin/dashboard.html', context)
 
@@ -125,30 +143,25 @@ class ManageUsersView(SuperAdminRequiredMixin, View):
     """View all users, admins, and superadmins"""
     
     def get(self, request):
-        users = User.objects.filter(role='user')
-        admins = User.objects.filter(role='admin')
-        superadmins = User.objects.filter(role='superadmin')
+        # Users being deleted are listed with the progress of their deletion
+        deletions = list(user_deletions())
+        deleting = [job.payload['user_id'] for job in deletions]
+        users = User.objects.filter(role='user').exclude(pk__in=deleting)
+        admins = User.objects.filter(role='admin').exclude(pk__in=deleting)
+        superadmins = User.objects.filter(role='superadmin').exclude(pk__in=deleting)
         
         # Search functionality
         search = request.GET.get('search')
         if search:
-            users = users.filter(
-                Q(username__icontains=search) | 
-                Q(first_name__icontains=search) |
-                Q(last_name__icontains=search) |
-                Q(email__icontains=search)
-            )
-            admins = admins.filter(
-                Q(username__icontains=search) | 
-                Q(first_name__icontains=search) |
-                Q(last_name__icontains=search) |
-                Q(email__icontains=search)
-            )
+            search_backend = get_search_backend()
+            users = search_backend.search_users(users, search)
+            admins = search_backend.search_users(admins, search)
         
         context = {
             'users': users,
             'admins': admins,
             'superadmins': superadmins,
+            'deletions': deletions,
             'search': search,
         }
         return render(request, 'admin/manage_users.html', context)
@@ -188,24 +201,30 @@ class CreateUserView(SuperAdminRequiredMixin, View):
 class ViewUserView(SuperAdminRequiredMixin, DetailView):
     """View user details"""
     model = User
+    queryset = User.objects.select_related('assigned_admin')
     template_name = 'admin/view_user.html'
     context_object_name = 'user_obj'
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        user_obj = self.get_object()
+        user_obj = self.object
         
         # Get user's tasks if they are a regular user
         if user_obj.role == 'user':
-            context['tasks'] = Task.objects.filter(assigned_to=user_obj)
+            context['task_counts'] = get_task_counts(user_obj, 'assigned')
+            context['tasks'] = for_user(Task.objects.assigned_list(user_obj), user_obj)[:10]
         else:
             context['tasks'] = None
             
         # Get tasks created by admin/superadmin
         if user_obj.role in ['admin', 'superadmin']:
-            context['created_tasks'] = Task.objects.filter(created_by=user_obj)
+            context['task_counts'] = get_task_counts(user_obj, 'created')
+            context['created_tasks'] = for_user(Task.objects.created_list(user_obj), user_obj)[:10]
         else:
             context['created_tasks'] = None
+
+        if user_obj.role == 'admin':
+            context['assigned_user_count'] = get_dashboard_stats(user_obj)['user_count']
             
         return context
 
@@ -266,9 +285,9 @@ class DeleteUserView(SuperAdminRequiredMixin, View):
             messages.error(request, 'Cannot delete yourself')
             return redirect('manage_users')
         
-        username = user_obj.username
-        user_obj.delete()
-        messages.success(request, f'User {username} deleted successfully')
+        # Their tasks are deleted in the background; the user can't log in from now on
+        start_user_deletion(user_obj)
+        messages.success(request, f'User {user_obj.username} disabled and queued for deletion')
         return redirect('manage_users')
 
 
@@ -297,25 +316,19 @@ class ManageTasksView(TaskPermissionMixin, View):
         form = TaskForm(user=request.user)
         
         # Filter tasks based on role
-        if request.user.is_superadmin():
-            tasks = Task.objects.all()
-        else:
-            tasks = Task.objects.filter(created_by=request.user)
+        tasks = Task.objects.visible_to(request.user).for_task_list()
         
         # Search & filter
         search = request.GET.get('search')
         if search:
-            tasks = tasks.filter(
-                Q(title__icontains=search) |
-                Q(assigned_to__username__icontains=search)
-            )
+            tasks = get_search_backend().search_tasks(tasks, search)
         
         status_filter = request.GET.get('status')
         if status_filter:
             tasks = tasks.filter(status=status_filter)
         
         # Pagination
-        paginator = Paginator(tasks, 10)
+        paginator = Paginator(for_user(tasks, request.user), 10)
         page_number = request.GET.get('page')
         page_obj = paginator.get_page(page_number)
         
@@ -342,13 +355,10 @@ class ManageTasksView(TaskPermissionMixin, View):
         
         # If form is invalid, re-render the page with errors
         # Filter tasks based on role
-        if request.user.is_superadmin():
-            tasks = Task.objects.all()
-        else:
-            tasks = Task.objects.filter(created_by=request.user)
+        tasks = Task.objects.visible_to(request.user).for_task_list()
         
         # Pagination
-        paginator = Paginator(tasks, 10)
+        paginator = Paginator(for_user(tasks, request.user), 10)
         page_number = request.GET.get('page')
         page_obj = paginator.get_page(page_number)
         
@@ -402,6 +412,9 @@ class ViewTaskView(TaskPermissionMixin, DetailView):
     template_name = 'admin/view_task.html'
     context_object_name = 'task'
     
+    def get_object(self, queryset=None):
+        return self.task
+    
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['today'] = date.today()
@@ -420,7 +433,7 @@ class EditTaskView(TaskPermissionMixin, View):
     """Edit existing task"""
 
     def get(self, request, pk):
-        task = get_object_or_404(Task, pk=pk)
+        task = self.task
         form = TaskEditForm(instance=task, user=request.user)
 
         context = {
@@ -432,7 +445,7 @@ class EditTaskView(TaskPermissionMixin, View):
         return render(request, 'admin/task_form.html', context)
 
     def post(self, request, pk):
-        task = get_object_or_404(Task, pk=pk)
+        task = self.task
         form = TaskEditForm(request.POST, instance=task, user=request.user)
 
         if form.is_valid():
@@ -461,14 +474,14 @@ class DeleteTaskView(TaskPermissionMixin, View):
     """Delete a task (confirmation + delete)"""
 
     def get(self, request, pk):
-        task = get_object_or_404(Task, pk=pk)
+        task = self.task
         context = {
             'task': task
         }
         return render(request, 'admin/delete_task.html', context)
 
     def post(self, request, pk):
-        task = get_object_or_404(Task, pk=pk)
+        task = self.task
         task_title = task.title
         task.delete()
 
@@ -487,22 +500,18 @@ class TaskReportsView(AdminRequiredMixin, View):
     
     def get(self, request):
         # Filter completed tasks based on user role
-        if request.user.is_superadmin():
-            tasks = Task.objects.filter(status='completed')
-        else:
-            # Admin can only see reports for tasks they created
-            tasks = Task.objects.filter(created_by=request.user, status='completed')
-        
-        # Search functionality
+        # Admin can only see reports for tasks they created
         search = request.GET.get('search')
-        if search:
-            tasks = tasks.filter(
-                Q(title__icontains=search) | 
-                Q(assigned_to__username__icontains=search)
-            )
         
-        # Pagination
-        paginator = Paginator(tasks, 10)
+        def reports(tasks):
+            tasks = tasks.visible_to(request.user).for_report_list()
+            # Search functionality
+            if search:
+                tasks = get_search_backend().search_tasks(tasks, search)
+            return tasks
+        
+        # Pagination, over live and archived tasks
+        paginator = Paginator(with_archive(reports, request.user), 10)
         page_number = request.GET.get('page')
         page_obj = paginator.get_page(page_number)
         
@@ -510,4 +519,19 @@ class TaskReportsView(AdminRequiredMixin, View):
             'page_obj': page_obj,
             'search': search,
         }
-        return render(request, 'admin/task_reports.html', context)
\ No newline at end of file
+        return render(request, 'admin/task_reports.html', context)
+
+
+class ExportTaskReportsView(AdminRequiredMixin, View):
+    """Download task reports as CSV or NDJSON"""
+    
+    def get(self, request, export_format):
+        if export_format not in EXPORT_FORMATS:
+            raise Http404('Unknown export format')
+        
+        try:
+            rows = export_queryset(request.user, request.GET)
+        except ValueError as e:
+            return HttpResponseBadRequest(str(e))
+        
+        return streaming_export(rows, export_format)